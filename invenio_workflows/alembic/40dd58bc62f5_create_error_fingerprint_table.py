@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Create workflows_error_fingerprint table."""
+
+from __future__ import absolute_import, print_function
+
+from alembic import op
+from datetime import datetime
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '40dd58bc62f5'
+down_revision = '707092694e18'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'workflows_error_fingerprint',
+        sa.Column('fingerprint', sa.String(40), primary_key=True),
+        sa.Column('exc_type', sa.String(255), nullable=False),
+        sa.Column('message', sa.Text, default='', nullable=False),
+        sa.Column('traceback', sa.Text, default='', nullable=False),
+        sa.Column('count', sa.Integer, default=0, nullable=False, index=True),
+        sa.Column(
+            'created',
+            sa.DateTime,
+            default=datetime.now,
+            nullable=False
+        ),
+        sa.Column(
+            'modified',
+            sa.DateTime,
+            default=datetime.now,
+            onupdate=datetime.now,
+            nullable=False
+        ),
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('workflows_error_fingerprint')
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Add the compressed payload columns."""
+
+from __future__ import absolute_import, print_function
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '453291a5937b'
+down_revision = '54b19f877754'
+branch_labels = ()
+depends_on = None
+
+PAYLOADS = (
+    ('workflows_object', 'data'),
+    ('workflows_object', 'extra_data'),
+    ('workflows_task_result', 'result'),
+)
+
+
+def upgrade():
+    """Upgrade database."""
+    for table, column in PAYLOADS:
+        op.add_column(table, sa.Column(
+            '{0}_compressed'.format(column), sa.LargeBinary, nullable=True
+        ))
+        op.alter_column(table, column, nullable=True)
+
+
+def downgrade():
+    """Downgrade database.
+
+    The payloads stored compressed must be rewritten uncompressed first, e.g.
+    with ``workflows recompress`` and ``WORKFLOWS_COMPRESSION`` unset.
+    """
+    for table, column in PAYLOADS:
+        op.alter_column(table, column, nullable=False)
+        op.drop_column(table, '{0}_compressed'.format(column))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Create workflows_event table."""
+
+from __future__ import absolute_import, print_function
+
+from alembic import op
+from datetime import datetime
+import sqlalchemy as sa
+from sqlalchemy_utils.types import UUIDType
+
+# revision identifiers, used by Alembic.
+revision = '5f7d3891bf01'
+down_revision = '27d01e7db2dd'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'workflows_event',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('id_object', sa.Integer, nullable=False),
+        sa.Column(
+            'id_workflow',
+            UUIDType,
+            nullable=True
+        ),
+        sa.Column('from_status', sa.Integer, nullable=True),
+        sa.Column('to_status', sa.Integer, nullable=False),
+        sa.Column('task', sa.String(255), nullable=True),
+        sa.Column(
+            'created',
+            sa.DateTime,
+            default=datetime.now,
+            nullable=False
+        ),
+    )
+    op.create_index(
+        'ix_workflows_event_to_status_created',
+        'workflows_event',
+        ['to_status', 'created'],
+    )
+    op.create_index(
+        'ix_workflows_event_id_object_id',
+        'workflows_event',
+        ['id_object', 'id'],
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(
+        'ix_workflows_event_id_object_id',
+        table_name='workflows_event'
+    )
+    op.drop_index(
+        'ix_workflows_event_to_status_created',
+        table_name='workflows_event'
+    )
+    op.drop_table('workflows_event')
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add composite indexes on workflows_object."""
+
+from __future__ import absolute_import, print_function
+
+from alembic import op
+import sqlalchemy as sa
+from invenio_workflows.models import ObjectStatus
+
+# revision identifiers, used by Alembic.
+revision = '707092694e18'
+down_revision = 'a26f133d42a9'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_index(
+        'ix_workflows_object_id_workflow_id_parent_status',
+        'workflows_object',
+        ['id_workflow', 'id_parent', 'status'],
+    )
+    op.create_index(
+        'ix_workflows_object_status_modified',
+        'workflows_object',
+        ['status', 'modified'],
+        postgresql_where=sa.text('status <> {0}'.format(
+            ObjectStatus.COMPLETED.value
+        )),
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(
+        'ix_workflows_object_status_modified',
+        table_name='workflows_object',
+    )
+    op.drop_index(
+        'ix_workflows_object_id_workflow_id_parent_status',
+        table_name='workflows_object',
+    )
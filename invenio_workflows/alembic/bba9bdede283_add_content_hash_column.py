@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add content_hash column to workflows_object."""
+
+from __future__ import absolute_import, print_function
+
+from alembic import op
+import sqlalchemy as sa
+
+from invenio_workflows.models import SerializedJSONType
+from invenio_workflows.utils import get_content_hash
+
+# revision identifiers, used by Alembic.
+revision = 'bba9bdede283'
+down_revision = '5f7d3891bf01'
+branch_labels = ()
+depends_on = None
+
+BATCH_SIZE = 1000
+
+workflows_object = sa.table(
+    'workflows_object',
+    sa.column('id', sa.Integer),
+    sa.column('data', SerializedJSONType()),
+    sa.column('extra_data', SerializedJSONType()),
+    sa.column('content_hash', sa.String(40)),
+)
+
+
+def upgrade():
+    """Upgrade database."""
+    op.add_column('workflows_object', sa.Column(
+        'content_hash', sa.String(40), nullable=True
+    ))
+    op.create_index(
+        'ix_workflows_object_content_hash',
+        'workflows_object',
+        ['content_hash'],
+    )
+
+    # Fill the digest of the existing objects, in batches.
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([
+                workflows_object.c.id,
+                workflows_object.c.data,
+                workflows_object.c.extra_data,
+            ]).where(
+                workflows_object.c.id > last_id
+            ).order_by(workflows_object.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        connection.execute(
+            workflows_object.update().where(
+                workflows_object.c.id == sa.bindparam('_id')
+            ).values(content_hash=sa.bindparam('_content_hash')),
+            [{'_id': row.id,
+              '_content_hash': get_content_hash(row.data, row.extra_data)}
+             for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(
+        'ix_workflows_object_content_hash',
+        table_name='workflows_object',
+    )
+    op.drop_column('workflows_object', 'content_hash')
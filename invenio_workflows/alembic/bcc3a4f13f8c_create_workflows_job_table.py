@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Create workflows_job table."""
+
+from __future__ import absolute_import, print_function
+
+from alembic import op
+from datetime import datetime
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'bcc3a4f13f8c'
+down_revision = '40dd58bc62f5'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'workflows_job',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column(
+            'id_object',
+            sa.Integer,
+            sa.ForeignKey('workflows_object.id', ondelete='CASCADE'),
+            nullable=False,
+            index=True
+        ),
+        sa.Column('action', sa.String(10), nullable=False),
+        sa.Column('workflow_name', sa.String(255), nullable=True),
+        sa.Column('restart_point', sa.String(20), nullable=True),
+        sa.Column(
+            'created',
+            sa.DateTime,
+            default=datetime.now,
+            nullable=False
+        ),
+        sa.Column('lease_owner', sa.String(255), nullable=True),
+        sa.Column('lease_expires', sa.DateTime, nullable=True, index=True),
+        sa.Column('attempts', sa.Integer, default=0, nullable=False),
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('workflows_job')
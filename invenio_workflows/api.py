@@ -32,16 +32,17 @@ from flask import current_app
 from invenio_db import db
 from six import callable
 
-from sqlalchemy.orm.attributes import flag_modified
-from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy import func, inspect, or_
+from sqlalchemy.orm import aliased, undefer_group
 from workflow.errors import WorkflowAPIError
 from workflow.utils import staticproperty
 
-from .errors import WorkflowsMissingObject, WorkflowsMissingModel
+from .errors import WorkflowsMissingModel
 from .proxies import workflows
 from .signals import workflow_object_after_save, workflow_object_before_save
-from .utils import get_func_info
-from .models import ObjectStatus, WorkflowObjectModel, Workflow
+from .utils import get_content_hash, get_func_info
+from .models import PAYLOAD_GROUP, ObjectStatus, WorkflowJob, \
+    WorkflowObjectModel, Workflow, delete_in_batches
 
 
 class WorkflowObject(object):
@@ -61,6 +62,11 @@ class WorkflowObject(object):
         """Get type for object status."""
         return list(WorkflowObjectModel.__table__.columns.keys())
 
+    @staticproperty
+    def storage():  # pylint: disable=no-method-argument
+        """Get the storage backend, see ``WORKFLOWS_STORAGE``."""
+        return current_app.extensions['invenio-workflows'].storage
+
     @staticproperty
     def dbmodel():  # pylint: disable=no-method-argument
         """Get type for dbmodel."""
@@ -80,8 +86,13 @@ class WorkflowObject(object):
         """Wrap attribute access.
 
         To allow accessing the columns from the model as python attributes.
+        Models removed from the session by the engine are merged back first
+        if they need to be reloaded.
         """
         if name in self.known_columns:
+            state = inspect(self.model, raiseerr=False)
+            if state is not None and state.detached and state.unloaded:
+                self.model = db.session.merge(self.model)
             return getattr(self.model, name)
         return object.__getattribute__(self, name)
 
@@ -96,11 +107,22 @@ class WorkflowObject(object):
         return object.__setattr__(self, name, value)
 
     def save(self, status=None, callback_pos=None, id_workflow=None):
-        """Save object to persistent storage."""
+        """Save object to persistent storage.
+
+        The row is updated only if it was not modified since it was loaded,
+        use :func:`~invenio_workflows.utils.retry_on_conflict` to run the
+        whole change again otherwise.
+
+        :raises WorkflowsVersionConflict: if the object was modified
+            concurrently.
+        """
         if self.model is None:
             raise WorkflowsMissingModel()
 
-        with db.session.begin_nested():
+        # Special handling of JSON fields to mark update
+        with self.storage.saving(self.model, json_columns=(
+            'callback_pos', '_data', '_extra_data'
+        )):
             workflow_object_before_save.send(self)
 
             self.model.modified = datetime.now()
@@ -108,25 +130,29 @@ class WorkflowObject(object):
                 self.model.status = status
 
             if id_workflow is not None:
-                workflow = Workflow.query.filter_by(uuid=id_workflow).one()
+                workflow = self.storage.get_workflow(id_workflow)
+                if workflow is None:
+                    raise LookupError(
+                        "No workflow with UUID {} was found".format(
+                            id_workflow
+                        )
+                    )
                 self.model.workflow = workflow
 
-            # Special handling of JSON fields to mark update
             if self.model.callback_pos is None:
                 self.model.callback_pos = list()
             elif callback_pos is not None:
                 self.model.callback_pos = callback_pos
-            flag_modified(self.model, 'callback_pos')
 
             if self.model.data is None:
                 self.model.data = dict()
-            flag_modified(self.model, 'data')
 
             if self.model.extra_data is None:
                 self.model.extra_data = dict()
-            flag_modified(self.model, 'extra_data')
 
-            db.session.merge(self.model)
+            self.model.content_hash = self._stored_content_hash(
+                self.model.data, self.model.extra_data
+            )
 
             if self.id is not None:
                 self.log.debug("Saved object: {id} at {callback_pos}".format(
@@ -138,25 +164,34 @@ class WorkflowObject(object):
     @classmethod
     def create(cls, data, **kwargs):
         """Create a new Workflow Object with given content."""
-        with db.session.begin_nested():
-            model = cls.dbmodel(**kwargs)
-            model.data = data
-            obj = cls(model)
-            db.session.add(obj.model)
-        return obj
+        kwargs.setdefault('content_hash', cls._stored_content_hash(
+            data, kwargs.get('extra_data')
+        ))
+        return cls(cls.storage.create_object(cls.dbmodel, data, **kwargs))
+
+    @staticmethod
+    def _stored_content_hash(data, extra_data=None):
+        """Return the ``content_hash`` to store, if duplicates are skipped.
+
+        The digest is only used by :meth:`find_in_flight`, so it is not
+        computed unless ``WORKFLOWS_SKIP_DUPLICATES`` lists a workflow.
+        """
+        if not current_app.config['WORKFLOWS_SKIP_DUPLICATES']:
+            return None
+        return get_content_hash(data, extra_data)
 
     @classmethod
-    def get(cls, id_):
-        """Return a workflow object from id."""
-        with db.session.no_autoflush:
-            query = cls.dbmodel.query.filter_by(id=id_)
-            try:
-                model = query.one()
-            except NoResultFound:
-                raise WorkflowsMissingObject("No object for for id {0}".format(
-                    id_
-                ))
-            return cls(model)
+    def get(cls, id_, with_payload=True):
+        """Return a workflow object from id.
+
+        :param with_payload: load the JSON columns ``data``, ``extra_data``
+            and ``callback_pos`` right away, otherwise they are loaded on
+            first access.
+        :type with_payload: bool
+        """
+        return cls(cls.storage.get_object(
+            cls.dbmodel, id_, with_payload=with_payload
+        ))
 
     @classmethod
     def query(cls, *criteria, **filters):
@@ -180,11 +215,75 @@ class WorkflowObject(object):
                 user_id=user_id
             )
 
+        The JSON columns ``data``, ``extra_data`` and ``callback_pos`` are
+        loaded along, unless ``with_payload=False`` is given, in which case
+        they are only loaded on first access.
+
+        .. codeblock:: python
+
+            WorkflowObject.query(id_workflow=uuid, with_payload=False)
+
         See also SQLAlchemy BaseQuery's filter and filter_by documentation.
         """
+        return [cls(obj) for obj in cls.storage.query_objects(
+            cls.dbmodel, *criteria, **filters
+        )]
+
+    @classmethod
+    def query_rows(cls, *criteria, **filters):
+        """Return read-only rows of the matching workflow objects.
+
+        Only the columns which are not deferred are fetched, i.e. everything
+        but the JSON columns, and no model instance is created, which makes
+        it suitable for listings of many objects.
+
+        .. codeblock:: python
+
+            for row in WorkflowObject.query_rows(status=ObjectStatus.ERROR):
+                print(row.id, row.id_workflow, row.modified)
+
+        Takes the same arguments as :meth:`query`.
+        """
+        columns = [
+            prop.class_attribute.label(prop.columns[0].name)
+            for prop in inspect(cls.dbmodel).column_attrs if not prop.deferred
+        ]
         query = cls.dbmodel.query.filter(
             *criteria).filter_by(**filters)
-        return [cls(obj) for obj in query.all()]
+        return query.with_entities(*columns).all()
+
+    @classmethod
+    def find_in_flight(cls, data, workflow_name, extra_data=None):
+        """Return an object of a workflow with the same content, if any.
+
+        Only objects which are neither completed nor in error are
+        considered, so that data can be sent again after a failure. This
+        includes the objects queued by the
+        :class:`~invenio_workflows.dispatchers.QueueDispatcher`. Objects saved
+        while ``WORKFLOWS_SKIP_DUPLICATES`` was empty are not found.
+
+        :param data: the data to look for.
+
+        :param workflow_name: name of the workflow of the object.
+        :type workflow_name: str
+
+        :param extra_data: the extra data to look for.
+        :type extra_data: dict
+
+        :return: the WorkflowObject with the lowest id, or None.
+        """
+        dbmodel = cls.dbmodel
+        queued = db.session.query(WorkflowJob.id).filter(
+            WorkflowJob.id_object == dbmodel.id,
+            WorkflowJob.workflow_name == workflow_name,
+        ).exists()
+        model = dbmodel.query.outerjoin(dbmodel.workflow).filter(
+            dbmodel.content_hash == get_content_hash(data, extra_data),
+            dbmodel.status.notin_([ObjectStatus.COMPLETED,
+                                   ObjectStatus.ERROR]),
+            or_(Workflow.name == workflow_name, queued),
+        ).order_by(dbmodel.id).first()
+        return cls(model) if model is not None else None
 
     def delete(self, force=False):
         """Delete a workflow object.
@@ -205,6 +304,134 @@ class WorkflowObject(object):
 
         return self
 
+    @classmethod
+    def purge(cls, older_than=None, statuses=None, workflow_names=None,
+              batch_size=1000):
+        """Delete workflow objects matching the given criteria in batches.
+
+        Objects are deleted with set-based ``DELETE`` statements without
+        being loaded, children being removed by the database through the
+        ``ON DELETE CASCADE`` foreign key. Each batch is committed separately.
+
+        :param older_than: only delete objects not modified since then.
+        :type older_than: datetime
+
+        :param statuses: only delete objects in one of these statuses.
+        :type statuses: list of ObjectStatus
+
+        :param workflow_names: only delete objects of workflows with one of
+            these names.
+        :type workflow_names: list of str
+
+        :param batch_size: maximum number of objects deleted at once.
+        :type batch_size: int
+
+        :return: number of deleted objects.
+        """
+        query = cls.dbmodel.query
+        if older_than is not None:
+            query = query.filter(cls.dbmodel.modified < older_than)
+        if statuses:
+            query = query.filter(cls.dbmodel.status.in_(statuses))
+        if workflow_names:
+            query = query.filter(cls.dbmodel.id_workflow.in_(
+                db.session.query(Workflow.uuid).filter(
+                    Workflow.name.in_(workflow_names)
+                )
+            ))
+        return delete_in_batches(query, cls.dbmodel.id, batch_size=batch_size)
+
+    def _descendant_ids(self):
+        """Return a recursive CTE selecting the ids of all descendants."""
+        model = self.dbmodel
+        tree = db.session.query(model.id).filter(
+            model.id_parent == self.id
+        ).cte(name='workflows_object_tree', recursive=True)
+        child = aliased(model)
+        return tree.union_all(
+            db.session.query(child.id).filter(child.id_parent == tree.c.id)
+        )
+
+    def get_descendants(self, with_payload=True):
+        """Return all the descendants of this object, in a single query.
+
+        The whole subtree below this object is fetched with a recursive
+        common table expression instead of walking ``child_objects``.
+
+        :param with_payload: load the JSON columns right away.
+        :type with_payload: bool
+
+        :return: list of WorkflowObject ordered by id.
+        """
+        if self.model is None:
+            raise WorkflowsMissingModel()
+
+        tree = self._descendant_ids()
+        query = self.dbmodel.query.filter(
+            self.dbmodel.id.in_(db.session.query(tree.c.id))
+        ).order_by(self.dbmodel.id)
+        if with_payload:
+            query = query.options(undefer_group(PAYLOAD_GROUP))
+        return [self.__class__(model) for model in query]
+
+    def create_children(self, data, **kwargs):
+        """Create child objects under this object at once.
+
+        The children are attached to the workflow of this object and
+        inserted with a single flush.
+
+        :param data: list with the ``data`` of each child.
+        :type data: list
+
+        :param kwargs: column values shared by all the children.
+
+        :return: list of the created WorkflowObject.
+        """
+        if self.model is None:
+            raise WorkflowsMissingModel()
+
+        kwargs.setdefault('id_workflow', self.id_workflow)
+        kwargs.setdefault('data_type', self.data_type)
+        with db.session.begin_nested():
+            if self.id is None:
+                db.session.flush()
+            children = []
+            for child_data in data:
+                model = self.dbmodel(
+                    id_parent=self.id,
+                    content_hash=self._stored_content_hash(
+                        child_data, kwargs.get('extra_data')
+                    ),
+                    **kwargs
+                )
+                model.data = child_data
+                children.append(self.__class__(model))
+            db.session.add_all([child.model for child in children])
+        return children
+
+    def get_children_statuses(self, recursive=False):
+        """Count the children of this object by status.
+
+        :param recursive: count all descendants instead of direct children.
+        :type recursive: bool
+
+        :return: dictionary mapping each ObjectStatus to a number of objects.
+        """
+        if self.model is None:
+            raise WorkflowsMissingModel()
+
+        model = self.dbmodel
+        query = db.session.query(model.status, func.count(model.id))
+        if recursive:
+            tree = self._descendant_ids()
+            query = query.filter(model.id.in_(db.session.query(tree.c.id)))
+        else:
+            query = query.filter(model.id_parent == self.id)
+        counts = dict(query.group_by(model.status).all())
+        return dict(
+            (status, counts.get(status, 0)) for status in self.known_statuses
+        )
+
     def __repr__(self):
         """Represent a WorkflowObject."""
         return "<WorkflowObject(model = %s)" % self.model
@@ -224,11 +451,14 @@ class WorkflowObject(object):
             return (task1 == task2)
 
         def _are_same_task_history(task_history1, task_history2):
+            if len(task_history1) != len(task_history2):
+                return False
+
             for task1, task2 in zip(task_history1, task_history2):
                 if not _are_same_task(task1, task2):
                     return False
 
-                return True
+            return True
 
         # python 2 and 3 to get the keys
         wflw2_keys = list(wflw2.extra_data)
@@ -240,12 +470,10 @@ class WorkflowObject(object):
 
             value2 = wflw2.extra_data[key]
             if key == '_task_history':
-                return _are_same_task_history(
-                    self.extra_data['_task_history'],
-                    wflw2.extra_data['_task_history'],
-                )
+                if not _are_same_task_history(value1, value2):
+                    return False
 
-            if value1 != value2:
+            elif value1 != value2:
                 return False
 
         if wflw2_keys:
@@ -333,14 +561,18 @@ class WorkflowObject(object):
         :param delayed: should the workflow run asynchronously?
         :type delayed: bool
 
-        :return: UUID of WorkflowEngine (or AsyncResult).
+        :return: UUID of WorkflowEngine (or an asynchronous result, see
+            ``WORKFLOWS_DISPATCHER``).
         """
         from .tasks import start
 
         if delayed:
             self.save()
+            # Read the id before committing, which would expire it.
+            object_id = self.id
             db.session.commit()
-            return start.delay(workflow_name, object_id=self.id, **kwargs)
+            return current_app.extensions['invenio-workflows'].dispatcher \
+                .start(workflow_name, object_id=object_id, **kwargs)
         else:
             return start(workflow_name, data=[self], **kwargs)
 
@@ -363,7 +595,8 @@ class WorkflowObject(object):
         :param delayed: should the workflow run asynchronously?
         :type delayed: bool
 
-        :return: UUID of WorkflowEngine (or AsyncResult).
+        :return: UUID of WorkflowEngine (or an asynchronous result, see
+            ``WORKFLOWS_DISPATCHER``).
         """
         from .tasks import resume
 
@@ -372,8 +605,10 @@ class WorkflowObject(object):
             raise WorkflowAPIError("No workflow associated with object: %r"
                                    % (repr(self),))
         if delayed:
+            object_id = self.id
             db.session.commit()
-            return resume.delay(self.id, start_point, **kwargs)
+            return current_app.extensions['invenio-workflows'].dispatcher \
+                .resume(object_id, start_point, **kwargs)
         else:
             return resume(self.id, start_point, **kwargs)
 
@@ -383,8 +618,59 @@ class WorkflowObject(object):
         if not name:
             return
 
-        current_task = workflows[name].workflow
-        for step in self.callback_pos:
+        return _get_task_info(name, self.callback_pos)
+
+    @classmethod
+    def get_current_tasks_info(cls, objects):
+        """Return the current task info of many objects at once.
+
+        The positions of the objects and the names of their workflows are
+        fetched with a single query, and the task info is cached by workflow
+        name and position, see ``WORKFLOWS_TASK_INFO_CACHE_SIZE``.
+
+        :param objects: WorkflowObject instances or ids.
+        :type objects: list
+
+        :return: dictionary mapping object ids to their task info, ``None``
+            for objects which are not in a workflow.
+        """
+        ids = [getattr(obj, 'id', obj) for obj in objects]
+        rows = db.session.query(
+            cls.dbmodel.id, cls.dbmodel.callback_pos, Workflow.name
+        ).outerjoin(
+            Workflow, Workflow.uuid == cls.dbmodel.id_workflow
+        ).filter(cls.dbmodel.id.in_(ids))
+
+        tasks_info = dict.fromkeys(ids)
+        for id_, callback_pos, name in rows:
+            if name:
+                tasks_info[id_] = _get_task_info(name, callback_pos)
+        return tasks_info
+
+
+_MISSING = object()
+
+
+def _get_task_info(workflow_name, callback_pos):
+    """Return the info of the task at a position of a workflow.
+
+    The static info of the task is cached, its ``time`` is the time of the
+    call.
+    """
+    cache = current_app.extensions['invenio-workflows'].task_info_cache
+    key = (workflow_name, tuple(callback_pos or ()))
+    task_info = cache.get(key, _MISSING)
+    if task_info is _MISSING:
+        task_info = None
+        current_task = workflows[workflow_name].workflow
+        for step in callback_pos or ():
             current_task = current_task[step]
             if callable(current_task):
-                return get_func_info(current_task)
+                task_info = get_func_info(current_task)
+                del task_info['time']
+                break
+        cache.set(key, task_info)
+    if task_info is None:
+        return None
+    return dict(task_info, parameters=list(task_info['parameters']),
+                time=str(datetime.now()))
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Command line interface for invenio-workflows."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask_cli import with_appcontext
+from invenio_db import db
+from sqlalchemy import func
+from sqlalchemy.orm import undefer_group
+from sqlalchemy.orm.attributes import flag_modified
+from workflow.engine_db import WorkflowStatus
+
+from .models import PAYLOAD_GROUP, ErrorFingerprint, ObjectStatus, Workflow
+
+
+def abort_if_false(ctx, param, value):
+    """Abort command if value is False."""
+    if not value:
+        ctx.abort()
+
+
+def _to_statuses(status_type, names):
+    """Convert status names to members of the given status enum."""
+    try:
+        return [status_type[name.upper()] for name in names]
+    except KeyError as e:
+        raise click.BadParameter('Unknown status {0}, choose from: {1}'.format(
+            e, ', '.join(status.name for status in status_type)
+        ))
+
+
+def _status_option(status_type, help):
+    """Build a repeatable ``--status`` option converted to ``status_type``."""
+    return click.option(
+        '--status', '-s', 'statuses', multiple=True, help=help,
+        callback=lambda ctx, param, value: _to_statuses(status_type, value),
+    )
+
+
+def _chunks(iterable, size):
+    """Split an iterable in lists of at most ``size`` items, lazily."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_ids(query, column, chunk_size):
+    """Yield chunks of ids matched by a query using keyset pagination.
+
+    Each chunk is fully fetched before being yielded, so it is safe to commit
+    while processing it.
+    """
+    last = None
+    while True:
+        chunk_query = query.with_entities(column)
+        if last is not None:
+            chunk_query = chunk_query.filter(column > last)
+        ids = [row[0] for row in
+               chunk_query.order_by(column).limit(chunk_size).all()]
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+class _Progress(object):
+    """Report the number of processed items and the throughput."""
+
+    def __init__(self, label):
+        """Initialize the counters."""
+        self.label = label
+        self.count = 0
+        self.errors = 0
+        self.started = time.time()
+
+    def update(self, count, error=None):
+        """Account for a processed chunk and print the progress."""
+        self.count += count
+        if error is not None:
+            self.errors += count
+            click.secho('Failed to process {0} {1}: {2!r}'.format(
+                count, self.label, error
+            ), fg='red', err=True)
+        elapsed = max(time.time() - self.started, 1e-6)
+        click.echo('{0} {1} processed ({2:.1f}/s)'.format(
+            self.count, self.label, self.count / elapsed
+        ), err=True)
+
+    def done(self):
+        """Print the summary."""
+        click.secho('Done: {0} {1}, {2} failed.'.format(
+            self.count, self.label, self.errors
+        ), fg='red' if self.errors else 'green')
+
+
+def _dispatcher():
+    """Return the backend running delayed workflows."""
+    return current_app.extensions['invenio-workflows'].dispatcher
+
+
+def _run_chunk(progress, action, *args, **kwargs):
+    """Run ``action`` for a chunk, reporting failures without aborting."""
+    count = kwargs.pop('count', 1)
+    try:
+        action(*args, **kwargs)
+    except Exception as e:  # pylint: disable=broad-except
+        db.session.rollback()
+        progress.update(count, error=e)
+    else:
+        progress.update(count)
+
+
+def _run_each(progress, action, items, *args):
+    """Run ``action`` for each item of a chunk, reporting once per chunk."""
+    done = 0
+    for item in items:
+        try:
+            action(item, *args)
+        except Exception as e:  # pylint: disable=broad-except
+            db.session.rollback()
+            progress.update(1, error=e)
+        else:
+            done += 1
+    progress.update(done)
+
+
+@click.group()
+def workflows():
+    """Workflows management commands."""
+
+
+@workflows.command()
+@click.argument('workflow_name')
+@click.argument('input_file', type=click.File('r'))
+@click.option('--chunk-size', type=int, default=100, show_default=True,
+              help='Number of objects run by each workflow engine.')
+@click.option('--delayed', is_flag=True,
+              help='Dispatch the chunks, through Celery by default.')
+@with_appcontext
+def start(workflow_name, input_file, chunk_size, delayed):
+    """Start a workflow over the records of a NDJSON file.
+
+    Each line of ``INPUT_FILE`` is the ``data`` of one workflow object.
+    Use ``-`` to read from the standard input.
+    """
+    from .worker_engine import run_worker
+
+    records = (json.loads(line) for line in input_file if line.strip())
+    progress = _Progress('objects')
+    for chunk in _chunks(records, chunk_size):
+        if delayed:
+            _run_chunk(progress, _dispatcher().start, workflow_name,
+                       data=chunk, count=len(chunk))
+        else:
+            _run_chunk(progress, run_worker, workflow_name, chunk,
+                       count=len(chunk))
+    progress.done()
+
+
+@workflows.command()
+@_status_option(WorkflowStatus, 'Only restart workflows in the given '
+                'status, e.g. ERROR. Can be repeated.')
+@click.option('--name', '-n', 'names', multiple=True,
+              help='Only restart workflows with the given name. '
+              'Can be repeated.')
+@click.option('--chunk-size', type=int, default=100, show_default=True,
+              help='Number of workflows fetched at once.')
+@click.option('--delayed', is_flag=True,
+              help='Dispatch the workflows, through Celery by default.')
+@with_appcontext
+def restart(statuses, names, chunk_size, delayed):
+    """Restart matching workflows from the beginning."""
+    from .worker_engine import restart_worker
+
+    query = Workflow.query
+    if statuses:
+        query = query.filter(Workflow.status.in_(statuses))
+    if names:
+        query = query.filter(Workflow.name.in_(names))
+
+    progress = _Progress('workflows')
+    for uuids in _iter_ids(query, Workflow.uuid, chunk_size):
+        if delayed:
+            _run_each(progress, _dispatcher().restart,
+                      [str(uuid) for uuid in uuids])
+        else:
+            _run_each(progress, restart_worker, uuids)
+    progress.done()
+
+
+@workflows.command(name='continue')
+@_status_option(ObjectStatus, 'Only continue objects in the given status, '
+                'e.g. ERROR. Can be repeated. Defaults to HALTED and '
+                'WAITING.')
+@click.option('--name', '-n', 'names', multiple=True,
+              help='Only continue objects of workflows with the given name. '
+              'Can be repeated.')
+@click.option('--restart-point', default='continue_next', show_default=True,
+              type=click.Choice(
+                  ['restart_prev', 'restart_task', 'continue_next']
+              ), help='Where to continue the workflow from.')
+@click.option('--chunk-size', type=int, default=100, show_default=True,
+              help='Number of objects fetched at once.')
+@click.option('--delayed', is_flag=True,
+              help='Dispatch the objects, through Celery by default.')
+@with_appcontext
+def continue_(statuses, names, restart_point, chunk_size, delayed):
+    """Continue matching workflow objects, the halted and waiting ones."""
+    from .proxies import workflow_object_class
+    from .worker_engine import continue_worker
+
+    model = workflow_object_class.dbmodel
+    statuses = statuses or [ObjectStatus.HALTED, ObjectStatus.WAITING]
+    query = model.query.filter(
+        model.id_workflow != None,  # noqa
+        model.status.in_(statuses),
+    )
+    if names:
+        query = query.filter(model.id_workflow.in_(
+            db.session.query(Workflow.uuid).filter(Workflow.name.in_(names))
+        ))
+
+    progress = _Progress('objects')
+    for ids in _iter_ids(query, model.id, chunk_size):
+        if delayed:
+            _run_chunk(progress, _dispatcher().resume_many, ids,
+                       restart_point, count=len(ids))
+        else:
+            _run_each(progress, continue_worker, ids, restart_point)
+    progress.done()
+
+
+@workflows.command()
+@click.option('--name', '-n', 'names', multiple=True,
+              help='Only count objects of workflows with the given name. '
+              'Can be repeated.')
+@with_appcontext
+def status(names):
+    """Show the number of workflow objects per status."""
+    from .proxies import workflow_object_class
+
+    model = workflow_object_class.dbmodel
+    query = db.session.query(model.status, func.count(model.id))
+    if names:
+        query = query.filter(model.id_workflow.in_(
+            db.session.query(Workflow.uuid).filter(Workflow.name.in_(names))
+        ))
+    counts = dict(query.group_by(model.status).all())
+    for object_status in ObjectStatus:
+        click.echo('{0:<10} {1:>10}'.format(
+            object_status.name, counts.get(object_status, 0)
+        ))
+    click.echo('{0:<10} {1:>10}'.format('TOTAL', sum(counts.values())))
+
+
+@workflows.command()
+@click.option('--limit', type=int, default=20, show_default=True,
+              help='Number of errors to show.')
+@click.option('--traceback', 'show_traceback', is_flag=True,
+              help='Show the traceback of each error.')
+@with_appcontext
+def errors(limit, show_traceback):
+    """Show the most frequent workflow errors."""
+    query = ErrorFingerprint.query.order_by(
+        ErrorFingerprint.count.desc()
+    ).limit(limit)
+    for error in query:
+        click.echo('{0} {1:>10} {2}'.format(
+            error.fingerprint, error.count, error.message
+        ))
+        if show_traceback:
+            click.echo(error.traceback)
+
+
+@workflows.command()
+@click.option('--objects', is_flag=True,
+              help='Purge workflow objects instead of whole workflows.')
+@click.option('--older-than', type=int, metavar='DAYS',
+              help='Only purge entries not modified for that many days.')
+@click.option('--status', '-s', 'statuses', multiple=True,
+              help='Only purge entries in the given status, e.g. COMPLETED. '
+              'Can be repeated.')
+@click.option('--name', '-n', 'names', multiple=True,
+              help='Only purge entries of workflows with the given name. '
+              'Can be repeated.')
+@click.option('--batch-size', type=int, default=1000, show_default=True,
+              help='Number of rows deleted per transaction.')
+@click.option('--yes-i-know', is_flag=True, callback=abort_if_false,
+              expose_value=False,
+              prompt='Do you know that you are going to purge workflows?')
+@with_appcontext
+def purge(objects, older_than, statuses, names, batch_size):
+    """Delete workflows or workflow objects in batches."""
+    from .proxies import workflow_object_class
+
+    if older_than is not None:
+        older_than = datetime.now() - timedelta(days=older_than)
+
+    if objects:
+        deleted = workflow_object_class.purge(
+            older_than=older_than,
+            statuses=_to_statuses(ObjectStatus, statuses),
+            workflow_names=names,
+            batch_size=batch_size,
+        )
+        click.secho('Deleted {0} workflow objects.'.format(deleted),
+                    fg='green')
+    else:
+        deleted = Workflow.purge(
+            older_than=older_than,
+            statuses=_to_statuses(WorkflowStatus, statuses),
+            names=names,
+            batch_size=batch_size,
+        )
+        click.secho('Deleted {0} workflows.'.format(deleted), fg='green')
+
+
+@workflows.command(name='resume-due')
+@click.option('--batch-size', type=int, default=100, show_default=True,
+              help='Number of due objects fetched at once.')
+@click.option('--limit', type=int,
+              help='Maximum number of objects resumed.')
+@click.option('--delayed', is_flag=True,
+              help='Dispatch the objects, through Celery by default.')
+@with_appcontext
+def resume_due(batch_size, limit, delayed):
+    """Resume the waiting objects whose wake-up time is reached."""
+    from .scheduler import resume_due_objects
+
+    resumed = resume_due_objects(
+        batch_size=batch_size, limit=limit, delayed=delayed
+    )
+    click.secho('Resumed {0} objects.'.format(resumed), fg='green')
+
+
+@workflows.command()
+@click.option('--timeout', type=int, metavar='SECONDS',
+              help='Time without heartbeat after which a running object is '
+              'stalled. Defaults to WORKFLOWS_STALLED_TIMEOUT.')
+@click.option('--batch-size', type=int, default=100, show_default=True,
+              help='Number of stalled objects fetched at once.')
+@click.option('--limit', type=int,
+              help='Maximum number of objects recovered.')
+@click.option('--delayed', is_flag=True,
+              help='Dispatch the objects, through Celery by default.')
+@with_appcontext
+def sweep(timeout, batch_size, limit, delayed):
+    """Continue the objects left running by dead workers."""
+    from .sweeper import recover_stalled_objects
+
+    recovered = recover_stalled_objects(
+        timeout=timeout, batch_size=batch_size, limit=limit, delayed=delayed
+    )
+    click.secho('Recovered {0} stalled objects.'.format(recovered),
+                fg='yellow' if recovered else 'green')
+
+
+@workflows.command()
+@click.option('--batch-size', type=int,
+              help='Number of jobs claimed at once.')
+@click.option('--lease', type=int, metavar='SECONDS',
+              help='Duration of the lease on the claimed jobs.')
+@click.option('--poll-interval', type=float, metavar='SECONDS',
+              help='Time to wait when the queue is empty.')
+@click.option('--once', is_flag=True,
+              help='Run a single batch of jobs and exit.')
+@with_appcontext
+def worker(batch_size, lease, poll_interval, once):
+    """Run the workflows queued in the database.
+
+    Jobs are queued when ``WORKFLOWS_DISPATCHER`` is the ``QueueDispatcher``.
+    Defaults come from the ``WORKFLOWS_QUEUE_*`` configuration.
+    """
+    from .queue_worker import QueueWorker
+
+    queue_worker = QueueWorker(batch_size=batch_size, lease=lease,
+                               poll_interval=poll_interval)
+    click.echo('Worker {0} started.'.format(queue_worker.worker_id), err=True)
+    if once:
+        click.secho('Ran {0} jobs.'.format(queue_worker.run_once()),
+                    fg='green')
+    else:
+        queue_worker.run()
+
+
+@workflows.command()
+@click.option('--chunk-size', type=int, default=100, show_default=True,
+              help='Number of objects rewritten per transaction.')
+@with_appcontext
+def recompress(chunk_size):
+    """Rewrite stored payloads with the current compression settings.
+
+    Existing objects are stored again so that their ``data`` and
+    ``extra_data`` are compressed, or decompressed, according to
+    ``WORKFLOWS_COMPRESSION``, and serialized with ``WORKFLOWS_SERIALIZER``.
+    """
+    from .proxies import workflow_object_class
+
+    model = workflow_object_class.dbmodel
+    progress = _Progress('objects')
+    for ids in _iter_ids(model.query, model.id, chunk_size):
+        query = model.query.filter(model.id.in_(ids)).options(
+            undefer_group(PAYLOAD_GROUP)
+        )
+        for obj in query:
+            flag_modified(obj, '_data')
+            flag_modified(obj, '_extra_data')
+            # Keep the modification date, which would be bumped otherwise.
+            flag_modified(obj, 'modified')
+        db.session.commit()
+        db.session.expunge_all()
+        progress.update(len(ids))
+    progress.done()
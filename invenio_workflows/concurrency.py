@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Limit the number of concurrent runs of a workflow.
+
+The limits are set per workflow name in ``WORKFLOWS_CONCURRENCY_LIMITS`` and
+enforced with semaphores stored in the database, so that they hold across
+Celery workers, queue workers and hosts.
+"""
+
+from __future__ import absolute_import, print_function
+
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from invenio_db import db
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
+
+from .errors import WorkflowsConcurrencyLimitReached
+from .models import WorkflowConcurrencySlot
+
+
+def get_concurrency_limit(workflow_name):
+    """Return the maximum number of concurrent runs of a workflow, or None."""
+    return current_app.config['WORKFLOWS_CONCURRENCY_LIMITS'].get(
+        workflow_name
+    )
+
+
+@contextmanager
+def _slot_connection():
+    """Return a connection to take or free the slots on.
+
+    It is a connection of its own, committed at once, so that the other
+    workers see the slots right away and the session of the caller is left
+    untouched. SQLite has a single writer, which would wait for the
+    transaction of the caller, so a savepoint of the session is used there.
+    """
+    if db.engine.name == 'sqlite':
+        with db.session.begin_nested():
+            yield db.session.connection()
+    else:
+        with db.engine.begin() as connection:
+            yield connection
+
+
+def acquire_slot(workflow_name, limit, owner, ttl):
+    """Take a free running slot of a workflow.
+
+    Slots held for more than ``ttl`` seconds are considered abandoned, e.g.
+    by a killed worker, and are freed first. The session of the caller is
+    not committed, see :func:`_slot_connection`.
+
+    :param workflow_name: name of the workflow.
+    :type workflow_name: str
+
+    :param limit: number of slots of the workflow.
+    :type limit: int
+
+    :param owner: identifier of the run taking the slot.
+    :type owner: str
+
+    :param ttl: seconds after which the slot is freed in any case.
+    :type ttl: int
+
+    :return: the number of the acquired slot, or None if all are taken.
+    """
+    table = WorkflowConcurrencySlot.__table__
+    now = datetime.now()
+    with _slot_connection() as connection:
+        connection.execute(table.delete().where(and_(
+            table.c.name == workflow_name, table.c.expires < now,
+        )))
+        taken = set(row[0] for row in connection.execute(
+            select([table.c.slot]).where(table.c.name == workflow_name)
+        ))
+    for slot in range(limit):
+        if slot in taken:
+            continue
+        try:
+            with _slot_connection() as connection:
+                connection.execute(table.insert().values(
+                    name=workflow_name,
+                    slot=slot,
+                    owner=owner,
+                    expires=now + timedelta(seconds=ttl),
+                ))
+        except IntegrityError:
+            # Taken concurrently, try the next one.
+            continue
+        return slot
+    return None
+
+
+def release_slot(workflow_name, slot, owner):
+    """Free a running slot taken with :func:`acquire_slot`.
+
+    The session of the caller is not committed, see :func:`_slot_connection`.
+    """
+    table = WorkflowConcurrencySlot.__table__
+    with _slot_connection() as connection:
+        connection.execute(table.delete().where(and_(
+            table.c.name == workflow_name,
+            table.c.slot == slot,
+            table.c.owner == owner,
+        )))
+
+
+@contextmanager
+def concurrency_slot(workflow_name, owner=None):
+    """Hold a running slot of a workflow, if its concurrency is limited.
+
+    .. code-block:: python
+
+        with concurrency_slot('my_workflow'):
+            run_worker('my_workflow', data)
+
+    :raises WorkflowsConcurrencyLimitReached: if all the slots are taken.
+    """
+    limit = get_concurrency_limit(workflow_name)
+    if not limit:
+        yield None
+        return
+
+    owner = owner or uuid.uuid4().hex
+    slot = acquire_slot(
+        workflow_name, limit, owner,
+        current_app.config['WORKFLOWS_CONCURRENCY_SLOT_TTL'],
+    )
+    if slot is None:
+        raise WorkflowsConcurrencyLimitReached(
+            "All {0} slots of workflow {1} are taken.".format(
+                limit, workflow_name
+            )
+        )
+    try:
+        yield slot
+    finally:
+        release_slot(workflow_name, slot, owner)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Configuration for invenio-workflows."""
+
+WORKFLOWS_OBJECT_CLASS = 'invenio_workflows.api.WorkflowObject'
+"""Class wrapping the workflow object models."""
+
+WORKFLOWS_COMPRESSION = None
+"""Codec used to compress large ``data`` and ``extra_data`` payloads.
+
+One of ``'zlib'`` or ``'zstd'`` (requires the ``zstandard`` package), or
+``None`` to store payloads uncompressed. Compressed payloads are stored in
+binary columns of their own, leaving the JSON columns NULL, and decompressed on
+first access. They are always read back, whatever the current setting.
+"""
+
+WORKFLOWS_COMPRESSION_THRESHOLD = 4096
+"""Size in bytes of the serialized payload above which it is compressed."""
+
+WORKFLOWS_SERIALIZER = 'json'
+"""Serializer of the ``data``, ``extra_data`` and ``callback_pos`` columns.
+
+One of ``'json'``, ``'orjson'`` (requires the ``orjson`` package), or the
+import path of a module or object with JSON ``dumps`` and ``loads``, e.g.
+``'rapidjson'``. It is resolved once per application. All of them store
+JSON text, so the setting can be changed from one deployment to the next,
+and ``workflows recompress`` rewrites the existing payloads.
+
+It is not used on PostgreSQL, where the database driver serializes the
+native JSON columns. Pass ``json_serializer`` and ``json_deserializer`` in
+``SQLALCHEMY_ENGINE_OPTIONS`` there instead.
+"""
+
+WORKFLOWS_TASK_INFO_CACHE_SIZE = 1024
+"""Number of task infos cached by workflow name and callback position."""
+
+WORKFLOWS_DISPATCHER = 'invenio_workflows.dispatchers.CeleryDispatcher'
+"""Backend running the workflows started or continued with ``delayed=True``.
+
+Use ``'invenio_workflows.dispatchers.LocalDispatcher'`` to run them in a
+thread pool of the current process instead of through Celery, or
+``'invenio_workflows.dispatchers.QueueDispatcher'`` to queue them in the
+database for ``workflows worker`` processes.
+"""
+
+WORKFLOWS_LOCAL_DISPATCHER_MAX_WORKERS = 4
+"""Number of threads used by the local dispatcher."""
+
+WORKFLOWS_QUEUE_BATCH_SIZE = 10
+"""Number of queued jobs claimed at once by a worker."""
+
+WORKFLOWS_QUEUE_LEASE = 300
+"""Seconds a claimed job is reserved to its worker before being reclaimable.
+
+The lease is renewed before running each job of the batch, so it must only
+exceed the duration of a single job.
+"""
+
+WORKFLOWS_QUEUE_POLL_INTERVAL = 5
+"""Seconds a worker waits before polling again an empty queue."""
+
+WORKFLOWS_QUEUE_MAX_ATTEMPTS = 3
+"""Number of claims after which a job is dropped, e.g. if it kills workers."""
+
+WORKFLOWS_CONCURRENCY_LIMITS = {}
+"""Maximum number of concurrent delayed starts per workflow name.
+
+For example ``{'article': 8}`` runs at most eight ``article`` workflows at
+once. Celery starts over the limit are retried after
+``WORKFLOWS_CONCURRENCY_RETRY_DELAY`` seconds, and queued starts stay in the
+queue for the same duration. Workflows without a limit are not restricted.
+"""
+
+WORKFLOWS_CONCURRENCY_SLOT_TTL = 3600
+"""Seconds after which a running slot is freed, e.g. if its worker died.
+
+It must exceed the duration of the longest run of a limited workflow.
+"""
+
+WORKFLOWS_CONCURRENCY_RETRY_DELAY = 30
+"""Seconds to wait before trying again a start over its concurrency limit."""
+
+WORKFLOWS_CONCURRENCY_MAX_RETRIES = 120
+"""Number of times a Celery start over its concurrency limit is retried."""
+
+WORKFLOWS_MAX_QUEUE_DEPTH = None
+"""Number of pending delayed starts above which new starts are held back.
+
+``None`` disables the check. The depth is measured by the dispatcher: the
+broker queue for Celery, the thread pool backlog for the local dispatcher and
+the unclaimed jobs for the database queue.
+"""
+
+WORKFLOWS_BACKPRESSURE_TIMEOUT = 0
+"""Seconds a delayed start waits for the queue to drain below its maximum.
+
+With ``0`` starts are rejected right away with
+:class:`~invenio_workflows.errors.WorkflowsQueueFull`, otherwise they are
+deferred and only rejected if the queue is still full after that time.
+"""
+
+WORKFLOWS_BACKPRESSURE_POLL_INTERVAL = 1
+"""Seconds between two measures of the queue depth of a deferred start."""
+
+WORKFLOWS_LEASE_TTL = 300
+"""Seconds a run holds the lease of its object without renewing it.
+
+The lease is renewed between callbacks, so it must exceed the duration of the
+longest task. The object is saved on each renewal.
+"""
+
+WORKFLOWS_LEASE_RETRY_DELAY = None
+"""Seconds after which a Celery task finding its object leased is retried.
+
+``None`` skips such tasks, which are most likely duplicates.
+"""
+
+WORKFLOWS_HEARTBEAT_INTERVAL = 60
+"""Seconds between two heartbeats of a running object.
+
+Heartbeats are recorded in a transaction of their own and only tell that the
+object is alive, its progress is saved once the object is done.
+"""
+
+WORKFLOWS_STALLED_TIMEOUT = 900
+"""Seconds without heartbeat after which a running object is stalled.
+
+It must exceed the duration of the longest task, since heartbeats are only
+recorded between tasks.
+"""
+
+WORKFLOWS_EVENT_LOG = True
+"""Record the status transitions of the objects, see :mod:`.events`."""
+
+WORKFLOWS_SKIP_DUPLICATES = ()
+"""Names of the workflows which are not started on duplicate data.
+
+Data identical to an object of the same workflow which is neither completed
+nor in error is skipped, see :meth:`.api.WorkflowObject.find_in_flight`.
+The digest of the content of the objects is only saved while it is set.
+"""
+
+WORKFLOWS_EXPUNGE_COMPLETED = False
+"""Remove completed objects from the database session during a run.
+
+The objects reload their columns when they are next accessed as attributes
+of the ``WorkflowObject``, but not through its ``model`` or relationships,
+such as ``workflow``. Meant for long batch runs whose objects are not used
+afterwards.
+"""
+
+WORKFLOWS_IDENTITY_MAP_LIMIT = None
+"""Models kept in the database session during a run, ``None`` for no limit.
+
+The object models of the run are removed from the session once it holds
+more, after an object completed. They were committed and are reloaded when
+next accessed. The other models of the session are kept.
+"""
+
+WORKFLOWS_STORAGE = 'invenio_workflows.storage:SQLStorage'
+"""Backend creating, loading and saving the workflows and objects.
+
+The other queries use the SQLAlchemy models directly, see :mod:`.storage`.
+"""
+
+WORKFLOWS_SQLITE_BUSY_TIMEOUT = 5000
+"""Milliseconds SQLite waits for locks with ``SQLiteWALStorage``."""
+
+WORKFLOWS_TASK_CACHE_SIZE = 10000
+"""Results of memoized tasks kept in each process, see :mod:`.memoize`."""
+
+WORKFLOWS_TASK_CACHE_DB = False
+"""Also store the results of memoized tasks in the database.
+
+The ``workflows_task_result`` table is shared by all the workers and is not
+expired, delete its rows to reclaim the space.
+"""
+
+WORKFLOWS_PARALLEL_MAX_WORKERS = 8
+"""Threads running the branches of :func:`.patterns.parallel` tasks."""
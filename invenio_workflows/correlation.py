@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Wake up waiting objects on external events.
+
+A task parks its object until an external event, identified by a key:
+
+.. code-block:: python
+
+    def wait_for_approval(obj, eng):
+        eng.wait('Waiting for approval',
+                 correlation_key='ticket:{0}'.format(obj.data['ticket']))
+
+    def check_approval(obj, eng):
+        obj.data['approved'] = obj.extra_data['_wake_payload']['approved']
+
+When the event happens, every object waiting for it continues with the next
+task:
+
+.. code-block:: python
+
+    wake('ticket:42', payload={'approved': True})
+
+The keys are stored in the ``workflows_correlation`` table, so no object
+payload is scanned to find the waiting objects.
+"""
+
+from __future__ import absolute_import, print_function
+
+from flask import current_app
+from invenio_db import db
+
+from .models import WorkflowCorrelation
+from .proxies import workflow_object_class
+
+
+def _claim(correlation_key, ids):
+    """Remove the keys of the objects, return the ids actually removed.
+
+    Backends without row locks, such as SQLite, ignore ``SKIP LOCKED``, so
+    a concurrent call may have removed some of them already.
+    """
+    claimed = []
+    for object_id in ids:
+        if WorkflowCorrelation.query.filter_by(
+            correlation_key=correlation_key, id_object=object_id
+        ).delete(synchronize_session=False):
+            claimed.append(object_id)
+    return claimed
+
+
+def wake(correlation_key, payload=None, restart_point='continue_next',
+         delayed=False):
+    """Resume all the objects waiting for an external event.
+
+    The objects are claimed by removing their key, so that each one is woken
+    once. The dispatch of the objects is done in one batch.
+
+    :param correlation_key: key of the event.
+    :type correlation_key: str
+
+    :param payload: data of the event, stored in the ``_wake_payload`` key
+        of the ``extra_data`` of the objects.
+
+    :param restart_point: where to continue the workflows from.
+    :type restart_point: str
+
+    :param delayed: dispatch the objects, see ``WORKFLOWS_DISPATCHER``,
+        instead of running them in the current process.
+    :type delayed: bool
+
+    :return: ids of the woken objects.
+    """
+    from .worker_engine import continue_worker
+
+    ids = [row[0] for row in db.session.query(
+        WorkflowCorrelation.id_object
+    ).filter(
+        WorkflowCorrelation.correlation_key == correlation_key
+    ).order_by(WorkflowCorrelation.id_object).with_for_update(
+        skip_locked=True
+    )]
+    if not ids:
+        db.session.commit()
+        return []
+
+    ids = _claim(correlation_key, ids)
+    if ids and payload is not None:
+        model = workflow_object_class.dbmodel
+        for obj in workflow_object_class.query(model.id.in_(ids)):
+            obj.extra_data['_wake_payload'] = payload
+            obj.save()
+    db.session.commit()
+
+    if delayed:
+        current_app.extensions['invenio-workflows'].dispatcher.resume_many(
+            ids, restart_point
+        )
+    else:
+        for object_id in ids:
+            try:
+                continue_worker(object_id, restart_point)
+            except Exception:  # pylint: disable=broad-except
+                # The error is saved in the object by the engine.
+                db.session.rollback()
+                current_app.logger.exception(
+                    "Failed to wake workflow object %s.", object_id
+                )
+    return ids
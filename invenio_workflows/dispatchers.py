@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Backends running workflows asynchronously.
+
+The backend used when ``delayed=True`` is given to
+:meth:`~invenio_workflows.api.WorkflowObject.start_workflow` or
+:meth:`~invenio_workflows.api.WorkflowObject.continue_workflow` is set with
+``WORKFLOWS_DISPATCHER``.
+
+Starts are held back while more than ``WORKFLOWS_MAX_QUEUE_DEPTH`` workflows
+wait to be run, see :meth:`CeleryDispatcher.throttle`.
+"""
+
+from __future__ import absolute_import, print_function
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from invenio_db import db
+
+from .errors import WorkflowsQueueFull
+
+
+class CeleryDispatcher(object):
+    """Dispatch workflows to Celery workers.
+
+    The returned handles are Celery ``AsyncResult``.
+    """
+
+    def __init__(self, app):
+        """Initialize the dispatcher."""
+        self.app = app
+
+    def queue_depth(self):
+        """Return the number of messages in the default Celery queue.
+
+        :return: the depth, or None if the broker cannot tell.
+        """
+        from celery import current_app as current_celery_app
+
+        conf = current_celery_app.conf
+        if conf.task_always_eager:
+            return 0
+        try:
+            with current_celery_app.connection_or_acquire() as conn:
+                return conn.default_channel.queue_declare(
+                    queue=conf.task_default_queue, passive=True
+                ).message_count
+        except Exception:  # pylint: disable=broad-except
+            return None
+
+    def throttle(self):
+        """Wait until the queue is below ``WORKFLOWS_MAX_QUEUE_DEPTH``.
+
+        :raises WorkflowsQueueFull: if the queue is still full after
+            ``WORKFLOWS_BACKPRESSURE_TIMEOUT`` seconds.
+        """
+        config = self.app.config
+        max_depth = config['WORKFLOWS_MAX_QUEUE_DEPTH']
+        if max_depth is None:
+            return
+        deadline = time.time() + config['WORKFLOWS_BACKPRESSURE_TIMEOUT']
+        while True:
+            depth = self.queue_depth()
+            if depth is None or depth < max_depth:
+                return
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise WorkflowsQueueFull(
+                    "{0} workflows are waiting to be run.".format(depth)
+                )
+            time.sleep(min(
+                remaining, config['WORKFLOWS_BACKPRESSURE_POLL_INTERVAL']
+            ))
+
+    def start(self, workflow_name, data=None, object_id=None, **kwargs):
+        """Enqueue :func:`invenio_workflows.tasks.start`."""
+        from .tasks import start
+        self.throttle()
+        return start.delay(
+            workflow_name, data=data, object_id=object_id, **kwargs
+        )
+
+    def resume(self, oid, restart_point="continue_next", **kwargs):
+        """Enqueue :func:`invenio_workflows.tasks.resume`."""
+        from .tasks import resume
+        return resume.delay(oid, restart_point, **kwargs)
+
+    def resume_many(self, oids, restart_point="continue_next", **kwargs):
+        """Enqueue :func:`invenio_workflows.tasks.resume` as one group."""
+        from celery import group
+        from .tasks import resume
+        return group(
+            resume.s(oid, restart_point, **kwargs) for oid in oids
+        ).apply_async()
+
+    def restart(self, uuid, **kwargs):
+        """Enqueue :func:`invenio_workflows.tasks.restart`."""
+        from .tasks import restart
+        return restart.delay(uuid, **kwargs)
+
+
+class LocalAsyncResult(object):
+    """Handle on a workflow run by the :class:`LocalDispatcher`.
+
+    It mimics the most common methods of Celery's ``AsyncResult``.
+    """
+
+    def __init__(self, future):
+        """Wrap a ``concurrent.futures.Future``."""
+        self.future = future
+
+    def get(self, timeout=None):
+        """Wait for the workflow and return its result, or raise its error."""
+        return self.future.result(timeout=timeout)
+
+    def ready(self):
+        """Return True if the workflow has finished running."""
+        return self.future.done()
+
+    def successful(self):
+        """Return True if the workflow has finished without errors."""
+        return self.future.done() and self.future.exception() is None
+
+    def failed(self):
+        """Return True if the workflow has finished with an error."""
+        return self.future.done() and self.future.exception() is not None
+
+
+class LocalDispatcher(CeleryDispatcher):
+    """Run workflows in a thread pool of the current process.
+
+    No broker is involved and the arguments are not serialized, which suits
+    single-node deployments and test suites. The number of threads is set
+    with ``WORKFLOWS_LOCAL_DISPATCHER_MAX_WORKERS``.
+
+    Starts over their concurrency limit are not retried, their result raises
+    :class:`~invenio_workflows.errors.WorkflowsConcurrencyLimitReached`.
+    """
+
+    def __init__(self, app):
+        """Initialize the dispatcher and its thread pool."""
+        super(LocalDispatcher, self).__init__(app)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config['WORKFLOWS_LOCAL_DISPATCHER_MAX_WORKERS']
+        )
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def queue_depth(self):
+        """Return the number of workflows waiting for a thread."""
+        return self._pending
+
+    def _submit(self, func, *args, **kwargs):
+        """Run ``func`` in a thread, within an application context."""
+        with self._pending_lock:
+            self._pending += 1
+
+        def run():
+            with self._pending_lock:
+                self._pending -= 1
+            with self.app.app_context():
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    db.session.remove()
+        return LocalAsyncResult(self.executor.submit(run))
+
+    def start(self, workflow_name, data=None, object_id=None, **kwargs):
+        """Run :func:`invenio_workflows.tasks.start` in a thread."""
+        from .tasks import start
+        self.throttle()
+        return self._submit(
+            start, workflow_name, data=data, object_id=object_id, **kwargs
+        )
+
+    def resume(self, oid, restart_point="continue_next", **kwargs):
+        """Run :func:`invenio_workflows.tasks.resume` in a thread."""
+        from .tasks import resume
+        return self._submit(resume, oid, restart_point, **kwargs)
+
+    def resume_many(self, oids, restart_point="continue_next", **kwargs):
+        """Run :func:`invenio_workflows.tasks.resume` for each object."""
+        return [self.resume(oid, restart_point, **kwargs) for oid in oids]
+
+    def restart(self, uuid, **kwargs):
+        """Run :func:`invenio_workflows.tasks.restart` in a thread."""
+        from .tasks import restart
+        return self._submit(restart, uuid, **kwargs)
+
+
+class QueueDispatcher(CeleryDispatcher):
+    """Queue workflows in the database, for :mod:`.queue_worker` workers.
+
+    One job is stored per workflow object and the jobs are committed right
+    away. No broker is needed, and the jobs are claimed by ``workflows
+    worker`` processes. The returned handles are the lists of queued
+    :class:`~invenio_workflows.models.WorkflowJob`.
+
+    Engine keyword arguments cannot be stored with the jobs and are refused.
+    """
+
+    @staticmethod
+    def _check_kwargs(kwargs):
+        """Refuse keyword arguments that would be lost in the queue."""
+        if kwargs:
+            raise TypeError('Unsupported arguments for queued workflows: '
+                            '{0}'.format(', '.join(sorted(kwargs))))
+
+    def queue_depth(self):
+        """Return the number of jobs not claimed by a worker."""
+        from .models import WorkflowJob
+        return WorkflowJob.query.filter(
+            WorkflowJob.lease_owner == None  # noqa
+        ).count()
+
+    def start(self, workflow_name, data=None, object_id=None, **kwargs):
+        """Queue the start of a workflow over ``data`` or ``object_id``."""
+        from .errors import WorkflowsMissingData
+        from .proxies import workflow_object_class
+        from .queue_worker import enqueue
+        from .worker_engine import is_duplicate
+
+        self._check_kwargs(kwargs)
+        if data is None and object_id is None:
+            raise WorkflowsMissingData("No data or object_id passed to task.")
+        self.throttle()
+
+        if object_id is not None:
+            jobs = [enqueue(object_id, 'start', workflow_name=workflow_name)]
+        else:
+            if not isinstance(data, (list, tuple)):
+                data = [data]
+            jobs = []
+            for item in data:
+                if not isinstance(
+                    item, workflow_object_class._get_current_object()
+                ):
+                    if is_duplicate(item, workflow_name):
+                        continue
+                    item = workflow_object_class.create(data=item)
+                item.save()
+                jobs.append(
+                    enqueue(item.id, 'start', workflow_name=workflow_name)
+                )
+        db.session.commit()
+        return jobs
+
+    def resume(self, oid, restart_point="continue_next", **kwargs):
+        """Queue the continuation of a workflow object."""
+        from .queue_worker import enqueue
+
+        self._check_kwargs(kwargs)
+        jobs = [enqueue(oid, 'resume', restart_point=restart_point)]
+        db.session.commit()
+        return jobs
+
+    def resume_many(self, oids, restart_point="continue_next", **kwargs):
+        """Queue the continuation of several objects in one transaction."""
+        from .queue_worker import enqueue
+
+        self._check_kwargs(kwargs)
+        jobs = [enqueue(oid, 'resume', restart_point=restart_point)
+                for oid in oids]
+        db.session.commit()
+        return jobs
+
+    def restart(self, uuid, **kwargs):
+        """Queue the restart of all top-level objects of a workflow."""
+        from .proxies import workflow_object_class
+        from .queue_worker import enqueue
+
+        self._check_kwargs(kwargs)
+        model = workflow_object_class.dbmodel
+        ids = [row[0] for row in db.session.query(model.id).filter(
+            model.id_workflow == uuid,
+            model.id_parent == None,  # noqa
+        ).order_by(model.id)]
+        jobs = [enqueue(oid, 'restart') for oid in ids]
+        db.session.commit()
+        return jobs
@@ -21,14 +21,22 @@
 
 from __future__ import absolute_import
 
+import time
 import traceback
 
-from datetime import datetime
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # Not available on Windows.
+    resource = None
+
+from datetime import datetime, timedelta
 from uuid import uuid1 as new_uuid
 
 from flask import current_app
 from invenio_db import db
-from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 from workflow.engine import ActionMapper, Break, Continue, ProcessingFactory, \
     TransitionActions
 from workflow.engine import GenericWorkflowEngine
@@ -38,8 +46,19 @@ from workflow.utils import staticproperty, classproperty
 
 from .proxies import workflow_object_class
 from .errors import WaitProcessing, WorkflowsMissingModel
-from .models import ObjectStatus, Workflow, WorkflowObjectModel
-from .utils import get_task_history
+from .events import record_transition
+from .models import ErrorFingerprint, ObjectStatus, Workflow, \
+    WorkflowCorrelation, WorkflowObjectModel
+from .leases import held_lease
+from .memoize import is_memoized, run_memoized
+from .utils import get_error_fingerprint, get_task_history
+
+
+def _max_rss():
+    """Return the peak resident memory of the process, or None."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
 
 
 class WorkflowEngine(GenericWorkflowEngine):
@@ -58,6 +77,8 @@ class WorkflowEngine(GenericWorkflowEngine):
             )
             model.save(WorkflowStatus.NEW)
         self.model = model
+        self.memory_stats = {}
+        self.last_heartbeat = None
         super(WorkflowEngine, self).__init__()
         self.set_workflow_by_name(self.model.name)
 
@@ -83,18 +104,20 @@ class WorkflowEngine(GenericWorkflowEngine):
         :param uuid: pass a uuid to an existing workflow.
         :type uuid: str
         """
-        model = Workflow.query.get(uuid)
+        model = cls.storage.get_workflow(uuid)
         if model is None:
             raise LookupError(
                 "No workflow with UUID {} was found".format(uuid)
             )
         instance = cls(model=model, **extra_data)
-        instance.objects = WorkflowObjectModel.query.filter(
-            WorkflowObjectModel.id_workflow == uuid,
-            WorkflowObjectModel.id_parent == None,  # noqa
-        ).all()
+        instance.objects = cls.storage.get_workflow_objects(uuid)
         return instance
 
+    @staticproperty
+    def storage():  # pylint: disable=no-method-argument
+        """Return the storage backend, see ``WORKFLOWS_STORAGE``."""
+        return current_app.extensions['invenio-workflows'].storage
+
     @property
     def db(self):
         """Return SQLAlchemy db."""
@@ -142,43 +165,145 @@ class WorkflowEngine(GenericWorkflowEngine):
 
     @property
     def database_objects(self):
-        """Return the objects associated with this workflow."""
+        """Return the objects associated with this workflow.
+
+        It is a query, see ``Workflow.get_objects`` for slices of it.
+        """
         return self.model.objects
 
     @property
     def final_objects(self):
-        """Return the objects associated with this workflow."""
-        return [obj for obj in self.database_objects
-                if obj.status in [obj.known_statuses.COMPLETED]]
+        """Return the completed objects of this workflow."""
+        return self.model.get_objects([ObjectStatus.COMPLETED])
 
     @property
     def halted_objects(self):
-        """Return the objects associated with this workflow."""
-        return [obj for obj in self.database_objects
-                if obj.status in [obj.known_statuses.HALTED]]
+        """Return the halted objects of this workflow."""
+        return self.model.get_objects([ObjectStatus.HALTED])
 
     @property
     def running_objects(self):
-        """Return the objects associated with this workflow."""
-        return [obj for obj in self.database_objects
-                if obj.status in [obj.known_statuses.RUNNING]]
+        """Return the running objects of this workflow."""
+        return self.model.get_objects([ObjectStatus.RUNNING])
 
     def save(self, status=None):
-        """Save object to persistent storage."""
+        """Save object to persistent storage.
+
+        :raises WorkflowsVersionConflict: if the workflow was modified
+            concurrently.
+        """
         if self.model is None:
             raise WorkflowsMissingModel()
 
-        with db.session.begin_nested():
+        with self.storage.saving(self.model, json_columns=('extra_data',)):
             self.model.modified = datetime.now()
             if status is not None:
                 self.model.status = status
 
             if self.model.extra_data is None:
                 self.model.extra_data = dict()
-            flag_modified(self.model, 'extra_data')
-            db.session.merge(self.model)
 
-    def wait(self, msg=""):
+    def heartbeat(self, obj):
+        """Record that an object is still being processed, when it is due.
+
+        At most every ``WORKFLOWS_HEARTBEAT_INTERVAL`` seconds, the
+        ``heartbeat`` of the object and its lease, if held, are updated in a
+        transaction of their own, earlier if the lease is due. The
+        transaction of the workflow is left untouched, so that a failed
+        object is rolled back as a whole. Nothing is recorded while that
+        transaction locks the object, or on SQLite, which has a single
+        writer.
+
+        :param obj: the workflow object being processed.
+        :type obj: WorkflowObject
+        """
+        now = datetime.now()
+        last = self.last_heartbeat
+        lease = held_lease(obj.id)
+        if last is not None and (now - last).total_seconds() < \
+                current_app.config['WORKFLOWS_HEARTBEAT_INTERVAL'] and \
+                not (lease and lease.due):
+            return
+        if db.engine.name == 'sqlite':
+            # The transaction of the workflow holds the only write lock.
+            return
+        table = obj.dbmodel.__table__
+        where = table.c.id == obj.id
+        values = {'heartbeat': now}
+        if lease:
+            where &= table.c.lease_owner == lease.owner
+            values['lease_expires'] = now + timedelta(seconds=lease.ttl)
+        try:
+            with db.engine.begin() as connection:
+                held = connection.execute(
+                    select([table.c.id]).where(where).with_for_update(
+                        nowait=True
+                    )
+                ).scalar()
+                if held is not None:
+                    connection.execute(table.update().where(where).values(
+                        **values
+                    ))
+        except OperationalError:
+            # The row is locked by the transaction of the workflow, which
+            # keeps the sweeper and other runs waiting until it ends.
+            return
+        if lease and held is None:
+            self.log.warning("Lost the lease of workflow object %s.", obj.id)
+            return
+        self.last_heartbeat = now
+        if lease:
+            lease.renewed = time.time()
+
+    def reset_memory_stats(self):
+        """Start measuring the memory used by a run, see :meth:`release`."""
+        self.memory_stats = {
+            'expunged_objects': 0,
+            'identity_map_size': len(db.session.identity_map),
+            'identity_map_peak': len(db.session.identity_map),
+            'max_rss_start': _max_rss(),
+            'max_rss': _max_rss(),
+        }
+
+    def release(self, obj):
+        """Remove committed models from the session after an object.
+
+        With ``WORKFLOWS_EXPUNGE_COMPLETED`` the completed object is
+        expunged, and once the session holds more than
+        ``WORKFLOWS_IDENTITY_MAP_LIMIT`` models all the object models of the
+        run are, the other models of the session being left untouched. The
+        released objects reload their columns when next accessed through
+        the :class:`~invenio_workflows.api.WorkflowObject`.
+
+        The peak size of the identity map and the peak resident memory of
+        the process, as given by ``getrusage`` (kilobytes on Linux), are
+        kept in ``memory_stats``.
+
+        :param obj: the workflow object just completed.
+        :type obj: WorkflowObject
+        """
+        config = current_app.config
+        session = db.session
+        stats = self.memory_stats
+        stats['identity_map_peak'] = max(
+            stats.get('identity_map_peak', 0), len(session.identity_map)
+        )
+        if config['WORKFLOWS_EXPUNGE_COMPLETED'] and obj.model in session:
+            session.expunge(obj.model)
+            stats['expunged_objects'] = stats.get('expunged_objects', 0) + 1
+        limit = config['WORKFLOWS_IDENTITY_MAP_LIMIT']
+        if limit is not None and len(session.identity_map) > limit:
+            models = set(id(o.model) for o in self.objects)
+            for instance in list(session.identity_map.values()):
+                if isinstance(instance, WorkflowObjectModel) and (
+                    id(instance) in models or
+                    inspect(instance).dict.get('_id_workflow') == self.uuid
+                ):
+                    session.expunge(instance)
+        stats['identity_map_size'] = len(session.identity_map)
+        stats['max_rss'] = _max_rss()
+
+    def wait(self, msg="", resume_at=None, delay=None, correlation_key=None):
         """Halt the workflow (stop also any parent `wfe`).
 
         Halts the currently running workflow by raising WaitProcessing.
@@ -186,9 +311,24 @@ class WorkflowEngine(GenericWorkflowEngine):
         :param msg: message explaining the reason for halting.
         :type msg: str
 
+        :param resume_at: time at which the current task is run again, see
+            :func:`~invenio_workflows.scheduler.resume_due_objects`.
+        :type resume_at: datetime
+
+        :param delay: seconds after which the current task is run again,
+            instead of ``resume_at``.
+        :type delay: int
+
+        :param correlation_key: key of the external event the object waits
+            for, see :func:`~invenio_workflows.correlation.wake`.
+        :type correlation_key: str
+
         :raises: WaitProcessing
         """
-        raise WaitProcessing(message=msg)
+        if delay is not None:
+            resume_at = datetime.now() + timedelta(seconds=delay)
+        raise WaitProcessing(message=msg, resume_at=resume_at,
+                             correlation_key=correlation_key)
 
     def continue_object(self, workflow_object, restart_point='restart_task',
                         task_offset=1, stop_on_halt=False):
@@ -214,6 +354,12 @@ class WorkflowEngine(GenericWorkflowEngine):
         self.restart(task=translate[restart_point], obj='first',
                      objects=[workflow_object], stop_on_halt=stop_on_halt)
 
+    def execute_callback(self, callback, obj):
+        """Execute a single callback, see ``InvenioActionMapper``."""
+        self.processing_factory.action_mapper.execute_callback(
+            self, callback, obj
+        )
+
     def init_logger(self):
         """Return the appropriate logger instance."""
         return current_app.logger
@@ -271,6 +417,19 @@ class InvenioActionMapper(ActionMapper):
         """Take action before every WF callback."""
         eng.log.info("Executing callback %s" % (repr(callback_func),))
 
+    @staticmethod
+    def execute_callback(eng, callback_func, obj):
+        """Run a WF callback.
+
+        The callbacks decorated with
+        :func:`~invenio_workflows.memoize.memoize_task` are skipped when
+        their result over the content of the object is cached.
+        """
+        if is_memoized(callback_func):
+            run_memoized(callback_func, obj, eng)
+        else:
+            callback_func(obj, eng)
+
     @staticmethod
     def after_each_callback(eng, callback_func, obj):
         """Take action after every WF callback."""
@@ -281,6 +440,7 @@ class InvenioActionMapper(ActionMapper):
             obj.extra_data["_task_history"] = [task_history]
         else:
             obj.extra_data["_task_history"].append(task_history)
+        eng.heartbeat(obj)
 
 
 class InvenioProcessingFactory(ProcessingFactory):
@@ -305,6 +465,21 @@ class InvenioProcessingFactory(ProcessingFactory):
         )
         if "_error_msg" in obj.extra_data:
             del obj.extra_data["_error_msg"]
+        if "_error_fingerprint" in obj.extra_data:
+            del obj.extra_data["_error_fingerprint"]
+        if "_correlation_key" in obj.extra_data:
+            del obj.extra_data["_correlation_key"]
+            WorkflowCorrelation.query.filter_by(id_object=obj.id).delete(
+                synchronize_session=False
+            )
+        # A running object stores the task it runs first, from which it is
+        # recovered if its worker dies.
+        eng.last_heartbeat = obj.model.heartbeat = datetime.now()
+        obj.model.resume_at = None
+        record_transition(obj, obj.known_statuses.RUNNING, eng)
+        obj.save(status=obj.known_statuses.RUNNING,
+                 callback_pos=list(eng.state.callback_pos),
+                 id_workflow=eng.uuid)
         db.session.commit()
 
     @staticmethod
@@ -313,17 +488,21 @@ class InvenioProcessingFactory(ProcessingFactory):
         # We save each object once it is fully run through
         super(InvenioProcessingFactory, InvenioProcessingFactory)\
             .after_object(eng, objects, obj)
+        obj.model.heartbeat = datetime.now()
+        record_transition(obj, obj.known_statuses.COMPLETED, eng)
         obj.save(
             status=obj.known_statuses.COMPLETED,
             id_workflow=eng.model.uuid
         )
         db.session.commit()
+        eng.release(obj)
 
     @staticmethod
     def before_processing(eng, objects):
         """Execute before processing the workflow."""
         super(InvenioProcessingFactory, InvenioProcessingFactory)\
             .before_processing(eng, objects)
+        eng.reset_memory_stats()
         eng.save(WorkflowStatus.RUNNING)
         db.session.commit()
 
@@ -337,6 +516,8 @@ class InvenioProcessingFactory(ProcessingFactory):
         else:
             eng.save(WorkflowStatus.HALTED)
         db.session.commit()
+        eng.log.debug("Workflow '%s' memory usage: %s", eng.name,
+                      eng.memory_stats)
 
 
 class InvenioTransitionAction(TransitionActions):
@@ -344,13 +525,17 @@ class InvenioTransitionAction(TransitionActions):
 
     @staticmethod
     def Exception(obj, eng, callbacks, exc_info):
-        """Handle general exceptions in workflow, saving states."""
+        """Handle general exceptions in workflow, saving states.
+
+        The traceback is logged in full only the first time an error is seen,
+        see :class:`~invenio_workflows.models.ErrorFingerprint`.
+        """
         exception_repr = ''.join(traceback.format_exception(*exc_info))
-        msg = "Error:\n%s" % (exception_repr)
-        eng.log.error(msg)
+        fingerprint = get_error_fingerprint(exc_info)
         if obj:
-            # Sets an error message as a tuple (title, details)
             obj.extra_data['_error_msg'] = exception_repr
+            obj.extra_data['_error_fingerprint'] = fingerprint
+            record_transition(obj, obj.known_statuses.ERROR, eng)
             obj.save(
                 status=obj.known_statuses.ERROR,
                 callback_pos=eng.state.callback_pos,
@@ -359,6 +544,18 @@ class InvenioTransitionAction(TransitionActions):
         eng.save(WorkflowStatus.ERROR)
         db.session.commit()
 
+        try:
+            fingerprint, first = ErrorFingerprint.record(exc_info)
+        except SQLAlchemyError:
+            eng.log.exception("Could not record error %s.", fingerprint)
+            first = True
+        if first:
+            eng.log.error("Error %s:\n%s", fingerprint, exception_repr)
+        else:
+            eng.log.error("Error %s: %s", fingerprint, ''.join(
+                traceback.format_exception_only(*exc_info[:2])
+            ).strip())
+
         # Call super which will reraise
         super(InvenioTransitionAction, InvenioTransitionAction).Exception(
             obj, eng, callbacks, exc_info
@@ -377,6 +574,14 @@ class InvenioTransitionAction(TransitionActions):
         """
         e = exc_info[1]
         obj.set_action(e.action, e.message)
+        obj.model.resume_at = getattr(e, 'resume_at', None)
+        correlation_key = getattr(e, 'correlation_key', None)
+        if correlation_key is not None:
+            obj.extra_data['_correlation_key'] = correlation_key
+            db.session.add(WorkflowCorrelation(
+                correlation_key=correlation_key, id_object=obj.id
+            ))
+        record_transition(obj, eng.object_status.WAITING, eng)
         obj.save(status=eng.object_status.WAITING,
                  callback_pos=eng.state.callback_pos,
                  id_workflow=eng.uuid)
@@ -396,6 +601,7 @@ class InvenioTransitionAction(TransitionActions):
         e = exc_info[1]
         if e.action:
             obj.set_action(e.action, e.message)
+            record_transition(obj, eng.object_status.HALTED, eng)
             obj.save(status=eng.object_status.HALTED,
                      callback_pos=eng.state.callback_pos,
                      id_workflow=eng.uuid)
@@ -419,6 +625,7 @@ class InvenioTransitionAction(TransitionActions):
     def StopProcessing(obj, eng, callbacks, exc_info):
         """Stop the engne and mark the workflow as completed."""
         e = exc_info[1]
+        record_transition(obj, eng.object_status.COMPLETED, eng)
         obj.save(status=eng.object_status.COMPLETED,
                  id_workflow=eng.uuid)
         eng.save(WorkflowStatus.COMPLETED)
@@ -40,17 +40,43 @@ class WorkflowsMissingObject(WorkflowsError):
     """Requested object not found."""
 
 
-@with_str(('message', ('action', 'payload')))
+class WorkflowsConcurrencyLimitReached(WorkflowsError):
+    """All the running slots of a workflow are taken."""
+
+
+class WorkflowsQueueFull(WorkflowsError):
+    """Too many workflows are waiting to be run."""
+
+
+class WorkflowsObjectLeased(WorkflowsError):
+    """The workflow object is being processed by another worker."""
+
+
+class WorkflowsVersionConflict(WorkflowsError):
+    """The saved row was modified concurrently since it was loaded."""
+
+
+@with_str(('message', ('action', 'payload', 'resume_at',
+                       'correlation_key')))
 class WaitProcessing(HaltProcessing, WorkflowsError):
-    """Custom WaitProcessing handling."""
+    """Custom WaitProcessing handling.
+
+    If ``resume_at`` is given, the object is resumed at that time by
+    :func:`~invenio_workflows.scheduler.resume_due_objects`. If
+    ``correlation_key`` is given, e.g. the id of an external ticket, the
+    object is resumed by :func:`~invenio_workflows.correlation.wake`.
+    """
 
-    def __init__(self, message="", action=None, payload=None):
+    def __init__(self, message="", action=None, payload=None,
+                 resume_at=None, correlation_key=None):
         """Add required parameters to WaitProcessing."""
         super(WaitProcessing, self).__init__(
             message=message,
             action=action,
             payload=payload
         )
+        self.resume_at = resume_at
+        self.correlation_key = correlation_key
 
 
 @with_str(('message', ('worker_name', 'payload')))
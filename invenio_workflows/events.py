@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Log of the status transitions of workflow objects.
+
+The processing factory and the transition actions of the engine record one
+:class:`~invenio_workflows.models.WorkflowEvent` per status change. They are
+kept in the session until it is committed, and then inserted with a single
+``executemany``, in the same transaction as the objects.
+
+The helpers below compute latencies from the log, e.g. the 90th percentile
+of the time spent waiting:
+
+.. code-block:: python
+
+    percentiles(time_in_status(ObjectStatus.WAITING))[90]
+"""
+
+from __future__ import absolute_import, print_function
+
+import math
+from datetime import datetime
+
+from flask import current_app
+from invenio_db import db
+from sqlalchemy import event, func
+
+from .models import WorkflowEvent
+
+_PENDING_KEY = 'workflows_pending_events'
+
+
+def _task_name(eng):
+    """Return the name of the current task, if the engine is in one."""
+    try:
+        return eng.current_taskname
+    except IndexError:
+        # The position is past the last task once the object completed.
+        return None
+
+
+def record_transition(obj, status, eng=None):
+    """Record the change of status of an object, written at commit.
+
+    Nothing is recorded if the status is unchanged, or if
+    ``WORKFLOWS_EVENT_LOG`` is disabled.
+
+    :param obj: the object about to be saved.
+    :type obj: WorkflowObject
+
+    :param status: the new status of the object.
+    :type status: ObjectStatus
+
+    :param eng: the engine processing the object, if any.
+    :type eng: WorkflowEngine
+    """
+    if not current_app.config['WORKFLOWS_EVENT_LOG']:
+        return
+    from_status = obj.model.status
+    if from_status == status:
+        return
+    db.session.info.setdefault(_PENDING_KEY, []).append(dict(
+        model=obj.model,
+        id_workflow=eng.uuid if eng is not None else obj.model.id_workflow,
+        from_status=from_status,
+        to_status=status,
+        task=_task_name(eng) if eng is not None else None,
+        created=datetime.now(),
+    ))
+
+
+@event.listens_for(db.session, 'before_commit')
+def _write_events(session):
+    """Insert the pending events in bulk."""
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    # Objects created in this transaction need their id.
+    session.flush()
+    rows = []
+    for values in pending:
+        values = dict(values)
+        values['id_object'] = values.pop('model').id
+        rows.append(values)
+    session.execute(WorkflowEvent.__table__.insert(), rows)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_events(session):
+    """Drop the events of a rolled back transaction."""
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _window(query, column, since, until):
+    """Restrict a query to the rows whose ``column`` is in a time window."""
+    if since is not None:
+        query = query.filter(column >= since)
+    if until is not None:
+        query = query.filter(column < until)
+    return query
+
+
+def throughput(status, since=None, until=None):
+    """Count the transitions into a status.
+
+    :param status: the status entered.
+    :type status: ObjectStatus
+
+    :param since: only count transitions from this time on.
+    :type since: datetime
+
+    :param until: only count transitions before this time.
+    :type until: datetime
+
+    :return: number of transitions.
+    """
+    query = WorkflowEvent.query.filter(WorkflowEvent.to_status == status)
+    return _window(query, WorkflowEvent.created, since, until).count()
+
+
+def time_in_status(status, since=None, until=None):
+    """Compute the time spent in a status by the objects leaving it.
+
+    :param status: the status left.
+    :type status: ObjectStatus
+
+    :param since: only consider objects leaving the status from this time on.
+    :type since: datetime
+
+    :param until: only consider objects leaving the status before this time.
+    :type until: datetime
+
+    :return: list of durations, in seconds.
+    """
+    entered = func.lag(WorkflowEvent.created, type_=db.DateTime).over(
+        partition_by=WorkflowEvent.id_object, order_by=WorkflowEvent.id
+    )
+    history = db.session.query(
+        WorkflowEvent.from_status.label('from_status'),
+        entered.label('entered'),
+        WorkflowEvent.created.label('left'),
+    ).subquery()
+    query = db.session.query(history.c.entered, history.c.left).filter(
+        history.c.from_status == status,
+        history.c.entered != None,  # noqa
+    )
+    query = _window(query, history.c.left, since, until)
+    return [(left - entered).total_seconds() for entered, left in query]
+
+
+def time_to_status(status, since=None, until=None):
+    """Compute the time objects took to first reach a status.
+
+    The time is counted from the first recorded transition of each object.
+
+    :param status: the status reached, e.g. ``ObjectStatus.COMPLETED``.
+    :type status: ObjectStatus
+
+    :param since: only consider objects reaching the status from this time
+        on.
+    :type since: datetime
+
+    :param until: only consider objects reaching the status before this time.
+    :type until: datetime
+
+    :return: list of durations, in seconds.
+    """
+    started = db.session.query(
+        WorkflowEvent.id_object.label('id_object'),
+        func.min(WorkflowEvent.created).label('started'),
+    ).group_by(WorkflowEvent.id_object).subquery()
+    reached = db.session.query(
+        WorkflowEvent.id_object.label('id_object'),
+        func.min(WorkflowEvent.created).label('reached'),
+    ).filter(
+        WorkflowEvent.to_status == status
+    ).group_by(WorkflowEvent.id_object).subquery()
+    query = db.session.query(started.c.started, reached.c.reached).join(
+        reached, reached.c.id_object == started.c.id_object
+    )
+    query = _window(query, reached.c.reached, since, until)
+    return [(end - start).total_seconds() for start, end in query]
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Compute nearest-rank percentiles.
+
+    :param values: the measures, e.g. from :func:`time_in_status`.
+    :type values: list
+
+    :param points: the percentiles to compute, between 0 and 100.
+    :type points: tuple
+
+    :return: dict mapping each point to its percentile, or to None if there
+        are no values.
+    """
+    values = sorted(values)
+    if not values:
+        return dict((point, None) for point in points)
+    count = len(values)
+    return dict(
+        (point, values[max(int(math.ceil(point / 100.0 * count)), 1) - 1])
+        for point in points
+    )
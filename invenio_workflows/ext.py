@@ -30,7 +30,8 @@ import pkg_resources
 
 from werkzeug.utils import cached_property
 
-from .utils import obj_or_import_string
+from . import config
+from .utils import LRUCache, obj_or_import_string
 
 
 class _WorkflowState(object):
@@ -40,6 +41,9 @@ class _WorkflowState(object):
         """Initialize state."""
         self.app = app
         self.workflows = {}
+        self.task_info_cache = LRUCache(
+            app.config.get('WORKFLOWS_TASK_INFO_CACHE_SIZE', 1024)
+        )
         if entry_point_group:
             self.load_entry_point_group(entry_point_group)
 
@@ -49,10 +53,51 @@ class _WorkflowState(object):
             self.app.config.get('WORKFLOWS_OBJECT_CLASS')
         )
 
+    @cached_property
+    def dispatcher(self):
+        return obj_or_import_string(
+            self.app.config.get('WORKFLOWS_DISPATCHER')
+        )(self.app)
+
+    @cached_property
+    def storage(self):
+        return obj_or_import_string(
+            self.app.config.get('WORKFLOWS_STORAGE')
+        )(self.app)
+
+    @cached_property
+    def serializer(self):
+        from .models import load_serializer
+
+        return load_serializer(
+            self.app.config.get('WORKFLOWS_SERIALIZER', 'json')
+        )
+
+    @cached_property
+    def memory_storage(self):
+        from .memory import MemoryStorage
+
+        return MemoryStorage(self.app)
+
+    @cached_property
+    def task_cache(self):
+        from .memoize import TaskResultCache
+
+        return TaskResultCache(self.app)
+
+    @cached_property
+    def parallel_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        return ThreadPoolExecutor(
+            max_workers=self.app.config['WORKFLOWS_PARALLEL_MAX_WORKERS']
+        )
+
     def register_workflow(self, name, workflow):
         """Register an workflow to be showed in the workflows list."""
         assert name not in self.workflows
         self.workflows[name] = workflow
+        self.task_info_cache.clear()
 
     def load_entry_point_group(self, entry_point_group):
         """Load workflows from an entry point group."""
@@ -72,16 +117,33 @@ class InvenioWorkflows(object):
                  entry_point_group='invenio_workflows.workflows',
                  **kwargs):
         """Flask application initialization."""
-        app.config.setdefault(
-            "WORKFLOWS_OBJECT_CLASS",
-            "invenio_workflows.api.WorkflowObject"
-        )
+        self.init_config(app)
+        self.check_storage(app)
         state = _WorkflowState(
             app, entry_point_group=entry_point_group, **kwargs
         )
         app.extensions['invenio-workflows'] = state
         return state
 
+    def init_config(self, app):
+        """Initialize configuration."""
+        for k in dir(config):
+            if k.startswith('WORKFLOWS_'):
+                app.config.setdefault(k, getattr(config, k))
+
+    def check_storage(self, app):
+        """Refuse storage backends which only work with in-memory models."""
+        from .memory import MemoryStorage
+
+        storage = obj_or_import_string(app.config.get('WORKFLOWS_STORAGE'))
+        if isinstance(storage, type) and issubclass(storage, MemoryStorage):
+            raise ValueError(
+                "WORKFLOWS_STORAGE cannot be {0}, which only stores the "
+                "models of invenio_workflows.memory.".format(
+                    app.config['WORKFLOWS_STORAGE']
+                )
+            )
+
     def __getattr__(self, name):
         """Proxy to state object."""
         return getattr(self._state, name, None)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Leases preventing the concurrent processing of a workflow object.
+
+A run takes the lease of its object for ``WORKFLOWS_LEASE_TTL`` seconds, and
+the engine renews it between callbacks, see
+:meth:`~invenio_workflows.engine.WorkflowEngine.heartbeat`. A second run of
+the same object, e.g. after a Celery redelivery, finds the lease taken and
+is skipped. The lease of a dead worker expires and can then be taken again.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from invenio_db import db
+from sqlalchemy import or_
+
+from .errors import WorkflowsObjectLeased
+from .proxies import workflow_object_class
+
+_held = threading.local()
+
+
+def _held_leases():
+    """Return the leases held by the current thread, by object id."""
+    if not hasattr(_held, 'leases'):
+        _held.leases = {}
+    return _held.leases
+
+
+class HeldLease(object):
+    """Lease of a workflow object held by the current thread."""
+
+    def __init__(self, object_id, owner, ttl):
+        """Initialize the lease, just acquired."""
+        self.object_id = object_id
+        self.owner = owner
+        self.ttl = ttl
+        self.renewed = time.time()
+
+    @property
+    def due(self):
+        """Return True once a third of the lease duration has elapsed."""
+        return time.time() - self.renewed >= self.ttl / 3.0
+
+
+def held_lease(object_id):
+    """Return the :class:`HeldLease` of an object, if held by this thread."""
+    return _held_leases().get(object_id)
+
+
+def new_lease_owner():
+    """Return a lease owner identifier unique to this process and call."""
+    return '{0}:{1}:{2}'.format(
+        socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+    )
+
+
+def acquire_lease(object_id, owner, ttl):
+    """Take the lease of a workflow object if it is free or expired.
+
+    :param object_id: id of the workflow object.
+    :type object_id: int
+
+    :param owner: identifier of the run taking the lease.
+    :type owner: str
+
+    :param ttl: duration of the lease in seconds.
+    :type ttl: int
+
+    :return: True if the lease was taken.
+    """
+    model = workflow_object_class.dbmodel
+    now = datetime.now()
+    acquired = model.query.filter(
+        model.id == object_id,
+        or_(
+            model.lease_owner == None,  # noqa
+            model.lease_owner == owner,
+            model.lease_expires < now,
+        ),
+    ).update({
+        model.lease_owner: owner,
+        model.lease_expires: now + timedelta(seconds=ttl),
+    }, synchronize_session=False)
+    db.session.commit()
+    return bool(acquired)
+
+
+def release_lease(object_id, owner):
+    """Free a lease held by ``owner``."""
+    model = workflow_object_class.dbmodel
+    model.query.filter_by(id=object_id, lease_owner=owner).update({
+        model.lease_owner: None,
+        model.lease_expires: None,
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+@contextmanager
+def object_lease(object_id, owner=None, ttl=None):
+    """Hold the lease of a workflow object while running it.
+
+    .. code-block:: python
+
+        with object_lease(oid):
+            continue_worker(oid)
+
+    The engine renews the lease between callbacks.
+
+    Nothing is leased if ``object_id`` is None.
+
+    :raises WorkflowsObjectLeased: if another run holds the lease.
+    """
+    if object_id is None:
+        yield None
+        return
+
+    owner = owner or new_lease_owner()
+    ttl = ttl or current_app.config['WORKFLOWS_LEASE_TTL']
+    if not acquire_lease(object_id, owner, ttl):
+        raise WorkflowsObjectLeased(
+            "Workflow object {0} is processed by another worker.".format(
+                object_id
+            )
+        )
+    leases = _held_leases()
+    leases[object_id] = HeldLease(object_id, owner, ttl)
+    try:
+        yield owner
+    except Exception:
+        # The transaction of a failed workflow can be unusable.
+        db.session.rollback()
+        raise
+    finally:
+        leases.pop(object_id, None)
+        release_lease(object_id, owner)
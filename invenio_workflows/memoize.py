@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Memoization of pure workflow tasks.
+
+Tasks depending only on the data and extra data of the object, such as
+normalizations and classifications, can be decorated with
+:func:`memoize_task`. Their effect on ``obj.data`` and ``obj.extra_data`` is
+cached by content hash, and the engine applies the cached effect instead of
+running them again on the same content, e.g. when objects are restarted:
+
+.. code-block:: python
+
+    @memoize_task(version=2)
+    def normalize_title(obj, eng):
+        obj.data['title'] = obj.data['title'].strip()
+
+Results are kept in a bounded in-process cache of
+``WORKFLOWS_TASK_CACHE_SIZE`` entries and, with ``WORKFLOWS_TASK_CACHE_DB``,
+in the ``workflows_task_result`` table shared by all the workers. The keys of
+``extra_data`` starting with an underscore hold the state of the engine and
+are neither part of the key nor of the cached effect. Bump the version of a
+task when its code changes, to stop using its older results.
+
+Tasks made by a factory share their module and name, and must be given a
+``key`` identifying their parameters:
+
+.. code-block:: python
+
+    def set_field(name, value):
+        @memoize_task(key='{0}={1}'.format(name, value))
+        def _set_field(obj, eng):
+            obj.data[name] = value
+        return _set_field
+
+Without a key, the values captured by the closure of the task are used.
+They must be plain JSON values, or functions, otherwise the task is not
+memoized. The effect of a memoized task must be JSON serializable too.
+"""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import json
+
+from flask import current_app
+from invenio_db import db
+from sqlalchemy.exc import IntegrityError
+
+from .models import WorkflowTaskResult
+from .utils import LRUCache, get_content_hash
+
+
+def _closure_key(func):
+    """Return a digest of the values captured by a function.
+
+    :return: '' without a closure, None if the values are not JSON
+        serializable.
+    """
+    cells = getattr(func, '__closure__', None)
+    if not cells:
+        return ''
+    values = []
+    for cell in cells:
+        value = cell.cell_contents
+        if callable(value):
+            value = '{0}.{1}'.format(
+                getattr(value, '__module__', ''),
+                getattr(value, '__name__', repr(value)),
+            )
+        values.append(value)
+    try:
+        serialized = json.dumps(values, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def memoize_task(func=None, version=None, key=None):
+    """Mark a task as a pure function of the content of the object.
+
+    Can be used with or without arguments.
+
+    :param version: version of the task, part of the cache key.
+
+    :param key: parameters of a task made by a factory, part of the cache
+        key instead of the values captured by its closure. Without it, a
+        task capturing values which are not JSON serializable is not
+        memoized.
+    :type key: str
+    """
+    def decorator(func):
+        params = _closure_key(func) if key is None else key
+        if params is None:
+            func.memoize_key = None
+            return func
+        func.memoize_key = '{0}.{1}:{2}:{3}'.format(
+            func.__module__, func.__name__,
+            '' if version is None else version, params,
+        )
+        return func
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def is_memoized(callback):
+    """Return True if ``callback`` was decorated with :func:`memoize_task`."""
+    return getattr(callback, 'memoize_key', None) is not None
+
+
+def get_task_key(callback, obj):
+    """Return the cache key of a memoized task run over an object."""
+    return hashlib.sha1('{0}:{1}'.format(
+        callback.memoize_key, get_content_hash(obj.data, obj.extra_data)
+    ).encode('utf-8')).hexdigest()
+
+
+class TaskResultCache(object):
+    """Cache of the results of the memoized tasks.
+
+    The results are stored as ``{'data': ..., 'extra_data': ...}``.
+    """
+
+    def __init__(self, app):
+        """Initialize the cache."""
+        self.app = app
+        self.local = LRUCache(app.config['WORKFLOWS_TASK_CACHE_SIZE'])
+
+    def get(self, key, shared=True):
+        """Return the cached result of a key, or None.
+
+        :param shared: also look in the database table if enabled.
+        """
+        serialized = self.local.get(key)
+        if serialized is not None:
+            return json.loads(serialized)
+        if not (shared and self.app.config['WORKFLOWS_TASK_CACHE_DB']):
+            return None
+        row = WorkflowTaskResult.query.get(key)
+        if row is None:
+            return None
+        serialized = json.dumps(row.result)
+        self.local.set(key, serialized)
+        return json.loads(serialized)
+
+    def set(self, key, task, result, shared=True):
+        """Cache the result of a task.
+
+        :param shared: also store it in the database table if enabled.
+
+        :raises TypeError: if the result is not JSON serializable.
+        """
+        self.local.set(key, json.dumps(result))
+        if not (shared and self.app.config['WORKFLOWS_TASK_CACHE_DB']):
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(WorkflowTaskResult(
+                    key=key, task=task[:255], result=result,
+                ))
+        except IntegrityError:
+            # Stored concurrently by another worker.
+            pass
+
+    def clear(self):
+        """Remove all entries from the in-process cache."""
+        self.local.clear()
+
+
+def run_memoized(callback, obj, eng, shared=True):
+    """Run a memoized task, or apply its cached effect to the object.
+
+    :param shared: use the database table if enabled.
+
+    :return: True if the task was skipped.
+    """
+    cache = current_app.extensions['invenio-workflows'].task_cache
+    key = get_task_key(callback, obj)
+    result = cache.get(key, shared=shared)
+    if result is not None:
+        obj.data = result['data']
+        for name in list(obj.extra_data):
+            if not name.startswith('_'):
+                del obj.extra_data[name]
+        obj.extra_data.update(result['extra_data'])
+        eng.log.debug("Skipping callback %r, result cached.", callback)
+        return True
+    callback(obj, eng)
+    cache.set(key, callback.memoize_key, {
+        'data': obj.data,
+        'extra_data': dict(
+            (name, value) for name, value in obj.extra_data.items()
+            if not name.startswith('_')
+        ),
+    }, shared=shared)
+    return False
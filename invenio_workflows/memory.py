@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""In-memory engine running workflows without the database.
+
+:class:`MemoryWorkflowEngine` and :class:`MemoryWorkflowObject` have the
+API and the transition semantics of
+:class:`~invenio_workflows.engine.WorkflowEngine` and
+:class:`~invenio_workflows.api.WorkflowObject`, but keep their state in
+plain Python objects. Nothing is written to the database and no signal is
+sent, which suits unit tests of workflows and what-if runs over many
+objects:
+
+.. code-block:: python
+
+    eng = run('sample_workflow', [{'title': 'Of the foo and bar'}])
+    eng.processed_objects[0].status
+
+The registered workflows are used, so an application context is needed.
+Each :func:`run` keeps its workflow and objects in its own
+:class:`MemoryStorage`, available as ``eng.run_storage`` and freed with the
+engine, so that runs neither accumulate objects nor see each other's. The
+``get``, ``query`` and ``from_uuid`` methods look in the storage of the
+current :func:`scoped_storage` block, or else in the one of the
+application:
+
+.. code-block:: python
+
+    with scoped_storage(eng.run_storage):
+        MemoryWorkflowObject.get(object_id)
+
+The methods running SQL, such as ``WorkflowObject.query_rows``, are not
+available.
+"""
+
+from __future__ import absolute_import, print_function
+
+import itertools
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+from uuid import uuid1 as new_uuid
+
+from flask import current_app
+
+from workflow.engine import ProcessingFactory, TransitionActions
+from workflow.engine_db import WorkflowStatus
+from workflow.errors import WorkflowAPIError
+from workflow.utils import staticproperty
+
+from .api import WorkflowObject
+from .engine import InvenioActionMapper, InvenioProcessingFactory, \
+    InvenioTransitionAction, WorkflowEngine
+from .errors import WorkflowsMissingObject
+from .memoize import is_memoized, run_memoized
+from .models import ObjectStatus
+from .utils import get_error_fingerprint
+
+_ids = itertools.count(1)
+
+_scope = threading.local()
+
+
+def current_storage():
+    """Return the storage of the current :func:`scoped_storage` block.
+
+    Outside of such a block, the in-memory storage of the application is
+    returned.
+    """
+    stack = getattr(_scope, 'stack', None)
+    if stack:
+        return stack[-1]
+    return current_app.extensions['invenio-workflows'].memory_storage
+
+
+@contextmanager
+def scoped_storage(storage):
+    """Keep the in-memory models in ``storage`` within the block.
+
+    The scope is local to the current thread.
+    """
+    if not hasattr(_scope, 'stack'):
+        _scope.stack = []
+    _scope.stack.append(storage)
+    try:
+        yield storage
+    finally:
+        _scope.stack.pop()
+
+
+class MemoryWorkflow(object):
+    """In-memory counterpart of :class:`~invenio_workflows.models.Workflow`.
+
+    ``objects`` lists the models of the objects run by the workflow.
+    """
+
+    def __init__(self, name, id_user=0, uuid=None, extra_data=None):
+        """Initialize a new workflow."""
+        self.uuid = uuid or new_uuid()
+        self.name = name
+        self.id_user = id_user
+        self.extra_data = extra_data or {}
+        self.status = WorkflowStatus.NEW
+        self.created = self.modified = datetime.now()
+        self.objects = []
+
+    def count_objects(self, statuses=None):
+        """Count the objects of the workflow."""
+        return len(self.get_objects(statuses))
+
+    def get_objects(self, statuses=None, offset=None, limit=None):
+        """Return a slice of the objects of the workflow, ordered by id."""
+        objects = sorted(
+            (model for model in self.objects
+             if not statuses or model.status in statuses),
+            key=lambda model: model.id
+        )
+        offset = offset or 0
+        if limit is None:
+            return objects[offset:]
+        return objects[offset:offset + limit]
+
+    def __repr__(self):
+        """Represent a MemoryWorkflow."""
+        return "<MemoryWorkflow(name: %s, status: %s, uuid: %s)>" % \
+            (self.name, self.status, self.uuid)
+
+
+class MemoryObjectModel(object):
+    """In-memory counterpart of the ``WorkflowObjectModel``.
+
+    Ids are unique within the process.
+    """
+
+    def __init__(self, data=None, extra_data=None, status=None,
+                 id_parent=None, data_type='', id_user=0,
+                 content_hash=None):
+        """Initialize a new object."""
+        self.id = next(_ids)
+        self.data = data if data is not None else {}
+        self.extra_data = extra_data if extra_data is not None else {}
+        self.status = status or ObjectStatus.INITIAL
+        self.id_parent = id_parent
+        self.data_type = data_type
+        self.id_user = id_user
+        self.callback_pos = []
+        self.created = self.modified = datetime.now()
+        self.version_id = 1
+        self._id_workflow = None
+        self.workflow = None
+        self.lease_owner = self.lease_expires = None
+        self.heartbeat = self.resume_at = None
+        self.content_hash = content_hash
+
+    @property
+    def id_workflow(self):
+        """Get id_workflow."""
+        return self._id_workflow
+
+    @id_workflow.setter
+    def id_workflow(self, value):
+        """Set id_workflow, as a string like the SQL model."""
+        self._id_workflow = str(value) if value else None
+
+    def __repr__(self):
+        """Represent a MemoryObjectModel."""
+        return "<MemoryObjectModel(id = %s, id_workflow = %s, status = %s)>" \
+            % (self.id, self.id_workflow, self.status)
+
+
+class MemoryStorage(object):
+    """Keep workflows and objects in dictionaries of the process.
+
+    It implements the interface of
+    :class:`~invenio_workflows.storage.SQLStorage` for the in-memory models
+    only, and cannot be set as ``WORKFLOWS_STORAGE``. Saved models stay in
+    memory until :meth:`clear` is called.
+    """
+
+    def __init__(self, app=None):
+        """Initialize an empty storage."""
+        self.app = app
+        self.workflows = {}
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Forget all workflows and objects."""
+        with self._lock:
+            self.workflows.clear()
+            self.objects.clear()
+
+    def create_object(self, model_class, data, **kwargs):
+        """Create and keep a new object model."""
+        model = model_class(data=data, **kwargs)
+        with self._lock:
+            self.objects[model.id] = model
+        return model
+
+    def get_object(self, model_class, id_, with_payload=True):
+        """Return the model of an object.
+
+        :raises WorkflowsMissingObject: if there is no such object.
+        """
+        try:
+            return self.objects[id_]
+        except KeyError:
+            raise WorkflowsMissingObject("No object for for id {0}".format(
+                id_
+            ))
+
+    def query_objects(self, model_class, *criteria, **filters):
+        """Return the models of the objects with the given attributes.
+
+        Only the keyword arguments of ``filter_by`` are supported.
+        """
+        if criteria:
+            raise TypeError('Only keyword filters are supported in memory.')
+        filters.pop('with_payload', None)
+        with self._lock:
+            models = sorted(self.objects.items())
+        return [
+            model for _, model in models
+            if all(getattr(model, key) == value
+                   for key, value in filters.items())
+        ]
+
+    @contextmanager
+    def saving(self, model, json_columns=()):
+        """Keep the model once changed in the block."""
+        yield
+        with self._lock:
+            if isinstance(model, MemoryWorkflow):
+                self.workflows[str(model.uuid)] = model
+            else:
+                model.version_id += 1
+                self.objects[model.id] = model
+
+    def get_workflow(self, uuid):
+        """Return the model of a workflow, or None."""
+        return self.workflows.get(str(uuid))
+
+    def get_workflow_objects(self, uuid):
+        """Return the models of the top-level objects of a workflow."""
+        with self._lock:
+            models = sorted(self.objects.items())
+        return [
+            model for _, model in models
+            if model.id_workflow == str(uuid) and model.id_parent is None
+        ]
+
+
+class MemoryWorkflowObject(WorkflowObject):
+    """Workflow object kept in memory."""
+
+    @staticproperty
+    def storage():  # pylint: disable=no-method-argument
+        """Get the current in-memory storage, see :func:`current_storage`."""
+        return current_storage()
+
+    @staticproperty
+    def dbmodel():  # pylint: disable=no-method-argument
+        """Get type for dbmodel."""
+        return MemoryObjectModel
+
+    def save(self, status=None, callback_pos=None, id_workflow=None):
+        """Update the state of the object."""
+        with self.storage.saving(self.model):
+            self.model.modified = datetime.now()
+            if status is not None:
+                self.model.status = status
+            if id_workflow is not None:
+                self.model.workflow = self.storage.get_workflow(id_workflow)
+                self.model.id_workflow = id_workflow
+            if callback_pos is not None:
+                self.model.callback_pos = callback_pos
+            self.model.content_hash = self._stored_content_hash(
+                self.model.data, self.model.extra_data
+            )
+
+    def delete(self, force=False):
+        """Detach the object from its workflow."""
+        workflow = self.model.workflow
+        if workflow is not None and self.model in workflow.objects:
+            workflow.objects.remove(self.model)
+        return self
+
+    def start_workflow(self, workflow_name, delayed=False, **kwargs):
+        """Run a workflow on the object, ``delayed`` is ignored.
+
+        :return: the MemoryWorkflowEngine.
+        """
+        return run(workflow_name, [self], storage=self.storage, **kwargs)
+
+    def continue_workflow(self, start_point="continue_next",
+                          delayed=False, **kwargs):
+        """Continue the workflow of the object, ``delayed`` is ignored.
+
+        :return: the MemoryWorkflowEngine.
+        """
+        if self.model.workflow is None:
+            raise WorkflowAPIError("No workflow associated with object: %r"
+                                   % (repr(self),))
+        kwargs.setdefault('stop_on_halt', False)
+        engine = MemoryWorkflowEngine(self.model.workflow)
+        engine.continue_object(self, restart_point=start_point, **kwargs)
+        return engine
+
+
+class MemoryWorkflowEngine(WorkflowEngine):
+    """Workflow engine keeping its state in memory."""
+
+    def __init__(self, model=None, name=None, id_user=None, **extra_data):
+        """Initialize the engine, with a new workflow unless given."""
+        if model is None:
+            model = MemoryWorkflow(name=name, id_user=id_user)
+            super(MemoryWorkflowEngine, self).__init__(model=model)
+            self.save()
+        else:
+            super(MemoryWorkflowEngine, self).__init__(model=model)
+
+    @staticproperty
+    def storage():  # pylint: disable=no-method-argument
+        """Return the current in-memory storage, see ``current_storage``."""
+        return current_storage()
+
+    @staticproperty
+    def processing_factory():  # pylint: disable=no-method-argument
+        """Provide a proccessing factory."""
+        return MemoryProcessingFactory
+
+    @property
+    def processed_objects(self):
+        """Return the processed objects."""
+        return list(self.objects)
+
+    @property
+    def has_completed(self):
+        """Return True if workflow is fully completed."""
+        return all(obj.status == ObjectStatus.COMPLETED
+                   for obj in self.objects)
+
+    def heartbeat(self, obj):
+        """Do nothing, in-memory objects cannot stall."""
+
+    def __repr__(self):
+        """Allow to represent the MemoryWorkflowEngine."""
+        return "<MemoryWorkflowEngine (name={0}, status={1})>".format(
+            self.name, self.status
+        )
+
+
+class MemoryActionMapper(InvenioActionMapper):
+    """Map workflow engine callbacks to in-memory functions."""
+
+    @staticmethod
+    def execute_callback(eng, callback_func, obj):
+        """Run a WF callback, using the in-process task cache only."""
+        if is_memoized(callback_func):
+            run_memoized(callback_func, obj, eng, shared=False)
+        else:
+            callback_func(obj, eng)
+
+
+class MemoryProcessingFactory(InvenioProcessingFactory):
+    """Map workflow processing callbacks to in-memory functions."""
+
+    @staticproperty
+    def action_mapper():  # pylint: disable=no-method-argument
+        """Set a mapper for actions while processing."""
+        return MemoryActionMapper
+
+    @staticproperty
+    def transition_exception_mapper():  # pylint: disable=no-method-argument
+        """Define our for handling transition exceptions."""
+        return MemoryTransitionAction
+
+    @staticmethod
+    def before_object(eng, objects, obj):
+        """Take action before the processing of an object begins."""
+        ProcessingFactory.before_object(eng, objects, obj)
+        for key in ('_error_msg', '_error_fingerprint', '_correlation_key'):
+            obj.extra_data.pop(key, None)
+        if obj.model not in eng.model.objects:
+            eng.model.objects.append(obj.model)
+        obj.model.resume_at = None
+        obj.save(status=obj.known_statuses.RUNNING, id_workflow=eng.uuid)
+
+    @staticmethod
+    def after_object(eng, objects, obj):
+        """Take action once the proccessing of an object completes."""
+        ProcessingFactory.after_object(eng, objects, obj)
+        obj.save(status=obj.known_statuses.COMPLETED, id_workflow=eng.uuid)
+
+    @staticmethod
+    def before_processing(eng, objects):
+        """Execute before processing the workflow."""
+        ProcessingFactory.before_processing(eng, objects)
+        eng.save(WorkflowStatus.RUNNING)
+
+    @staticmethod
+    def after_processing(eng, objects):
+        """Process to update status."""
+        ProcessingFactory.after_processing(eng, objects)
+        if eng.has_completed:
+            eng.save(WorkflowStatus.COMPLETED)
+        else:
+            eng.save(WorkflowStatus.HALTED)
+
+
+class MemoryTransitionAction(InvenioTransitionAction):
+    """Map workflow processing exception handlers to in-memory functions."""
+
+    @staticmethod
+    def Exception(obj, eng, callbacks, exc_info):
+        """Handle general exceptions in workflow, saving states."""
+        exception_repr = ''.join(traceback.format_exception(*exc_info))
+        fingerprint = get_error_fingerprint(exc_info)
+        eng.log.error("Error %s:\n%s", fingerprint, exception_repr)
+        if obj:
+            obj.extra_data['_error_msg'] = exception_repr
+            obj.extra_data['_error_fingerprint'] = fingerprint
+            obj.save(
+                status=obj.known_statuses.ERROR,
+                callback_pos=eng.state.callback_pos,
+                id_workflow=eng.uuid
+            )
+        eng.save(WorkflowStatus.ERROR)
+
+        # Call super which will reraise
+        TransitionActions.Exception(obj, eng, callbacks, exc_info)
+
+    @staticmethod
+    def WaitProcessing(obj, eng, callbacks, exc_info):
+        """Take actions when WaitProcessing is raised."""
+        e = exc_info[1]
+        obj.set_action(e.action, e.message)
+        obj.model.resume_at = getattr(e, 'resume_at', None)
+        correlation_key = getattr(e, 'correlation_key', None)
+        if correlation_key is not None:
+            obj.extra_data['_correlation_key'] = correlation_key
+        obj.save(status=eng.object_status.WAITING,
+                 callback_pos=eng.state.callback_pos,
+                 id_workflow=eng.uuid)
+        eng.save(WorkflowStatus.HALTED)
+        eng.log.warning("Workflow '%s' waiting at task %s with message: %s",
+                        eng.name, eng.current_taskname or "Unknown", e.message)
+
+        TransitionActions.HaltProcessing(obj, eng, callbacks, exc_info)
+
+    @staticmethod
+    def HaltProcessing(obj, eng, callbacks, exc_info):
+        """Handle halted exception in workflow, saving states."""
+        e = exc_info[1]
+        if e.action:
+            obj.set_action(e.action, e.message)
+            obj.save(status=eng.object_status.HALTED,
+                     callback_pos=eng.state.callback_pos,
+                     id_workflow=eng.uuid)
+            eng.save(WorkflowStatus.HALTED)
+            obj.log.warning(
+                "Workflow '%s' halted at task %s with message: %s",
+                eng.name, eng.current_taskname or "Unknown", e.message
+            )
+
+            TransitionActions.HaltProcessing(obj, eng, callbacks, exc_info)
+        else:
+            MemoryTransitionAction.WaitProcessing(
+                obj, eng, callbacks, exc_info
+            )
+
+    @staticmethod
+    def StopProcessing(obj, eng, callbacks, exc_info):
+        """Stop the engine and mark the workflow as completed."""
+        e = exc_info[1]
+        obj.save(status=eng.object_status.COMPLETED, id_workflow=eng.uuid)
+        eng.save(WorkflowStatus.COMPLETED)
+        obj.log.warning(
+            "Workflow '%s' stopped at task %s with message: %s",
+            eng.name, eng.current_taskname or "Unknown", e.message
+        )
+
+        TransitionActions.StopProcessing(obj, eng, callbacks, exc_info)
+
+
+def run(workflow_name, data, storage=None, **kwargs):
+    """Run a registered workflow in memory.
+
+    :param workflow_name: name of workflow to run.
+    :type workflow_name: str
+
+    :param data: objects to run through the workflow, either data or
+        MemoryWorkflowObject instances.
+    :type data: list
+
+    :param storage: storage of the workflow and objects, a new
+        :class:`MemoryStorage` by default.
+    :type storage: MemoryStorage
+
+    :return: the MemoryWorkflowEngine, whose ``run_storage`` is the storage.
+    """
+    kwargs.setdefault('stop_on_halt', False)
+    if storage is None:
+        storage = MemoryStorage(current_app._get_current_object())
+    with scoped_storage(storage):
+        engine = MemoryWorkflowEngine.with_name(workflow_name)
+        engine.run_storage = storage
+        data_type = engine.get_default_data_type()
+        objects = []
+        for item in data:
+            if not isinstance(item, MemoryWorkflowObject):
+                item = MemoryWorkflowObject.create(item, data_type=data_type)
+            elif item.status == ObjectStatus.COMPLETED:
+                item.status = ObjectStatus.INITIAL
+            objects.append(item)
+        engine.process(objects, **kwargs)
+    return engine
@@ -19,19 +19,209 @@
 
 """Models for workflow engine and objects."""
 
+import json
+import traceback
 import uuid
+import zlib
 
+from contextlib import contextmanager
 from datetime import datetime
 
+from flask import current_app, has_app_context
 from invenio_db import db
+from six import text_type
 
+from sqlalchemy import event, inspect
 from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.types import TypeDecorator, UnicodeText
 from sqlalchemy_utils.types import ChoiceType, UUIDType, JSONType
 from workflow.engine_db import EnumLabel, WorkflowStatus
 from workflow.utils import staticproperty
 
+from .errors import WorkflowsVersionConflict
+from .utils import obj_or_import_string
+
+
+def _zstd_compress(value):
+    import zstandard
+    return zstandard.ZstdCompressor().compress(value)
+
+
+def _zstd_decompress(value):
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(value)
+
+
+COMPRESSION_CODECS = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'zstd': (_zstd_compress, _zstd_decompress),
+}
+"""Known payload compression codecs, as ``(compress, decompress)``."""
+
+
+PAYLOAD_GROUP = 'payload'
+"""Group of the deferred JSON columns of ``WorkflowObjectModel``."""
+
+
+def _orjson_dumps(value):
+    import orjson
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+
+def _orjson_loads(value):
+    import orjson
+    return orjson.loads(value)
+
+
+SERIALIZERS = {
+    'json': (json.dumps, json.loads),
+    'orjson': (_orjson_dumps, _orjson_loads),
+}
+"""Known JSON serializers, as ``(dumps, loads)``."""
+
+
+def load_serializer(name):
+    """Return the ``(dumps, loads)`` of a serializer.
+
+    :param name: name of a known serializer, see :data:`SERIALIZERS`, or
+        import path of a module or object with ``dumps`` and ``loads``.
+    :type name: str
+    """
+    if name in SERIALIZERS:
+        return SERIALIZERS[name]
+    serializer = obj_or_import_string(name)
+    return serializer.dumps, serializer.loads
+
+
+def get_serializer():
+    """Return the ``(dumps, loads)`` set with ``WORKFLOWS_SERIALIZER``.
+
+    It is resolved once per application, see
+    :attr:`~invenio_workflows.ext._WorkflowState.serializer`.
+    """
+    if not has_app_context():
+        return SERIALIZERS['json']
+    state = current_app.extensions.get('invenio-workflows')
+    if state is None:
+        return load_serializer(
+            current_app.config.get('WORKFLOWS_SERIALIZER', 'json')
+        )
+    return state.serializer
+
+
+class SerializedJSONType(TypeDecorator):
+    """JSON type serialized with ``WORKFLOWS_SERIALIZER``.
+
+    Values are stored as JSON text, like with ``JSONType``, so the rows
+    written with any serializer can be read with the others. On PostgreSQL,
+    the native JSON type is used and the values are serialized by the
+    database driver.
+    """
+
+    impl = UnicodeText
+
+    def load_dialect_impl(self, dialect):
+        """Use the native JSON type on PostgreSQL."""
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.JSON(none_as_null=True))
+        return dialect.type_descriptor(UnicodeText())
+
+    def process_bind_param(self, value, dialect):
+        """Serialize the value, except on PostgreSQL."""
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return text_type(get_serializer()[0](value))
+
+    def process_result_value(self, value, dialect):
+        """Deserialize the value, except on PostgreSQL."""
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return get_serializer()[1](value)
+
+
+def compress_payload(value):
+    """Return a payload compressed, if it is large enough.
+
+    Depending on ``WORKFLOWS_COMPRESSION``, payloads whose serialized size
+    exceeds ``WORKFLOWS_COMPRESSION_THRESHOLD`` are compressed, and prefixed
+    with the name of the codec.
+
+    :return: the compressed bytes, or None if it is left uncompressed.
+    """
+    if value is None or not has_app_context():
+        return None
+    codec = current_app.config.get('WORKFLOWS_COMPRESSION')
+    if not codec:
+        return None
+    serialized = text_type(get_serializer()[0](value)).encode('utf-8')
+    if len(serialized) <= current_app.config.get(
+            'WORKFLOWS_COMPRESSION_THRESHOLD', 0):
+        return None
+    compress = COMPRESSION_CODECS[codec][0]
+    return codec.encode('ascii') + b':' + compress(serialized)
+
+
+def decompress_payload(value):
+    """Return a payload compressed with :func:`compress_payload`."""
+    codec, compressed = bytes(value).split(b':', 1)
+    decompress = COMPRESSION_CODECS[codec.decode('ascii')][1]
+    return get_serializer()[1](decompress(compressed).decode('utf-8'))
+
+
+def compressed_payload(name):
+    """Return a property over a JSON column and its compressed counterpart.
+
+    The payload is stored in the ``_<name>`` JSON column, or compressed in the
+    ``<name>_compressed`` binary column, in which case the JSON column is
+    NULL. It is decompressed on first access only. In queries, the property
+    stands for the JSON column.
+    """
+    key = '_' + name
+    compressed_key = name + '_compressed'
+
+    def fget(self):
+        value = getattr(self, key)
+        compressed = getattr(self, compressed_key)
+        if value is None and compressed is not None:
+            value = decompress_payload(compressed)
+            set_committed_value(self, key, value)
+        return value
+
+    def fset(self, value):
+        setattr(self, key, value)
+        setattr(self, compressed_key, None)
+
+    def expr(cls):
+        return getattr(cls, key)
+
+    fget.__name__ = name
+    return hybrid_property(fget, fset, expr=expr)
+
+
+def _compress_payloads(mapper, connection, target):
+    """Compress the changed payloads of a model before writing them."""
+    state = inspect(target)
+    for name in target.__compressed_payloads__:
+        key = '_' + name
+        if state.has_identity and \
+                not state.attrs[key].history.has_changes() and \
+                not state.attrs[name + '_compressed'].history.has_changes():
+            continue
+        value = getattr(target, name)
+        compressed = compress_payload(value)
+        if compressed is not None:
+            setattr(target, key, None)
+            setattr(target, name + '_compressed', compressed)
+        elif value is not None:
+            # The value may have been decompressed, write it in any case.
+            setattr(target, key, value)
+            flag_modified(target, key)
+            setattr(target, name + '_compressed', None)
+
 
 class ObjectStatus(EnumLabel):
 
@@ -54,6 +244,25 @@ class ObjectStatus(EnumLabel):
         }
 
 
+@contextmanager
+def versioned_save(instance):
+    """Apply the changes made in the block to a versioned model.
+
+    Autoflush is disabled in the block, so that the row is written by a
+    single ``UPDATE``. It only matches if ``version_id`` is still the one
+    loaded, the version being incremented by the same statement.
+
+    :raises WorkflowsVersionConflict: if the row was modified concurrently.
+    """
+    try:
+        with db.session.no_autoflush:
+            yield
+        db.session.add(instance)
+        db.session.flush()
+    except StaleDataError as e:
+        raise WorkflowsVersionConflict(str(e))
+
+
 class Workflow(db.Model):
     """Represents a workflow instance storing the state of the workflow."""
 
@@ -77,9 +286,18 @@ class Workflow(db.Model):
     )
     status = db.Column(ChoiceType(WorkflowStatus, impl=db.Integer()),
                        default=WorkflowStatus.NEW, nullable=False)
+    version_id = db.Column(db.Integer, nullable=False)
+    """Incremented on each update, to detect concurrent modifications."""
     objects = db.relationship("WorkflowObjectModel",
                               backref='workflows_workflow',
-                              cascade="all, delete-orphan")
+                              cascade="all, delete-orphan",
+                              passive_deletes=True,
+                              lazy='dynamic')
+    """Query of the objects of the workflow, see :meth:`get_objects`."""
+
+    __mapper_args__ = {
+        'version_id_col': version_id,
+    }
 
     def __repr__(self):
         """Represent a Workflow instance."""
@@ -92,22 +310,92 @@ class Workflow(db.Model):
         """Represent a Workflow instance."""
         return self.__repr__()
 
+    def _objects_query(self, statuses=None):
+        """Return the query of the objects in one of the given statuses."""
+        query = self.objects
+        if statuses:
+            query = query.filter(WorkflowObjectModel.status.in_(statuses))
+        return query
+
+    def count_objects(self, statuses=None):
+        """Count the objects of the workflow in SQL.
+
+        :param statuses: only count objects in one of these statuses.
+        :type statuses: list of ObjectStatus
+
+        :return: number of objects.
+        """
+        return self._objects_query(statuses).count()
+
+    def get_objects(self, statuses=None, offset=None, limit=None):
+        """Return a slice of the objects of the workflow, ordered by id.
+
+        :param statuses: only return objects in one of these statuses.
+        :type statuses: list of ObjectStatus
+
+        :param offset: number of objects skipped.
+        :type offset: int
+
+        :param limit: maximum number of objects returned.
+        :type limit: int
+
+        :return: list of WorkflowObjectModel.
+        """
+        return self._objects_query(statuses).order_by(
+            WorkflowObjectModel.id
+        ).offset(offset).limit(limit).all()
+
     @classmethod
     def delete(cls, uuid):
         """Delete a workflow."""
         to_delete = Workflow.query.get(uuid)
         db.session.delete(to_delete)
 
+    @classmethod
+    def purge(cls, older_than=None, statuses=None, names=None,
+              batch_size=1000):
+        """Delete workflows matching the given criteria in batches.
+
+        The workflow objects are removed by the database through the
+        ``ON DELETE CASCADE`` foreign key, so they are never loaded in the
+        session. Each batch is committed separately.
+
+        :param older_than: only delete workflows not modified since then.
+        :type older_than: datetime
+
+        :param statuses: only delete workflows in one of these statuses.
+        :type statuses: list of WorkflowStatus
+
+        :param names: only delete workflows with one of these names.
+        :type names: list of str
+
+        :param batch_size: maximum number of workflows deleted at once.
+        :type batch_size: int
+
+        :return: number of deleted workflows.
+        """
+        query = cls.query
+        if older_than is not None:
+            query = query.filter(cls.modified < older_than)
+        if statuses:
+            query = query.filter(cls.status.in_(statuses))
+        if names:
+            query = query.filter(cls.name.in_(names))
+        return delete_in_batches(query, cls.uuid, batch_size=batch_size)
+
     def save(self, status=None):
-        """Save object to persistent storage."""
-        with db.session.begin_nested():
+        """Save object to persistent storage.
+
+        :raises WorkflowsVersionConflict: if the workflow was modified
+            concurrently.
+        """
+        with versioned_save(self):
             self.modified = datetime.now()
             if status is not None:
                 self.status = status
             if self.extra_data is None:
                 self.extra_data = dict()
             flag_modified(self, 'extra_data')
-            db.session.merge(self)
 
 
 class WorkflowObjectModel(db.Model):
@@ -146,30 +434,73 @@ class WorkflowObjectModel(db.Model):
     .. code-block:: python
 
         obj.start_workflow("sample_workflow")
+
+    The JSON columns ``data``, ``extra_data`` and ``callback_pos`` are
+    deferred in the :data:`PAYLOAD_GROUP` group: they are only loaded when
+    first accessed, unless the query undefers the group.
     """
 
     __tablename__ = "workflows_object"
 
+    __table_args__ = (
+        # Objects of a workflow by status, e.g. ``WorkflowEngine.from_uuid``
+        # and ``WorkflowEngine.has_completed``.
+        db.Index(
+            'ix_workflows_object_id_workflow_id_parent_status',
+            'id_workflow', 'id_parent', 'status',
+        ),
+        # Unfinished objects by age, e.g. for sweepers. Partial on
+        # PostgreSQL, where completed objects are most of the table.
+        db.Index(
+            'ix_workflows_object_status_modified',
+            'status', 'modified',
+            postgresql_where=db.text('status <> {0}'.format(
+                ObjectStatus.COMPLETED.value
+            )),
+        ),
+        # Running objects by heartbeat, for the stalled objects sweeper.
+        db.Index(
+            'ix_workflows_object_status_heartbeat',
+            'status', 'heartbeat',
+        ),
+        # Scheduled wake-ups, few objects have one.
+        db.Index(
+            'ix_workflows_object_resume_at',
+            'resume_at',
+            postgresql_where=db.text('resume_at IS NOT NULL'),
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
-    data = db.Column(
-        JSONType().with_variant(
-            postgresql.JSON(none_as_null=True),
-            'postgresql',
-        ),
+    __compressed_payloads__ = ('data', 'extra_data')
+
+    _data = db.deferred(db.Column(
+        'data',
+        SerializedJSONType().evaluates_none(),
         default=lambda: dict(),
-        nullable=False
+        nullable=True
+    ), group=PAYLOAD_GROUP)
+
+    data_compressed = db.deferred(
+        db.Column(db.LargeBinary, nullable=True), group=PAYLOAD_GROUP
     )
 
-    extra_data = db.Column(
-        JSONType().with_variant(
-            postgresql.JSON(none_as_null=True),
-            'postgresql',
-        ),
+    data = compressed_payload('data')
+
+    _extra_data = db.deferred(db.Column(
+        'extra_data',
+        SerializedJSONType().evaluates_none(),
         default=lambda: dict(),
-        nullable=False
+        nullable=True
+    ), group=PAYLOAD_GROUP)
+
+    extra_data_compressed = db.deferred(
+        db.Column(db.LargeBinary, nullable=True), group=PAYLOAD_GROUP
     )
 
+    extra_data = compressed_payload('extra_data')
+
     _id_workflow = db.Column(UUIDType,
                              db.ForeignKey("workflows_workflow.uuid",
                                            ondelete='CASCADE'),
@@ -196,20 +527,37 @@ class WorkflowObjectModel(db.Model):
 
     id_user = db.Column(db.Integer, default=0, nullable=False)
 
-    callback_pos = db.Column(
-        JSONType().with_variant(
-            postgresql.JSON(none_as_null=True),
-            'postgresql',
-        ),
+    content_hash = db.Column(db.String(40), nullable=True, index=True)
+    """Digest of ``data`` and ``extra_data`` when last saved."""
+
+    callback_pos = db.deferred(db.Column(
+        SerializedJSONType(),
         default=lambda: list(),
         nullable=True
-    )
+    ), group=PAYLOAD_GROUP)
+
+    version_id = db.Column(db.Integer, nullable=False)
+    """Incremented on each update, to detect concurrent modifications."""
+
+    lease_owner = db.Column(db.String(255), nullable=True)
+    """Identifier of the run processing the object, see :mod:`.leases`."""
+
+    lease_expires = db.Column(db.DateTime, nullable=True)
+
+    heartbeat = db.Column(db.DateTime, nullable=True)
+    """Last time the object was seen alive while running."""
+
+    resume_at = db.Column(db.DateTime, nullable=True)
+    """Time at which a waiting object is resumed, see :mod:`.scheduler`."""
 
     workflow = db.relationship(
         Workflow, foreign_keys=[_id_workflow], remote_side=Workflow.uuid,
-        post_update=True,
     )
 
+    __mapper_args__ = {
+        'version_id_col': version_id,
+    }
+
     @hybrid_property
     def id_workflow(self):  # pylint: disable=method-hidden
         """Get id_workflow."""
@@ -232,4 +580,277 @@ class WorkflowObjectModel(db.Model):
         return self.__repr__()
 
 
-__all__ = ('Workflow', 'WorkflowObjectModel')
+class ErrorFingerprint(db.Model):
+    """Represents an error seen while running workflows.
+
+    Errors are identified by a fingerprint of the exception type and of the
+    traceback frames, computed by
+    :func:`~invenio_workflows.utils.get_error_fingerprint`. The traceback of
+    the first occurrence is stored once, with the number of occurrences,
+    which the workflow objects in error reference.
+    """
+
+    __tablename__ = "workflows_error_fingerprint"
+
+    fingerprint = db.Column(db.String(40), primary_key=True)
+    exc_type = db.Column(db.String(255), nullable=False)
+    message = db.Column(db.Text, default="", nullable=False)
+    traceback = db.Column(db.Text, default="", nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False, index=True)
+    created = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    modified = db.Column(db.DateTime, default=datetime.now,
+                         onupdate=datetime.now, nullable=False)
+
+    def __repr__(self):
+        """Represent an ErrorFingerprint."""
+        return "<ErrorFingerprint(fingerprint: %s, exc_type: %s, " \
+               "count: %s)>" % (self.fingerprint, self.exc_type, self.count)
+
+    @classmethod
+    def record(cls, exc_info):
+        """Account for an occurrence of an exception.
+
+        The occurrence counter of the fingerprint is atomically incremented,
+        the fingerprint being created the first time it is seen. This is done
+        in a short transaction of its own, so that the counter is neither
+        locked for the duration of the failed workflow nor rolled back with
+        it.
+
+        :param exc_info: exception info as returned by ``sys.exc_info()``.
+        :type exc_info: tuple
+
+        :return: the fingerprint, and True if it was seen for the first time.
+        """
+        from .utils import get_error_fingerprint
+
+        fingerprint = get_error_fingerprint(exc_info)
+        table = cls.__table__
+        for _ in range(2):
+            try:
+                with db.engine.begin() as connection:
+                    updated = connection.execute(table.update().where(
+                        table.c.fingerprint == fingerprint
+                    ).values(
+                        count=table.c.count + 1, modified=datetime.now()
+                    )).rowcount
+                    if updated:
+                        return fingerprint, False
+                    connection.execute(table.insert().values(
+                        fingerprint=fingerprint,
+                        exc_type=exc_info[0].__name__,
+                        message=''.join(traceback.format_exception_only(
+                            *exc_info[:2]
+                        )).strip(),
+                        traceback=''.join(traceback.format_exception(
+                            *exc_info
+                        )),
+                        count=1,
+                    ))
+                    return fingerprint, True
+            except IntegrityError:
+                # Inserted concurrently, increment it instead.
+                continue
+        return fingerprint, False
+
+
+class WorkflowJob(db.Model):
+    """Represents a workflow run queued in the database.
+
+    Jobs are claimed by :class:`~invenio_workflows.queue_worker.QueueWorker`
+    instances, which lease them until ``lease_expires`` so that a job whose
+    worker died is eventually picked up again.
+    """
+
+    __tablename__ = "workflows_job"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    id_object = db.Column(db.Integer,
+                          db.ForeignKey("workflows_object.id",
+                                        ondelete='CASCADE'),
+                          nullable=False, index=True)
+
+    action = db.Column(db.String(10), nullable=False)
+    """One of ``start``, ``resume`` or ``restart``."""
+
+    workflow_name = db.Column(db.String(255), nullable=True)
+
+    restart_point = db.Column(db.String(20), nullable=True)
+
+    created = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    lease_owner = db.Column(db.String(255), nullable=True)
+
+    lease_expires = db.Column(db.DateTime, nullable=True, index=True)
+
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        """Represent a WorkflowJob."""
+        return "<WorkflowJob(id: %s, id_object: %s, action: %s, " \
+               "lease_owner: %s, lease_expires: %s)>" % \
+               (self.id, self.id_object, self.action, self.lease_owner,
+                self.lease_expires)
+
+
+class WorkflowConcurrencySlot(db.Model):
+    """Represents a running slot of a workflow with limited concurrency.
+
+    Each workflow name has as many slots as its limit in
+    ``WORKFLOWS_CONCURRENCY_LIMITS``, and a run holds one of them, identified
+    by its number, for its whole duration. The primary key makes the
+    acquisition of a slot atomic.
+    """
+
+    __tablename__ = "workflows_concurrency_slot"
+
+    name = db.Column(db.String(255), primary_key=True)
+
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    owner = db.Column(db.String(255), nullable=False)
+
+    expires = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        """Represent a WorkflowConcurrencySlot."""
+        return "<WorkflowConcurrencySlot(name: %s, slot: %s, owner: %s, " \
+               "expires: %s)>" % (self.name, self.slot, self.owner,
+                                  self.expires)
+
+
+class WorkflowCorrelation(db.Model):
+    """Represents an external event a waiting object waits for.
+
+    The key is given to :class:`~invenio_workflows.errors.WaitProcessing`
+    and the row is removed when the object runs again.
+    """
+
+    __tablename__ = "workflows_correlation"
+
+    correlation_key = db.Column(db.String(255), primary_key=True)
+
+    id_object = db.Column(db.Integer,
+                          db.ForeignKey("workflows_object.id",
+                                        ondelete='CASCADE'),
+                          primary_key=True, autoincrement=False, index=True)
+
+    created = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self):
+        """Represent a WorkflowCorrelation."""
+        return "<WorkflowCorrelation(correlation_key: %s, id_object: %s)>" \
+            % (self.correlation_key, self.id_object)
+
+
+class WorkflowEvent(db.Model):
+    """Represents a status transition of a workflow object.
+
+    Rows are only ever inserted, see :mod:`invenio_workflows.events`. They
+    have no foreign key, so that the history outlives purged objects.
+    """
+
+    __tablename__ = "workflows_event"
+
+    __table_args__ = (
+        # Transitions into a status over time, e.g. for throughput.
+        db.Index(
+            'ix_workflows_event_to_status_created',
+            'to_status', 'created',
+        ),
+        # History of an object, e.g. for the time spent in a status.
+        db.Index(
+            'ix_workflows_event_id_object_id',
+            'id_object', 'id',
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    id_object = db.Column(db.Integer, nullable=False)
+
+    id_workflow = db.Column(UUIDType, nullable=True)
+
+    from_status = db.Column(ChoiceType(ObjectStatus, impl=db.Integer()),
+                            nullable=True)
+
+    to_status = db.Column(ChoiceType(ObjectStatus, impl=db.Integer()),
+                          nullable=False)
+
+    task = db.Column(db.String(255), nullable=True)
+
+    created = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self):
+        """Represent a WorkflowEvent."""
+        return "<WorkflowEvent(id_object: %s, from_status: %s, " \
+               "to_status: %s, created: %s)>" % \
+               (self.id_object, self.from_status, self.to_status,
+                self.created)
+
+
+class WorkflowTaskResult(db.Model):
+    """Represents the cached effect of a memoized task.
+
+    The key is computed from the task and the content of the object it ran
+    over, see :mod:`invenio_workflows.memoize`.
+    """
+
+    __tablename__ = "workflows_task_result"
+
+    key = db.Column(db.String(40), primary_key=True)
+
+    task = db.Column(db.String(255), nullable=False, index=True)
+
+    __compressed_payloads__ = ('result',)
+
+    _result = db.Column(
+        'result', SerializedJSONType().evaluates_none(), nullable=True
+    )
+
+    result_compressed = db.Column(db.LargeBinary, nullable=True)
+
+    result = compressed_payload('result')
+
+    created = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self):
+        """Represent a WorkflowTaskResult."""
+        return "<WorkflowTaskResult(key: %s, task: %s)>" % \
+            (self.key, self.task)
+
+
+for _model in (WorkflowObjectModel, WorkflowTaskResult):
+    event.listen(_model, 'before_insert', _compress_payloads)
+    event.listen(_model, 'before_update', _compress_payloads)
+
+
+def delete_in_batches(query, column, batch_size=1000):
+    """Delete the rows matched by a query using bounded set-based DELETEs.
+
+    The primary keys of the matched rows are fetched ``batch_size`` at a time
+    and deleted with a single ``DELETE ... WHERE column IN (...)`` statement,
+    committing after each batch. No instance is loaded in the session.
+
+    :param query: query selecting the rows to delete.
+    :param column: primary key column of the queried model.
+    :param batch_size: maximum number of rows deleted per statement.
+
+    :return: number of deleted rows.
+    """
+    model = column.class_
+    deleted = 0
+    while True:
+        ids = [row[0] for row in
+               query.with_entities(column).limit(batch_size).all()]
+        if not ids:
+            return deleted
+        deleted += model.query.filter(column.in_(ids)).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+
+
+__all__ = ('ErrorFingerprint', 'Workflow', 'WorkflowConcurrencySlot',
+           'WorkflowCorrelation', 'WorkflowEvent', 'WorkflowJob',
+           'WorkflowObjectModel', 'WorkflowTaskResult')
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Constructs for workflow definitions.
+
+:func:`parallel` runs independent tasks over the same object at the same
+time, e.g. tasks calling several services:
+
+.. code-block:: python
+
+    class EnrichWorkflow(object):
+        workflow = [
+            normalize,
+            parallel([fetch_citations, fetch_authors, [guess_language,
+                                                       translate_title]]),
+            store,
+        ]
+"""
+
+from __future__ import absolute_import, print_function
+
+import copy
+import sys
+import threading
+from functools import partial
+
+from flask import current_app
+from invenio_db import db
+from six import get_unbound_function, reraise
+
+_branch_state = threading.local()
+
+
+class BranchObject(object):
+    """View of a workflow object given to the tasks of a branch.
+
+    The branch works on its own copies of ``data`` and ``extra_data``. The
+    other attributes are a snapshot taken before the branches are started,
+    so that no thread reads the object, or the database session it is bound
+    to, while they run.
+    """
+
+    _snapshot = ('id', 'id_parent', 'id_workflow', 'status', 'data_type')
+
+    def __init__(self, obj, data, extra_data):
+        """Initialize the view."""
+        for name in self._snapshot:
+            self.__dict__[name] = getattr(obj, name)
+        self.__dict__['callback_pos'] = list(obj.callback_pos or [])
+        self.__dict__['data'] = data
+        self.__dict__['extra_data'] = extra_data
+
+    def __getattr__(self, name):
+        """Refuse the attributes which are not part of the snapshot."""
+        raise AttributeError(
+            "Cannot use {0} of a workflow object in a parallel "
+            "branch.".format(name)
+        )
+
+    def __setattr__(self, name, value):
+        """Only allow replacing ``data`` and ``extra_data``."""
+        if name not in ('data', 'extra_data'):
+            raise AttributeError(
+                "Cannot set {0} of a workflow object in a parallel "
+                "branch.".format(name)
+            )
+        self.__dict__[name] = value
+
+
+class BranchEngine(object):
+    """View of the workflow engine given to the tasks of a branch.
+
+    It holds a snapshot of the identity of the engine and its flow control
+    methods which only raise an exception, such as ``halt``, so that the
+    branches do not share the state of the engine between threads.
+    """
+
+    _methods = ('halt', 'wait', 'stop', 'continue_next_token')
+    _static_methods = ('abort', 'skip_token')
+
+    def __init__(self, eng):
+        """Initialize the view."""
+        self.uuid = eng.uuid
+        self.name = eng.name
+        self.status = eng.status
+        self.id_user = eng.id_user
+        self.log = eng.log
+        self._engine_class = type(eng)
+
+    def __getattr__(self, name):
+        """Return the flow control methods of the engine."""
+        if name in self._static_methods:
+            return getattr(self._engine_class, name)
+        if name in self._methods:
+            return partial(
+                get_unbound_function(getattr(self._engine_class, name)), self
+            )
+        raise AttributeError(
+            "Cannot use {0} of the workflow engine in a parallel "
+            "branch.".format(name)
+        )
+
+
+def _run_branch(app, tasks, branch, eng):
+    """Run the tasks of a branch in order, return its data and extra data."""
+    nested = getattr(_branch_state, 'active', False)
+    with app.app_context():
+        _branch_state.active = True
+        try:
+            for task in tasks:
+                task(branch, eng)
+        finally:
+            _branch_state.active = nested
+            if not nested:
+                db.session.remove()
+    return branch.data, branch.extra_data
+
+
+def _changes(original, updated):
+    """Return the keys set and removed between two values of a mapping.
+
+    A value which is not a mapping is replaced as a whole, under the key
+    ``None``.
+    """
+    if not isinstance(original, dict) or not isinstance(updated, dict):
+        if original == updated:
+            return {}, set()
+        return {None: updated}, set()
+    changed = dict(
+        (key, value) for key, value in updated.items()
+        if key not in original or original[key] != value
+    )
+    return changed, set(original) - set(updated)
+
+
+def _merge(eng, obj, name, results):
+    """Apply the changes of the branches to an attribute of the object.
+
+    The branches are merged in the order of the definition, the changes of a
+    later branch overriding those of earlier ones on the same key.
+    """
+    original = getattr(obj, name)
+    merged = copy.deepcopy(original)
+    owners = {}
+    for index, updated in enumerate(results):
+        changed, removed = _changes(original, updated)
+        for key in set(changed) | removed:
+            if key in owners:
+                eng.log.warning(
+                    "Parallel branches %s and %s both changed %s[%r].",
+                    owners[key], index, name, key
+                )
+            owners[key] = index
+        if None in changed:
+            merged = changed[None]
+            continue
+        for key in removed:
+            merged.pop(key, None)
+        merged.update(changed)
+    setattr(obj, name, merged)
+
+
+def _run_parallel(branches, obj, eng):
+    """Run the branches over an object and merge their results."""
+    app = current_app._get_current_object()
+    # Everything the branches read is taken here, in the thread of the
+    # engine.
+    branch_eng = eng if isinstance(eng, BranchEngine) else BranchEngine(eng)
+    arguments = [
+        (app, tasks, BranchObject(obj, copy.deepcopy(obj.data),
+                                  copy.deepcopy(obj.extra_data)),
+         branch_eng)
+        for tasks in branches
+    ]
+    if getattr(_branch_state, 'active', False):
+        # Nested in a branch, which already holds a thread of the pool.
+        calls = [partial(_run_branch, *args) for args in arguments]
+    else:
+        executor = app.extensions['invenio-workflows'].parallel_executor
+        calls = [executor.submit(_run_branch, *args).result
+                 for args in arguments]
+    outcomes = []
+    for call in calls:
+        try:
+            outcomes.append((call(), None))
+        except Exception:  # pylint: disable=broad-except
+            outcomes.append((None, sys.exc_info()))
+
+    for _, exc_info in outcomes:
+        if exc_info is not None:
+            # The first error in the definition order wins.
+            reraise(*exc_info)
+
+    _merge(eng, obj, 'data', [result[0] for result, _ in outcomes])
+    _merge(eng, obj, 'extra_data', [result[1] for result, _ in outcomes])
+
+
+def parallel(branches):
+    """Run branches of a workflow concurrently over the same object.
+
+    Each branch is a task, or a list of tasks run in order, and is run in a
+    thread of a pool of ``WORKFLOWS_PARALLEL_MAX_WORKERS`` threads, with its
+    own application context and database session. The branches work on
+    copies of ``data`` and ``extra_data``, and their changes are merged into
+    the object once all of them finished, in the order of the definition.
+
+    The construct is a single task of the workflow, so ``callback_pos``
+    points to it and a restart runs all the branches again. If branches
+    fail, or halt the object, the exception of the first of them in the
+    definition order is raised. The branches must not use flow control
+    patterns, such as ``IF_ELSE``, which move the engine position.
+
+    :param branches: the tasks or lists of tasks to run.
+    :type branches: list
+
+    :return: the task running the branches.
+    """
+    branches = tuple(
+        tuple(branch) if isinstance(branch, (list, tuple)) else (branch,)
+        for branch in branches
+    )
+    run_branches = partial(_run_parallel, branches)
+
+    def _parallel(obj, eng):
+        run_branches(obj, eng)
+    _parallel.description = 'Run in parallel: {0}'.format(', '.join(
+        ' > '.join(task.__name__ for task in tasks) for tasks in branches
+    ))
+    return _parallel
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Workers running the workflows queued in the database.
+
+Jobs are stored in the ``workflows_job`` table, in the same database and
+transactions as the workflow objects, and claimed in batches with
+``SELECT ... FOR UPDATE SKIP LOCKED``. On backends without row locks, such as
+SQLite, the claim relies on a conditional ``UPDATE`` only.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from invenio_db import db
+from sqlalchemy import or_
+
+from .concurrency import concurrency_slot
+from .errors import WorkflowsConcurrencyLimitReached, WorkflowsObjectLeased
+from .leases import object_lease
+from .models import WorkflowJob
+from .proxies import workflow_object_class
+
+
+def enqueue(object_id, action, workflow_name=None,
+            restart_point='continue_next'):
+    """Queue a workflow run for an object.
+
+    :param object_id: id of the WorkflowObject to run.
+    :type object_id: int
+
+    :param action: one of ``start``, ``resume`` or ``restart``.
+    :type action: str
+
+    :param workflow_name: name of the workflow to start.
+    :type workflow_name: str
+
+    :param restart_point: where to resume the workflow from.
+    :type restart_point: str
+
+    :return: the WorkflowJob, added to the session.
+    """
+    job = WorkflowJob(
+        id_object=object_id,
+        action=action,
+        workflow_name=workflow_name if action == 'start' else None,
+        restart_point=restart_point if action == 'resume' else None,
+    )
+    db.session.add(job)
+    return job
+
+
+def claim_jobs(worker_id, batch_size, lease):
+    """Lease up to ``batch_size`` available jobs to a worker.
+
+    A job is available if it is not leased or if its lease expired.
+
+    :param worker_id: identifier of the claiming worker.
+    :type worker_id: str
+
+    :param batch_size: maximum number of jobs claimed.
+    :type batch_size: int
+
+    :param lease: duration of the lease in seconds.
+    :type lease: int
+
+    :return: list of the claimed WorkflowJob, ordered by id.
+    """
+    now = datetime.now()
+    available = or_(
+        WorkflowJob.lease_expires == None,  # noqa
+        WorkflowJob.lease_expires < now,
+    )
+    ids = [row[0] for row in db.session.query(WorkflowJob.id).filter(
+        available
+    ).order_by(WorkflowJob.id).limit(batch_size).with_for_update(
+        skip_locked=True
+    )]
+    if ids:
+        # The condition is checked again, in case another worker claimed
+        # some of these jobs in the meantime on backends without row locks.
+        WorkflowJob.query.filter(WorkflowJob.id.in_(ids), available).update({
+            WorkflowJob.lease_owner: worker_id,
+            WorkflowJob.lease_expires: now + timedelta(seconds=lease),
+            WorkflowJob.attempts: WorkflowJob.attempts + 1,
+        }, synchronize_session=False)
+    db.session.commit()
+    if not ids:
+        return []
+    return WorkflowJob.query.filter(
+        WorkflowJob.id.in_(ids),
+        WorkflowJob.lease_owner == worker_id,
+    ).order_by(WorkflowJob.id).all()
+
+
+def run_job(job):
+    """Run the workflow of a job.
+
+    :param job: the job to run.
+    :type job: WorkflowJob
+
+    :return: WorkflowEngine instance
+    """
+    from .worker_engine import continue_worker, restart_worker, run_worker
+
+    if job.action == 'resume':
+        return continue_worker(job.id_object, job.restart_point)
+
+    obj = workflow_object_class.get(job.id_object)
+    if job.action == 'restart':
+        return restart_worker(obj.id_workflow, data=[obj])
+    return run_worker(job.workflow_name, [obj])
+
+
+class QueueWorker(object):
+    """Poll the database for queued jobs and run them.
+
+    Starts of a workflow over its concurrency limit, and jobs whose object
+    is processed by another worker, are postponed by
+    ``WORKFLOWS_CONCURRENCY_RETRY_DELAY`` seconds.
+
+    .. code-block:: python
+
+        QueueWorker().run()
+    """
+
+    def __init__(self, worker_id=None, batch_size=None, lease=None,
+                 poll_interval=None, max_attempts=None):
+        """Initialize the worker, using the configuration as defaults."""
+        config = current_app.config
+        self.worker_id = worker_id or '{0}:{1}:{2}'.format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+        )
+        self.batch_size = batch_size or config['WORKFLOWS_QUEUE_BATCH_SIZE']
+        self.lease = lease or config['WORKFLOWS_QUEUE_LEASE']
+        self.poll_interval = poll_interval or \
+            config['WORKFLOWS_QUEUE_POLL_INTERVAL']
+        self.max_attempts = max_attempts or \
+            config['WORKFLOWS_QUEUE_MAX_ATTEMPTS']
+
+    def _renew(self, jobs):
+        """Extend the lease of the given jobs, return those still owned."""
+        ids = [job.id for job in jobs]
+        WorkflowJob.query.filter(
+            WorkflowJob.id.in_(ids),
+            WorkflowJob.lease_owner == self.worker_id,
+        ).update({
+            WorkflowJob.lease_expires:
+                datetime.now() + timedelta(seconds=self.lease),
+        }, synchronize_session=False)
+        db.session.commit()
+        return set(row[0] for row in db.session.query(WorkflowJob.id).filter(
+            WorkflowJob.id.in_(ids),
+            WorkflowJob.lease_owner == self.worker_id,
+        ))
+
+    def _postpone(self, job_id):
+        """Release a job which cannot run yet, without counting an attempt."""
+        WorkflowJob.query.filter_by(
+            id=job_id, lease_owner=self.worker_id
+        ).update({
+            WorkflowJob.lease_owner: None,
+            WorkflowJob.lease_expires: datetime.now() + timedelta(
+                seconds=current_app.config['WORKFLOWS_CONCURRENCY_RETRY_DELAY']
+            ),
+            WorkflowJob.attempts: WorkflowJob.attempts - 1,
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def _finish(self, job):
+        """Remove a job once run."""
+        WorkflowJob.query.filter_by(
+            id=job.id, lease_owner=self.worker_id
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.expunge(job)
+
+    def run_once(self):
+        """Claim a batch of jobs and run them.
+
+        :return: number of jobs run.
+        """
+        jobs = claim_jobs(self.worker_id, self.batch_size, self.lease)
+        processed = 0
+        for index, job in enumerate(jobs):
+            job_id = job.id
+            if job_id not in self._renew(jobs[index:]):
+                # Our lease expired and another worker took the job.
+                continue
+            if job.attempts > self.max_attempts:
+                current_app.logger.error(
+                    "Dropping job %s of object %s after %s attempts.",
+                    job_id, job.id_object, job.attempts - 1
+                )
+                self._finish(job)
+                continue
+            try:
+                with object_lease(job.id_object, owner=self.worker_id), \
+                        concurrency_slot(job.workflow_name,
+                                         owner=self.worker_id):
+                    run_job(job)
+            except (WorkflowsConcurrencyLimitReached, WorkflowsObjectLeased):
+                self._postpone(job_id)
+                continue
+            except Exception:  # pylint: disable=broad-except
+                # The error is saved in the object by the engine.
+                db.session.rollback()
+                current_app.logger.exception(
+                    "Job %s of object %s failed.", job_id, job.id_object
+                )
+            self._finish(job)
+            processed += 1
+        return processed
+
+    def run(self, max_jobs=None):
+        """Run jobs until ``max_jobs`` were run, or forever.
+
+        Sleeps ``poll_interval`` seconds whenever the queue is empty.
+
+        :return: number of jobs run.
+        """
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            count = self.run_once()
+            processed += count
+            if not count:
+                time.sleep(self.poll_interval)
+        return processed
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Resume waiting workflow objects at a scheduled time.
+
+A task parks its object until a given time with:
+
+.. code-block:: python
+
+    def check_harvest(obj, eng):
+        if not harvest_ready(obj):
+            eng.wait('Harvest not ready', delay=600)
+
+Once the time is reached, :func:`resume_due_objects` runs the task which
+waited again, e.g. periodically with ``workflows resume-due``.
+"""
+
+from __future__ import absolute_import, print_function
+
+from datetime import datetime
+
+from flask import current_app
+from invenio_db import db
+
+from .models import ObjectStatus
+from .proxies import workflow_object_class
+
+
+def due_objects_query(now=None):
+    """Return a query of the waiting objects whose wake-up time is reached."""
+    model = workflow_object_class.dbmodel
+    return model.query.filter(
+        model.resume_at <= (now or datetime.now()),
+        model.status == ObjectStatus.WAITING,
+    )
+
+
+def _claim(object_id, now):
+    """Clear the wake-up time of a due object, unless already resumed."""
+    model = workflow_object_class.dbmodel
+    claimed = due_objects_query(now).filter(model.id == object_id).update({
+        model.resume_at: None,
+    }, synchronize_session=False)
+    db.session.commit()
+    return bool(claimed)
+
+
+def resume_due_objects(batch_size=100, limit=None, delayed=False):
+    """Resume the waiting objects whose wake-up time is reached.
+
+    The task which waited is run again. Several schedulers can run at once,
+    each object being resumed once.
+
+    :param batch_size: number of due objects fetched at once.
+    :type batch_size: int
+
+    :param limit: maximum number of objects resumed.
+    :type limit: int
+
+    :param delayed: dispatch the objects, see ``WORKFLOWS_DISPATCHER``,
+        instead of running them in the current process.
+    :type delayed: bool
+
+    :return: number of resumed objects.
+    """
+    from .worker_engine import continue_worker
+
+    model = workflow_object_class.dbmodel
+    now = datetime.now()
+    resumed = 0
+    last = None
+    while limit is None or resumed < limit:
+        query = due_objects_query(now).with_entities(model.id)
+        if last is not None:
+            query = query.filter(model.id > last)
+        ids = [row[0] for row in
+               query.order_by(model.id).limit(batch_size).all()]
+        if not ids:
+            break
+        for object_id in ids:
+            last = object_id
+            if limit is not None and resumed >= limit:
+                break
+            if not _claim(object_id, now):
+                continue
+            try:
+                if delayed:
+                    current_app.extensions['invenio-workflows'].dispatcher \
+                        .resume(object_id, 'restart_task')
+                else:
+                    continue_worker(object_id, 'restart_task')
+            except Exception:  # pylint: disable=broad-except
+                # The error is saved in the object by the engine.
+                db.session.rollback()
+                current_app.logger.exception(
+                    "Failed to resume workflow object %s.", object_id
+                )
+            resumed += 1
+    return resumed
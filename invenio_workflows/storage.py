@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Storage backends of the workflows and workflow objects.
+
+:class:`~invenio_workflows.api.WorkflowObject` and
+:class:`~invenio_workflows.engine.WorkflowEngine` create, load and save their
+models through the backend set with ``WORKFLOWS_STORAGE``:
+
+* :class:`SQLStorage`, the default, uses the SQLAlchemy models and the
+  database of Invenio-DB.
+* :class:`SQLiteWALStorage` does the same, setting the write-ahead logging
+  pragmas on the connections of an SQLite database, e.g. for edge workers.
+
+Only these paths go through the backend. The workers, the scheduler, the
+sweeper, the event log, the correlations and the CLI query the SQLAlchemy
+models directly, so the backends must store them in the database of
+Invenio-DB. The in-memory engine of :mod:`invenio_workflows.memory` uses its
+own :class:`~invenio_workflows.memory.MemoryStorage` for its own models.
+"""
+
+from __future__ import absolute_import, print_function
+
+from contextlib import contextmanager
+
+from invenio_db import db
+from sqlalchemy import event
+from sqlalchemy.orm import undefer_group
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import NoResultFound
+
+from .errors import WorkflowsMissingObject
+from .models import PAYLOAD_GROUP, Workflow, WorkflowObjectModel, \
+    versioned_save
+
+
+class SQLStorage(object):
+    """Store workflows and objects with the SQLAlchemy models."""
+
+    def __init__(self, app):
+        """Initialize the backend."""
+        self.app = app
+
+    def create_object(self, model_class, data, **kwargs):
+        """Create and add a new object model.
+
+        :param model_class: the model of the objects.
+        :param data: the data of the object.
+
+        :return: the new model.
+        """
+        with db.session.begin_nested():
+            model = model_class(**kwargs)
+            model.data = data
+            db.session.add(model)
+        return model
+
+    def get_object(self, model_class, id_, with_payload=True):
+        """Return the model of an object.
+
+        :param with_payload: load the JSON columns right away, otherwise they
+            are loaded on first access.
+
+        :raises WorkflowsMissingObject: if there is no such object.
+        """
+        with db.session.no_autoflush:
+            query = model_class.query.filter_by(id=id_)
+            if with_payload:
+                query = query.options(undefer_group(PAYLOAD_GROUP))
+            try:
+                return query.one()
+            except NoResultFound:
+                raise WorkflowsMissingObject("No object for for id {0}".format(
+                    id_
+                ))
+
+    def query_objects(self, model_class, *criteria, **filters):
+        """Return the models of the objects matching the criteria.
+
+        Takes the arguments of ``filter`` and ``filter_by``, and
+        ``with_payload``.
+        """
+        with_payload = filters.pop('with_payload', True)
+        query = model_class.query.filter(*criteria).filter_by(**filters)
+        if with_payload:
+            query = query.options(undefer_group(PAYLOAD_GROUP))
+        return query.all()
+
+    @contextmanager
+    def saving(self, model, json_columns=()):
+        """Save the changes made to a model in the block.
+
+        :param json_columns: attributes of the JSON columns which may have
+            been modified in place.
+
+        :raises WorkflowsVersionConflict: if the model was modified
+            concurrently.
+        """
+        with versioned_save(model):
+            yield
+            for column in json_columns:
+                flag_modified(model, column)
+
+    def get_workflow(self, uuid):
+        """Return the model of a workflow, or None."""
+        return Workflow.query.get(uuid)
+
+    def get_workflow_objects(self, uuid):
+        """Return the models of the top-level objects of a workflow.
+
+        They are about to be run, so their JSON columns are loaded right away.
+        """
+        return WorkflowObjectModel.query.filter(
+            WorkflowObjectModel.id_workflow == uuid,
+            WorkflowObjectModel.id_parent == None,  # noqa
+        ).options(undefer_group(PAYLOAD_GROUP)).all()
+
+
+class SQLiteWALStorage(SQLStorage):
+    """Store workflows and objects in SQLite with write-ahead logging.
+
+    It is the :class:`SQLStorage` of the application database, which must
+    be SQLite, whose connections are configured with pragmas: write-ahead
+    logging, so that readers do not block the writer, ``synchronous=NORMAL``
+    which only syncs at checkpoints, and a wait of up to
+    ``WORKFLOWS_SQLITE_BUSY_TIMEOUT`` milliseconds for locks. Each connection
+    is configured when first checked out of the pool.
+    """
+
+    def __init__(self, app):
+        """Initialize the backend and configure the connections."""
+        super(SQLiteWALStorage, self).__init__(app)
+        with app.app_context():
+            engine = db.get_engine(app)
+        if engine.dialect.name != 'sqlite':
+            raise RuntimeError(
+                'SQLiteWALStorage needs an SQLite database, not {0}.'.format(
+                    engine.dialect.name
+                )
+            )
+        event.listen(engine, 'checkout', self._configure)
+
+    def _configure(self, dbapi_connection, connection_record,
+                   connection_proxy):
+        """Set the pragmas of a connection, once."""
+        if connection_record.info.get('workflows_wal'):
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout={0:d}'.format(
+            self.app.config['WORKFLOWS_SQLITE_BUSY_TIMEOUT']
+        ))
+        cursor.close()
+        connection_record.info['workflows_wal'] = True
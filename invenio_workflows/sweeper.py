@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Recover workflow objects left running by dead workers.
+
+Running objects record a heartbeat between callbacks. Objects whose last
+heartbeat is older than ``WORKFLOWS_STALLED_TIMEOUT`` are run again from the
+task their last run started with.
+
+.. code-block:: python
+
+    recovered = recover_stalled_objects()
+"""
+
+from __future__ import absolute_import, print_function
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from invenio_db import db
+from sqlalchemy import or_
+
+from .models import ObjectStatus
+from .proxies import workflow_object_class
+
+
+def stalled_objects_query(timeout=None):
+    """Return a query of the running objects without recent heartbeat.
+
+    Objects whose lease is still valid are not considered stalled.
+
+    :param timeout: seconds without heartbeat, ``WORKFLOWS_STALLED_TIMEOUT``
+        by default.
+    :type timeout: int
+    """
+    if timeout is None:
+        timeout = current_app.config['WORKFLOWS_STALLED_TIMEOUT']
+    model = workflow_object_class.dbmodel
+    now = datetime.now()
+    return model.query.filter(
+        model.status == ObjectStatus.RUNNING,
+        or_(
+            model.heartbeat == None,  # noqa
+            model.heartbeat < now - timedelta(seconds=timeout),
+        ),
+        or_(
+            model.lease_expires == None,  # noqa
+            model.lease_expires < now,
+        ),
+    )
+
+
+def _claim(object_id, timeout):
+    """Touch the heartbeat of a stalled object, unless already recovered."""
+    model = workflow_object_class.dbmodel
+    claimed = stalled_objects_query(timeout).filter(
+        model.id == object_id
+    ).update({
+        model.heartbeat: datetime.now(),
+    }, synchronize_session=False)
+    db.session.commit()
+    return bool(claimed)
+
+
+def recover_stalled_objects(timeout=None, batch_size=100, limit=None,
+                            delayed=False):
+    """Run the stalled objects again from the task their last run started with.
+
+    The changes of a dead run are rolled back, so its tasks run again. Several
+    sweepers can run at once, each object being recovered once.
+
+    :param timeout: seconds without heartbeat, ``WORKFLOWS_STALLED_TIMEOUT``
+        by default.
+    :type timeout: int
+
+    :param batch_size: number of stalled objects fetched at once.
+    :type batch_size: int
+
+    :param limit: maximum number of objects recovered.
+    :type limit: int
+
+    :param delayed: dispatch the objects, see ``WORKFLOWS_DISPATCHER``,
+        instead of running them in the current process.
+    :type delayed: bool
+
+    :return: number of recovered objects.
+    """
+    from .worker_engine import continue_worker
+
+    model = workflow_object_class.dbmodel
+    recovered = 0
+    last = None
+    while limit is None or recovered < limit:
+        query = stalled_objects_query(timeout).with_entities(
+            model.id
+        )
+        if last is not None:
+            query = query.filter(model.id > last)
+        rows = query.order_by(model.id).limit(batch_size).all()
+        if not rows:
+            break
+        for object_id, in rows:
+            last = object_id
+            if limit is not None and recovered >= limit:
+                break
+            if not _claim(object_id, timeout):
+                continue
+            current_app.logger.warning(
+                "Recovering stalled workflow object %s.", object_id
+            )
+            try:
+                if delayed:
+                    current_app.extensions['invenio-workflows'].dispatcher \
+                        .resume(object_id, 'restart_task')
+                else:
+                    continue_worker(object_id, 'restart_task')
+            except Exception:  # pylint: disable=broad-except
+                # The error is saved in the object by the engine.
+                db.session.rollback()
+                current_app.logger.exception(
+                    "Failed to recover workflow object %s.", object_id
+                )
+            recovered += 1
+    return recovered
@@ -22,10 +22,26 @@
 from __future__ import absolute_import, print_function
 
 from celery import shared_task
+from flask import current_app
 from six import text_type
 from sqlalchemy.exc import OperationalError
 
-from .errors import WorkflowsMissingData, WorkflowsMissingObject
+from .errors import WorkflowsConcurrencyLimitReached, WorkflowsMissingData, \
+    WorkflowsMissingObject, WorkflowsObjectLeased
+
+
+def _skip_leased(task, error):
+    """Skip or retry a task whose object is processed by another worker.
+
+    Tasks called directly, outside of Celery, raise the error instead.
+    """
+    delay = current_app.config['WORKFLOWS_LEASE_RETRY_DELAY']
+    if task.request.called_directly:
+        raise error
+    if delay is None:
+        current_app.logger.info("Skipping task %s: %s", task.request.id, error)
+        return None
+    raise task.retry(exc=error, countdown=delay)
 
 
 @shared_task(
@@ -52,6 +68,11 @@ def start(self, workflow_name, data=None, object_id=None, **kwargs):
     access the ``start.delay`` function to enqueue the execution of the
     workflow asynchronously.
 
+    If the workflow has a limit in ``WORKFLOWS_CONCURRENCY_LIMITS`` which is
+    reached, the task is retried later. If ``object_id`` is given and the
+    object is processed by another worker, the task is skipped, see
+    ``WORKFLOWS_LEASE_RETRY_DELAY``.
+
     :param workflow_name: the workflow name to run. Ex: "my_workflow".
     :type workflow_name: str
 
@@ -64,6 +85,8 @@ def start(self, workflow_name, data=None, object_id=None, **kwargs):
 
     :return: UUID of the workflow engine that ran the workflow.
     """
+    from .concurrency import concurrency_slot
+    from .leases import object_lease
     from .proxies import workflow_object_class
     from .worker_engine import run_worker
 
@@ -81,11 +104,23 @@ def start(self, workflow_name, data=None, object_id=None, **kwargs):
         if not isinstance(data, (list, tuple)):
             data = [data]
 
-    return text_type(run_worker(workflow_name, data, **kwargs).uuid)
-
-
-@shared_task
-def resume(oid, restart_point="continue_next", **kwargs):
+    try:
+        with object_lease(object_id), concurrency_slot(workflow_name):
+            return text_type(run_worker(workflow_name, data, **kwargs).uuid)
+    except WorkflowsObjectLeased as e:
+        return _skip_leased(self, e)
+    except WorkflowsConcurrencyLimitReached as e:
+        raise self.retry(
+            exc=e,
+            countdown=current_app.config['WORKFLOWS_CONCURRENCY_RETRY_DELAY'],
+            max_retries=current_app.config[
+                'WORKFLOWS_CONCURRENCY_MAX_RETRIES'
+            ],
+        )
+
+
+@shared_task(bind=True)
+def resume(self, oid, restart_point="continue_next", **kwargs):
     """Continue workflow for given WorkflowObject id (oid).
 
     Depending on `start_point` it may start from previous, current or
@@ -104,10 +139,21 @@ def resume(oid, restart_point="continue_next", **kwargs):
         * restart_task: will restart the current task
     :type start_point: str
 
+    If the object is processed by another worker, the task is skipped, see
+    ``WORKFLOWS_LEASE_RETRY_DELAY``.
+
     :return: UUID of the workflow engine that ran the workflow.
     """
+    from .leases import object_lease
     from .worker_engine import continue_worker
-    return text_type(continue_worker(oid, restart_point, **kwargs).uuid)
+
+    try:
+        with object_lease(oid):
+            return text_type(
+                continue_worker(oid, restart_point, **kwargs).uuid
+            )
+    except WorkflowsObjectLeased as e:
+        return _skip_leased(self, e)
 
 
 @shared_task
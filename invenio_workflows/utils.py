@@ -20,7 +20,14 @@
 """Various utility functions for use across the workflows module."""
 
 import datetime
+import hashlib
+import json
+import os
 import socket
+import threading
+import traceback
+from collections import OrderedDict
+from functools import wraps
 
 from six import text_type, string_types
 
@@ -88,6 +95,48 @@ def get_workflow_info(func_list):
     return funcs
 
 
+def get_error_fingerprint(exc_info):
+    """Return a fingerprint identifying an exception and where it happened.
+
+    The fingerprint is computed from the type of the exception and the file
+    and function names of the frames of its traceback. Messages and line
+    numbers are left out, so that the same error raised for different
+    objects, or after unrelated changes to the code, shares a fingerprint.
+
+    :param exc_info: exception info as returned by ``sys.exc_info()``.
+    :type exc_info: tuple
+
+    :return: hexadecimal SHA-1 digest.
+    """
+    exc_type, _, exc_traceback = exc_info
+    parts = ['{0}.{1}'.format(exc_type.__module__, exc_type.__name__)]
+    for filename, _, name, _ in traceback.extract_tb(exc_traceback):
+        parts.append('{0}:{1}'.format(os.path.basename(filename), name))
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def get_content_hash(data, extra_data=None):
+    """Return a digest of the content of a workflow object.
+
+    The keys of ``extra_data`` starting with an underscore hold the state of
+    the engine, such as ``_task_history``, and are left out.
+
+    :param data: the data of the object.
+    :param extra_data: the extra data of the object.
+
+    :return: hexadecimal SHA-1 digest.
+    """
+    extra_data = dict(
+        (key, value) for key, value in (extra_data or {}).items()
+        if not key.startswith('_')
+    )
+    content = json.dumps(
+        {'data': data, 'extra_data': extra_data},
+        sort_keys=True, separators=(',', ':'), default=text_type,
+    )
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
 def obj_or_import_string(value, default=None):
     """Import string or return object."""
     if isinstance(value, string_types):
@@ -95,3 +144,87 @@ def obj_or_import_string(value, default=None):
     elif value:
         return value
     return default
+
+
+class LRUCache(object):
+    """Thread-safe mapping evicting the least recently used entries."""
+
+    def __init__(self, maxsize=128):
+        """Initialize the cache.
+
+        :param maxsize: maximum number of entries kept.
+        :type maxsize: int
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value for ``key``, marking it as recently used."""
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used if full."""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        """Check if ``key`` is cached, without marking it as used."""
+        return key in self._data
+
+    def __len__(self):
+        """Return the number of entries."""
+        return len(self._data)
+
+
+def retry_on_conflict(retries=3):
+    """Run a function again when it hits a concurrent modification.
+
+    The session is rolled back before each new attempt, so the decorated
+    function must load the objects it changes itself:
+
+    .. code-block:: python
+
+        @retry_on_conflict(retries=5)
+        def tag(object_id):
+            obj = WorkflowObject.get(object_id)
+            obj.extra_data['tagged'] = True
+            obj.save()
+            db.session.commit()
+
+    :param retries: number of new attempts before giving up.
+    :type retries: int
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            from invenio_db import db
+            from sqlalchemy.orm.exc import StaleDataError
+
+            from .errors import WorkflowsVersionConflict
+
+            attempt = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except (WorkflowsVersionConflict, StaleDataError):
+                    db.session.rollback()
+                    if attempt >= retries:
+                        raise
+                    attempt += 1
+        return wrapper
+    return decorator
@@ -20,6 +20,7 @@
 
 import uuid
 
+from flask import current_app
 from invenio_db import db
 
 from .engine import WorkflowEngine
@@ -171,6 +172,8 @@ def get_workflow_object_instances(data, engine):
                     data_object.status = data_object.known_statuses.INITIAL
 
             workflow_objects.append(data_object)
+        elif is_duplicate(data_object, engine.name):
+            continue
         else:
             # Data is not already a WorkflowObject, we then
             # add the running object to run through the workflow.
@@ -184,6 +187,32 @@ def get_workflow_object_instances(data, engine):
     return workflow_objects
 
 
+def is_duplicate(data_object, workflow_name):
+    """Check if data should be skipped as a duplicate.
+
+    Only applies to the workflows listed in ``WORKFLOWS_SKIP_DUPLICATES``.
+
+    :param data_object: the data to start the workflow on.
+
+    :param workflow_name: name of the workflow to start.
+    :type workflow_name: str
+
+    :return: True if identical data is already in flight in the workflow.
+    """
+    if workflow_name not in current_app.config['WORKFLOWS_SKIP_DUPLICATES']:
+        return False
+    duplicate = workflow_object_class.find_in_flight(
+        data_object, workflow_name
+    )
+    if duplicate is None:
+        return False
+    current_app.logger.info(
+        "Skipping data identical to object %s of workflow '%s'.",
+        duplicate.id, workflow_name
+    )
+    return True
+
+
 def create_data_object_from_data(data_object, engine, data_type):
     """Create a new WorkflowObject from given data and return it.
 
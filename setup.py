@@ -56,6 +56,9 @@ EXTRAS_REQUIRE = {
     'sqlite': [
         'invenio-db[versioning]',
     ],
+    'zstd': [
+        'zstandard>=0.8.0',
+    ],
 }
 
 EXTRAS_REQUIRE['all'] = []
@@ -72,6 +75,7 @@ INSTALL_REQUIRES = [
     'Flask-CLI>=0.2.1',
     'flask-celeryext>=0.1.0',
     'blinker>=1.4',
+    'futures>=3.0.0;python_version=="2.7"',
     'invenio-files-rest>=1.0.0a3',
     'invenio-records-files>=1.0.0a5',
     'workflow~=2.0,>=2.0.1',
@@ -115,6 +119,9 @@ setup(
         'invenio_db.models': [
             'invenio_workflows = invenio_workflows.models',
         ],
+        'flask.commands': [
+            'workflows = invenio_workflows.cli:workflows',
+        ],
     },
     extras_require=EXTRAS_REQUIRE,
     install_requires=INSTALL_REQUIRES,
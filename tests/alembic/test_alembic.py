@@ -57,3 +57,390 @@ def test_alembic_revision_a26f133d42a9(app, db):
         assert 'workflows_object' not in inspector.get_table_names()
 
     drop_alembic_version_table()
+
+
+def test_alembic_revision_707092694e18(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='707092694e18')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        indexes = [
+            index['name']
+            for index in inspector.get_indexes('workflows_object')
+        ]
+        assert 'ix_workflows_object_id_workflow_id_parent_status' in indexes
+        assert 'ix_workflows_object_status_modified' in indexes
+
+    ext.alembic.downgrade(target='a26f133d42a9')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        indexes = [
+            index['name']
+            for index in inspector.get_indexes('workflows_object')
+        ]
+        assert 'ix_workflows_object_id_workflow_id_parent_status' \
+            not in indexes
+        assert 'ix_workflows_object_status_modified' not in indexes
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_40dd58bc62f5(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='40dd58bc62f5')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_error_fingerprint' in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='707092694e18')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_error_fingerprint' not in \
+            inspector.get_table_names()
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_bcc3a4f13f8c(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='bcc3a4f13f8c')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_job' in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='40dd58bc62f5')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_job' not in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_1cacacc32e31(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='1cacacc32e31')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_concurrency_slot' in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='bcc3a4f13f8c')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_concurrency_slot' not in \
+            inspector.get_table_names()
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_ca75306e817d(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='ca75306e817d')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        for table in ('workflows_workflow', 'workflows_object'):
+            columns = [
+                column['name'] for column in inspector.get_columns(table)
+            ]
+            assert 'version_id' in columns
+
+    ext.alembic.downgrade(target='1cacacc32e31')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        for table in ('workflows_workflow', 'workflows_object'):
+            columns = [
+                column['name'] for column in inspector.get_columns(table)
+            ]
+            assert 'version_id' not in columns
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_9117c71f61e5(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='9117c71f61e5')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        assert 'lease_owner' in columns
+        assert 'lease_expires' in columns
+
+    ext.alembic.downgrade(target='ca75306e817d')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        assert 'lease_owner' not in columns
+        assert 'lease_expires' not in columns
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_5ae2e219f3ee(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='5ae2e219f3ee')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        indexes = [
+            index['name']
+            for index in inspector.get_indexes('workflows_object')
+        ]
+        assert 'heartbeat' in columns
+        assert 'ix_workflows_object_status_heartbeat' in indexes
+
+    ext.alembic.downgrade(target='9117c71f61e5')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        assert 'heartbeat' not in columns
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_71a4624fd261(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='71a4624fd261')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        indexes = [
+            index['name']
+            for index in inspector.get_indexes('workflows_object')
+        ]
+        assert 'resume_at' in columns
+        assert 'ix_workflows_object_resume_at' in indexes
+
+    ext.alembic.downgrade(target='5ae2e219f3ee')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        assert 'resume_at' not in columns
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_27d01e7db2dd(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='27d01e7db2dd')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_correlation' in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='71a4624fd261')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_correlation' not in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_5f7d3891bf01(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='5f7d3891bf01')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_event' in inspector.get_table_names()
+        indexes = [index['name'] for index in
+                   inspector.get_indexes('workflows_event')]
+        assert 'ix_workflows_event_to_status_created' in indexes
+        assert 'ix_workflows_event_id_object_id' in indexes
+
+    ext.alembic.downgrade(target='27d01e7db2dd')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_event' not in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_bba9bdede283(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='bba9bdede283')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        indexes = [
+            index['name']
+            for index in inspector.get_indexes('workflows_object')
+        ]
+        assert 'content_hash' in columns
+        assert 'ix_workflows_object_content_hash' in indexes
+
+    ext.alembic.downgrade(target='5f7d3891bf01')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        assert 'content_hash' not in columns
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_54b19f877754(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='54b19f877754')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_task_result' in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='bba9bdede283')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert 'workflows_task_result' not in inspector.get_table_names()
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
+
+
+def test_alembic_revision_453291a5937b(app, db):
+    ext = app.extensions['invenio-db']
+
+    if db.engine.name == 'sqlite':
+        raise pytest.skip('Upgrades are not supported on SQLite.')
+
+    db.drop_all()
+    drop_alembic_version_table()
+
+    ext.alembic.upgrade(target='453291a5937b')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = dict(
+            (column['name'], column)
+            for column in inspector.get_columns('workflows_object')
+        )
+        assert 'data_compressed' in columns
+        assert 'extra_data_compressed' in columns
+        assert columns['data']['nullable']
+        assert 'result_compressed' in [
+            column['name']
+            for column in inspector.get_columns('workflows_task_result')
+        ]
+
+    ext.alembic.downgrade(target='54b19f877754')
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [
+            column['name']
+            for column in inspector.get_columns('workflows_object')
+        ]
+        assert 'data_compressed' not in columns
+
+    ext.alembic.downgrade(target='720ddf51e24b')
+    drop_alembic_version_table()
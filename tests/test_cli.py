@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""CLI tests."""
+
+from __future__ import absolute_import, print_function
+
+from datetime import datetime, timedelta
+
+from click.testing import CliRunner
+from flask_cli import ScriptInfo
+from invenio_db import db
+
+from invenio_workflows import ObjectStatus, Workflow, WorkflowEngine, \
+    WorkflowObject, start
+from invenio_workflows.cli import workflows
+from invenio_workflows.models import WorkflowObjectModel
+
+
+def test_purge(app, demo_workflow, halt_workflow):
+    """Test purge command."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: app)
+
+    with app.app_context():
+        start('demo_workflow', [{"x": 1}, {"x": 2}])
+        start('halttest', [{"x": 3}])
+
+    result = runner.invoke(
+        workflows, ['purge', '--objects', '-s', 'foo', '--yes-i-know'],
+        obj=script_info
+    )
+    assert result.exit_code != 0
+
+    result = runner.invoke(
+        workflows, ['purge', '--objects', '-s', 'completed', '--yes-i-know'],
+        obj=script_info
+    )
+    assert result.exit_code == 0
+    assert 'Deleted 2 workflow objects.' in result.output
+
+    result = runner.invoke(
+        workflows, ['purge', '-s', 'HALTED', '--yes-i-know'], obj=script_info
+    )
+    assert result.exit_code == 0
+    assert 'Deleted 1 workflows.' in result.output
+
+    with app.app_context():
+        assert Workflow.query.count() == 1
+        assert WorkflowObjectModel.query.count() == 0
+
+
+def test_start_status_continue(app, demo_halt_workflow):
+    """Test start, status and continue commands."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: app)
+
+    records = '\n'.join('{"x": %d}' % x for x in (-30, -20, -15, 50))
+    result = runner.invoke(
+        workflows, ['start', 'demo_halt_workflow', '-', '--chunk-size', '3'],
+        input=records + '\n', obj=script_info
+    )
+    assert result.exit_code == 0
+    assert 'Done: 4 objects, 0 failed.' in result.output
+
+    with app.app_context():
+        # Two chunks, thus two workflow engines.
+        assert Workflow.query.count() == 2
+
+    result = runner.invoke(workflows, ['status'], obj=script_info)
+    assert result.exit_code == 0
+    assert 'COMPLETED           1' in result.output
+    assert 'WAITING             3' in result.output
+
+    # The completed object is left alone.
+    result = runner.invoke(
+        workflows, ['continue', '--chunk-size', '2'], obj=script_info
+    )
+    assert result.exit_code == 0
+    assert 'Done: 3 objects, 0 failed.' in result.output
+    assert result.output.count('processed') == 2
+
+    with app.app_context():
+        assert not WorkflowObject.query(status=ObjectStatus.WAITING)
+
+
+def test_restart(app, error_workflow):
+    """Test restart command."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: app)
+
+    result = runner.invoke(
+        workflows, ['start', 'errortest', '-'], input='{"x": 1}\n',
+        obj=script_info
+    )
+    assert result.exit_code == 0
+    assert 'Done: 1 objects, 1 failed.' in result.output
+
+    result = runner.invoke(
+        workflows, ['restart', '-s', 'ERROR'], obj=script_info
+    )
+    assert result.exit_code == 0
+    assert 'Done: 1 workflows, 1 failed.' in result.output
+
+    result = runner.invoke(workflows, ['errors'], obj=script_info)
+    assert result.exit_code == 0
+    assert '2 ZeroDivisionError' in result.output
+
+
+def test_recompress(app):
+    """Test recompress command."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: app)
+
+    with app.app_context():
+        obj = WorkflowObject.create({"x": "foo" * 2000})
+        db.session.commit()
+        obj_id = obj.id
+
+    app.config.update(WORKFLOWS_COMPRESSION='zlib')
+    result = runner.invoke(workflows, ['recompress'], obj=script_info)
+    assert result.exit_code == 0
+    assert 'Done: 1 objects, 0 failed.' in result.output
+
+    with app.app_context():
+        raw = db.session.execute(
+            'SELECT data, data_compressed FROM workflows_object '
+            'WHERE id = :id', {'id': obj_id}
+        ).fetchone()
+        assert raw[0] is None
+        assert bytes(raw[1]).startswith(b'zlib:')
+        assert WorkflowObject.get(obj_id).data == {"x": "foo" * 2000}
+
+
+def test_sweep(app, demo_workflow):
+    """Test the recovery of stalled objects."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: app)
+
+    with app.app_context():
+        eng = WorkflowEngine.with_name('demo_workflow')
+        eng.save()
+        old = datetime.now() - timedelta(hours=1)
+
+        def running(x, callback_pos, heartbeat, lease_expires=None):
+            obj = WorkflowObject.create({'x': x})
+            obj.save(status=ObjectStatus.RUNNING, callback_pos=callback_pos,
+                     id_workflow=eng.uuid)
+            obj.model.heartbeat = heartbeat
+            obj.model.lease_owner = lease_expires and 'other'
+            obj.model.lease_expires = lease_expires
+            return obj.model
+
+        # Died while running its first task, ``add``, or ``add`` again after
+        # a restart, or the task following it.
+        fresh = running(1, [], old)
+        restarted = running(1, [0], old)
+        continued = running(21, [1], old)
+        # Still alive.
+        alive = running(1, [0], datetime.now())
+        leased = running(1, [0], old, datetime.now() + timedelta(hours=1))
+        db.session.commit()
+        ids = [fresh.id, restarted.id, continued.id, alive.id,
+               leased.id]
+
+    result = runner.invoke(workflows, ['sweep'], obj=script_info)
+    assert result.exit_code == 0
+    assert 'Recovered 3 stalled objects.' in result.output
+
+    with app.app_context():
+        objs = [WorkflowObject.get(oid) for oid in ids]
+        assert [obj.status for obj in objs] == [
+            ObjectStatus.COMPLETED, ObjectStatus.COMPLETED,
+            ObjectStatus.COMPLETED, ObjectStatus.RUNNING,
+            ObjectStatus.RUNNING,
+        ]
+        assert objs[0].data == {'x': 19}
+        assert objs[1].data == {'x': 19}
+        assert objs[2].data == {'x': 19}
+
+    result = runner.invoke(workflows, ['sweep'], obj=script_info)
+    assert 'Recovered 0 stalled objects.' in result.output
+
+
+def test_resume_due(app):
+    """Test scheduled wake-ups of waiting objects."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: app)
+
+    def poll(obj, eng):
+        obj.extra_data['polls'] = obj.extra_data.get('polls', 0) + 1
+        if obj.extra_data['polls'] < 2:
+            eng.wait('Not ready', delay=obj.data['delay'])
+
+    class PollTest(object):
+        workflow = [poll]
+
+    app.extensions['invenio-workflows'].register_workflow(
+        'polltest', PollTest
+    )
+    with app.app_context():
+        eng = WorkflowEngine.from_uuid(
+            start('polltest', [{'delay': -1}, {'delay': 3600}])
+        )
+        ids = [obj.id for obj in eng.processed_objects]
+        for obj in eng.processed_objects:
+            assert obj.status == ObjectStatus.WAITING
+            assert obj.model.resume_at is not None
+
+    result = runner.invoke(workflows, ['resume-due'], obj=script_info)
+    assert result.exit_code == 0
+    assert 'Resumed 1 objects.' in result.output
+
+    with app.app_context():
+        due, later = [WorkflowObject.get(oid) for oid in ids]
+        assert due.status == ObjectStatus.COMPLETED
+        assert due.extra_data['polls'] == 2
+        assert due.model.resume_at is None
+        assert later.status == ObjectStatus.WAITING
+        assert later.extra_data['polls'] == 1
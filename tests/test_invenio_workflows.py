@@ -27,6 +27,8 @@
 
 from __future__ import absolute_import, print_function
 
+import threading
+
 import pytest
 
 from flask import Flask
@@ -34,10 +36,18 @@ from invenio_db import db
 from workflow.engine_db import WorkflowStatus
 from workflow.errors import WorkflowDefinitionError
 
-from invenio_workflows import InvenioWorkflows, WorkflowEngine, \
+from invenio_workflows import InvenioWorkflows, ObjectStatus, WorkflowEngine, \
     WorkflowObject, restart, resume, start
 from invenio_workflows.errors import WorkflowsMissingData, \
     WorkflowsMissingObject
+from invenio_workflows.correlation import _claim, wake
+from invenio_workflows.events import percentiles, record_transition, \
+    throughput, time_in_status, time_to_status
+from invenio_workflows.memoize import memoize_task
+from invenio_workflows.models import ErrorFingerprint, WorkflowCorrelation, \
+    WorkflowEvent, WorkflowTaskResult
+from invenio_workflows.patterns import parallel
+from invenio_workflows.worker_engine import run_worker
 
 
 def test_version():
@@ -183,3 +193,330 @@ def test_errors(app, error_workflow):
 
         assert obj.known_statuses.ERROR == obj.status
         assert obj.data == {"id": 0, "foo": "bar"}
+
+
+def test_error_fingerprints(app, error_workflow):
+    """Test deduplication of errors by fingerprint."""
+    with app.app_context():
+        objs = [WorkflowObject.create({"id": x}) for x in range(2)]
+        db.session.commit()
+
+        for obj in objs:
+            with pytest.raises(ZeroDivisionError):
+                start('errortest', object_id=obj.id)
+
+        error = ErrorFingerprint.query.one()
+        assert error.count == 2
+        assert error.exc_type == 'ZeroDivisionError'
+        assert 'Traceback' in error.traceback
+        assert 'error_engine' in error.traceback
+
+        for obj in objs:
+            obj = WorkflowObject.get(obj.id)
+            assert obj.extra_data['_error_fingerprint'] == error.fingerprint
+            assert obj.extra_data['_error_msg'].startswith('Traceback')
+            assert error.message in obj.extra_data['_error_msg']
+            assert error.message.startswith('ZeroDivisionError')
+
+
+def test_wake(app):
+    """Test waking waiting objects by correlation key."""
+    def wait_for_ticket(obj, eng):
+        eng.wait('Waiting for ticket', correlation_key=obj.data['ticket'])
+
+    def approve(obj, eng):
+        obj.data['approved'] = obj.extra_data['_wake_payload']['approved']
+
+    class TicketTest(object):
+        workflow = [wait_for_ticket, approve]
+
+    app.extensions['invenio-workflows'].register_workflow(
+        'tickettest', TicketTest
+    )
+    with app.app_context():
+        eng = WorkflowEngine.from_uuid(start('tickettest', [
+            {'ticket': 'T-1'}, {'ticket': 'T-1'}, {'ticket': 'T-2'},
+        ]))
+        ids = [obj.id for obj in eng.processed_objects]
+        assert WorkflowCorrelation.query.count() == 3
+
+        assert wake('T-1', payload={'approved': True}) == ids[:2]
+        assert wake('T-1') == []
+        objs = [WorkflowObject.get(oid) for oid in ids]
+        assert [obj.status for obj in objs] == [
+            ObjectStatus.COMPLETED, ObjectStatus.COMPLETED,
+            ObjectStatus.WAITING,
+        ]
+        assert objs[0].data['approved'] is True
+        assert '_correlation_key' not in objs[0].extra_data
+
+        # Objects continued by other means are no longer waiting.
+        objs[2].continue_workflow('restart_task')
+        assert WorkflowCorrelation.query.count() == 1
+        assert wake('T-2', payload={'approved': False}, delayed=True) == \
+            [ids[2]]
+        obj = WorkflowObject.get(ids[2])
+        assert obj.status == ObjectStatus.COMPLETED
+        assert obj.data['approved'] is False
+
+        # Keys removed by a concurrent call are not claimed again.
+        eng = WorkflowEngine.from_uuid(start('tickettest', [
+            {'ticket': 'T-3'}, {'ticket': 'T-3'},
+        ]))
+        ids = [obj.id for obj in eng.processed_objects]
+        WorkflowCorrelation.query.filter_by(id_object=ids[0]).delete()
+        assert _claim('T-3', ids) == [ids[1]]
+
+
+def test_event_log(app):
+    """Test the log of the status transitions."""
+    def wait_for_ticket(obj, eng):
+        if 'ticket' not in obj.extra_data:
+            eng.wait('Waiting for ticket')
+
+    class EventTest(object):
+        workflow = [wait_for_ticket]
+
+    app.extensions['invenio-workflows'].register_workflow(
+        'eventtest', EventTest
+    )
+    with app.app_context():
+        eng = WorkflowEngine.from_uuid(start('eventtest', [{}, {}]))
+        ids = [obj.id for obj in eng.processed_objects]
+        obj = WorkflowObject.get(ids[0])
+        obj.extra_data['ticket'] = 'T-1'
+        obj.save()
+        db.session.commit()
+        obj.continue_workflow('restart_task')
+
+        events = WorkflowEvent.query.filter_by(
+            id_object=ids[0]
+        ).order_by(WorkflowEvent.id).all()
+        transitions = [(event.from_status, event.to_status)
+                       for event in events]
+        assert transitions == [
+            (ObjectStatus.INITIAL, ObjectStatus.RUNNING),
+            (ObjectStatus.RUNNING, ObjectStatus.WAITING),
+            (ObjectStatus.WAITING, ObjectStatus.RUNNING),
+            (ObjectStatus.RUNNING, ObjectStatus.COMPLETED),
+        ]
+        assert events[1].task == 'wait_for_ticket'
+        assert events[1].id_workflow == eng.uuid
+
+        assert throughput(ObjectStatus.WAITING) == 2
+        assert throughput(ObjectStatus.COMPLETED) == 1
+        waited = time_in_status(ObjectStatus.WAITING)
+        assert len(waited) == 1 and waited[0] >= 0
+        assert len(time_to_status(ObjectStatus.COMPLETED)) == 1
+
+        # Events of rolled back transactions are not written.
+        obj = WorkflowObject.get(ids[1])
+        record_transition(obj, ObjectStatus.ERROR)
+        db.session.rollback()
+        db.session.commit()
+        assert WorkflowEvent.query.filter_by(id_object=ids[1]).count() == 2
+
+
+def test_percentiles():
+    """Test nearest-rank percentiles."""
+    values = list(range(1, 101))
+    assert percentiles(values) == {50: 50, 90: 90, 99: 99}
+    assert percentiles([3], points=(0, 100)) == {0: 3, 100: 3}
+    assert percentiles([]) == {50: None, 90: None, 99: None}
+
+
+def test_release(app, demo_workflow):
+    """Test removing completed objects from the session during a run."""
+    with app.app_context():
+        # Nothing is removed by default.
+        obj = WorkflowObject.create({'x': 1})
+        start('demo_workflow', [obj])
+        assert obj.model in db.session
+        assert obj.workflow.name == 'demo_workflow'
+        assert obj.get_action() is None
+        assert obj.get_current_task_info()['name'] == 'reduce'
+
+        app.config['WORKFLOWS_EXPUNGE_COMPLETED'] = True
+        app.config['WORKFLOWS_IDENTITY_MAP_LIMIT'] = 1000
+        eng = run_worker('demo_workflow', [{'x': 1}, {'x': 2}])
+        assert eng.memory_stats['expunged_objects'] == 2
+        assert eng.memory_stats['identity_map_peak'] >= 2
+        assert eng.memory_stats['max_rss'] >= \
+            eng.memory_stats['max_rss_start']
+        assert not any(obj.model in db.session for obj in eng.objects)
+        # Released objects are reloaded when accessed.
+        assert [obj.data['x'] for obj in eng.objects] == [19, 20]
+        assert all(obj.status == ObjectStatus.COMPLETED
+                   for obj in eng.objects)
+
+        # Models loaded by the caller are kept.
+        unrelated = WorkflowObject.create({'x': 0}).model
+        db.session.commit()
+        app.config['WORKFLOWS_EXPUNGE_COMPLETED'] = False
+        app.config['WORKFLOWS_IDENTITY_MAP_LIMIT'] = 0
+        eng = run_worker('demo_workflow', [{'x': 3}])
+        assert eng.memory_stats['expunged_objects'] == 0
+        assert eng.objects[0].model not in db.session
+        assert eng.model in db.session
+        assert unrelated in db.session
+        assert eng.objects[0].data['x'] == 21
+
+
+def test_memoize_task(app):
+    """Test skipping memoized tasks whose result is cached."""
+    calls = []
+
+    @memoize_task(version=1)
+    def classify(obj, eng):
+        calls.append(obj.data['x'])
+        obj.data['x'] *= 2
+        obj.extra_data['category'] = 'even'
+
+    def add(obj, eng):
+        obj.data['x'] += 1
+
+    class MemoizeTest(object):
+        workflow = [classify, add]
+
+    app.extensions['invenio-workflows'].register_workflow(
+        'memoize_workflow', MemoizeTest
+    )
+    with app.app_context():
+        eng = run_worker('memoize_workflow', [{'x': 1}, {'x': 1}])
+        assert calls == [1]
+        assert [obj.data['x'] for obj in eng.objects] == [3, 3]
+        assert all(obj.extra_data['category'] == 'even'
+                   for obj in eng.objects)
+        assert all(obj.extra_data['_last_task_name'] == 'add'
+                   for obj in eng.objects)
+        assert WorkflowTaskResult.query.count() == 0
+
+        app.config['WORKFLOWS_TASK_CACHE_DB'] = True
+        run_worker('memoize_workflow', [{'x': 2}])
+        assert calls == [1, 2]
+        assert WorkflowTaskResult.query.count() == 1
+
+        # Another process only finds it in the database.
+        app.extensions['invenio-workflows'].task_cache.clear()
+        eng = run_worker('memoize_workflow', [{'x': 2}])
+        assert calls == [1, 2]
+        assert eng.objects[0].data['x'] == 5
+
+        # Results which are not JSON serializable are refused.
+        cache = app.extensions['invenio-workflows'].task_cache
+        with pytest.raises(TypeError):
+            cache.set('key', 'task', {'data': object(), 'extra_data': {}})
+        assert cache.get('key') is None
+
+
+def test_memoize_task_factory(app):
+    """Test telling apart the memoized tasks made by a factory."""
+    def set_field(value, key=None):
+        @memoize_task(key=key)
+        def _set_field(obj, eng):
+            obj.data['field'] = value
+        return _set_field
+
+    assert set_field(1).memoize_key != set_field(2).memoize_key
+    # Values which are not JSON serializable cannot tell the tasks apart.
+    assert set_field(object()).memoize_key is None
+    assert set_field(object(), key='c').memoize_key is not None
+    assert set_field(1, key='a').memoize_key != \
+        set_field(1, key='b').memoize_key
+
+    class FactoryTestA(object):
+        workflow = [set_field('a')]
+
+    class FactoryTestB(object):
+        workflow = [set_field('b')]
+
+    ext = app.extensions['invenio-workflows']
+    ext.register_workflow('memoize_factory_a', FactoryTestA)
+    ext.register_workflow('memoize_factory_b', FactoryTestB)
+    with app.app_context():
+        eng = run_worker('memoize_factory_a', [{}])
+        assert eng.objects[0].data == {'field': 'a'}
+        eng = run_worker('memoize_factory_b', [{}])
+        assert eng.objects[0].data == {'field': 'b'}
+
+
+def test_parallel(app):
+    """Test running branches of a workflow concurrently."""
+    barrier = threading.Barrier(3, timeout=5) \
+        if hasattr(threading, 'Barrier') else None
+
+    def wait_others():
+        if barrier is not None:
+            # Only returns if the three branches run at the same time.
+            barrier.wait()
+
+    def fetch_a(obj, eng):
+        wait_others()
+        obj.data['a'] = obj.data['x'] + 1
+        obj.data['shared'] = 'a'
+
+    def fetch_b(obj, eng):
+        wait_others()
+        obj.data['b'] = obj.data['x'] + 2
+        obj.data['shared'] = 'b'
+        obj.extra_data['source'] = 'b'
+
+    def drop_x(obj, eng):
+        wait_others()
+        del obj.data['x']
+
+    def check(obj, eng):
+        obj.data['checked'] = True
+
+    def snapshot(obj, eng):
+        # Branches only see snapshots of the object and the engine.
+        obj.extra_data['seen'] = [obj.id, str(eng.uuid), obj.callback_pos]
+        with pytest.raises(AttributeError):
+            eng.objects
+
+    class SnapshotTest(object):
+        workflow = [parallel([snapshot])]
+
+    app.extensions['invenio-workflows'].register_workflow(
+        'parallel_snapshot_workflow', SnapshotTest
+    )
+    with app.app_context():
+        eng = run_worker('parallel_snapshot_workflow', [{}])
+        obj = eng.objects[0]
+        assert obj.extra_data['seen'] == [obj.id, str(eng.uuid), [0]]
+
+    class ParallelTest(object):
+        workflow = [parallel([fetch_a, fetch_b, [drop_x, check]]), check]
+
+    app.extensions['invenio-workflows'].register_workflow(
+        'parallel_workflow', ParallelTest
+    )
+    with app.app_context():
+        eng = run_worker('parallel_workflow', [{'x': 1}])
+        obj = eng.objects[0]
+        assert obj.status == ObjectStatus.COMPLETED
+        # The last branch wins on the keys changed by several of them.
+        assert obj.data == {'a': 2, 'b': 3, 'shared': 'b', 'checked': True}
+        assert obj.extra_data['source'] == 'b'
+        assert obj.extra_data['_task_history'][0]['nicename'] == \
+            'Run in parallel: fetch_a, fetch_b, drop_x > check'
+
+    def fail(obj, eng):
+        raise ZeroDivisionError
+
+    def halt(obj, eng):
+        eng.halt('halt in a branch')
+
+    class ParallelHaltTest(object):
+        workflow = [check, parallel([halt, fail]), check]
+
+    app.extensions['invenio-workflows'].register_workflow(
+        'parallel_halt_workflow', ParallelHaltTest
+    )
+    with app.app_context():
+        eng = run_worker('parallel_halt_workflow', [{'x': 1}])
+        obj = eng.objects[0]
+        # The error of the first branch in the definition is raised.
+        assert obj.status == ObjectStatus.WAITING
+        assert obj.callback_pos == [1]
+        assert obj.data == {'x': 1, 'checked': True}
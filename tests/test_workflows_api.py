@@ -24,8 +24,13 @@ from __future__ import absolute_import
 import pytest
 
 from invenio_db import db
-from invenio_workflows import WorkflowObject, start
-from invenio_workflows.errors import WorkflowsMissingObject
+from sqlalchemy import event
+from invenio_workflows import ObjectStatus, WorkflowEngine, WorkflowObject, \
+    start
+from invenio_workflows.errors import WorkflowsMissingObject, \
+    WorkflowsVersionConflict
+from invenio_workflows.storage import SQLiteWALStorage
+from invenio_workflows.utils import retry_on_conflict
 
 
 def test_api(app, demo_halt_workflow):
@@ -154,6 +159,39 @@ def test_equality(app, halt_workflow):
         obj4 = WorkflowObject.create({"x": 2})
         assert obj4 != obj3
 
+        # So is the state of the engine, apart from task timestamps.
+        obj2.extra_data['_message'] = 'Checked'
+        assert obj1 != obj2
+
+
+def test_skip_duplicates(app, halt_workflow):
+    """Test skipping data identical to an object in flight."""
+    app.config['WORKFLOWS_SKIP_DUPLICATES'] = ('halttest',)
+    with app.app_context():
+        obj = WorkflowObject.create({'x': 22})
+        db.session.commit()
+        assert WorkflowObject.find_in_flight({'x': 22}, 'halttest') is None
+
+        start('halttest', [obj])
+        assert WorkflowObject.find_in_flight({'x': 22}, 'halttest').id == \
+            obj.id
+        assert WorkflowObject.find_in_flight({'x': 22}, 'other') is None
+        assert WorkflowObject.find_in_flight({'x': 2}, 'halttest') is None
+
+        start('halttest', [{'x': 22}, {'x': 2}, {'x': 2}])
+        assert len(WorkflowObject.query(id_workflow=None)) == 0
+        assert sorted(o.data['x'] for o in WorkflowObject.query()) == \
+            [2, 22]
+
+        children = obj.create_children([{'x': 3}])
+        assert children[0].model.content_hash == \
+            WorkflowObject.create({'x': 3}).content_hash
+
+        # Data whose run failed can be sent again.
+        obj.save(status=ObjectStatus.ERROR)
+        db.session.commit()
+        assert WorkflowObject.find_in_flight({'x': 22}, 'halttest') is None
+
 
 @pytest.mark.parametrize(
     'obj1, obj2',
@@ -190,3 +228,167 @@ def test_create_with_default_extra_data(app):
 
         obj2 = WorkflowObject.create({"x": 22})
         assert obj2.extra_data is not obj1.extra_data
+
+
+def test_deferred_payload(app, halt_workflow):
+    """Test deferred loading of the JSON columns."""
+    with app.app_context():
+        obj = WorkflowObject.create({"x": 22})
+        start("halttest", obj)
+        ident = obj.id
+        db.session.expunge_all()
+
+        obj = WorkflowObject.get(ident)
+        assert '_data' in obj.model.__dict__
+
+        db.session.expunge_all()
+        obj, = WorkflowObject.query(id=ident, with_payload=False)
+        assert '_data' not in obj.model.__dict__
+        assert '_extra_data' not in obj.model.__dict__
+        assert 'callback_pos' not in obj.model.__dict__
+        # Loaded on first access
+        assert obj.data == {"x": 22}
+
+        row, = WorkflowObject.query_rows(id=ident)
+        assert row.id == ident
+        assert row.id_workflow == obj.id_workflow
+        assert row.status == obj.known_statuses.WAITING
+        assert not hasattr(row, 'data')
+
+        # Unlike the objects of an engine, which are about to be run.
+        db.session.expunge_all()
+        eng = WorkflowEngine.from_uuid(row.id_workflow)
+        assert ['_data' in model.__dict__ for model in eng.objects] == [True]
+
+
+def test_subtree(app):
+    """Test subtree APIs of WorkflowObject."""
+    with app.app_context():
+        root = WorkflowObject.create({"x": 0})
+        children = root.create_children(
+            [{"x": 1}, {"x": 2}], status=ObjectStatus.COMPLETED
+        )
+        grandchildren = children[0].create_children([{"x": 3}, {"x": 4}])
+        other = WorkflowObject.create({"x": 5})
+        other.create_children([{"x": 6}])
+        db.session.commit()
+
+        assert all(child.id_parent == root.id for child in children)
+        assert [obj.data for obj in root.get_descendants()] == [
+            {"x": 1}, {"x": 2}, {"x": 3}, {"x": 4}
+        ]
+        assert [obj.id for obj in children[0].get_descendants()] == [
+            obj.id for obj in grandchildren
+        ]
+        assert grandchildren[0].get_descendants() == []
+        assert grandchildren[0] != grandchildren[1]
+        assert grandchildren[0].model.content_hash is None
+
+        counts = root.get_children_statuses()
+        assert counts[ObjectStatus.COMPLETED] == 2
+        assert counts[ObjectStatus.INITIAL] == 0
+
+        counts = root.get_children_statuses(recursive=True)
+        assert counts[ObjectStatus.COMPLETED] == 2
+        assert counts[ObjectStatus.INITIAL] == 2
+
+
+def test_tasks_info(app, halt_workflow):
+    """Test batch retrieval of the current task info."""
+    with app.app_context():
+        objs = [WorkflowObject.create({"x": x}) for x in range(3)]
+        start("halttest", objs)
+        orphan = WorkflowObject.create({"x": 4})
+        db.session.commit()
+
+        cache = app.extensions['invenio-workflows'].task_info_cache
+        cache.clear()
+
+        tasks_info = WorkflowObject.get_current_tasks_info(objs + [orphan.id])
+        assert set(tasks_info) == set([obj.id for obj in objs] + [orphan.id])
+        assert tasks_info[orphan.id] is None
+        for obj in objs:
+            assert tasks_info[obj.id]["name"] == "halt_engine"
+        # All the objects are at the same task
+        assert len(cache) == 1
+
+        tasks_info[objs[0].id]["name"] = "changed"
+        assert objs[1].get_current_task_info()["name"] == "halt_engine"
+
+        # The time is not cached, it is the time of each call.
+        assert objs[1].get_current_task_info()["time"] > \
+            tasks_info[objs[1].id]["time"]
+
+        # Registering workflows invalidates the cached info.
+        app.extensions['invenio-workflows'].register_workflow(
+            'tasks_info_other', object
+        )
+        assert len(cache) == 0
+
+
+def _concurrent_update(obj_id, **values):
+    """Update an object behind the back of the session, as another process."""
+    table = WorkflowObject.dbmodel.__table__
+    db.session.execute(table.update().where(table.c.id == obj_id).values(
+        version_id=table.c.version_id + 1, **values
+    ))
+
+
+def test_version_conflict(app):
+    """Test that concurrent saves of an object are detected."""
+    with app.app_context():
+        obj = WorkflowObject.create({'x': 1})
+        db.session.commit()
+        obj = WorkflowObject.get(obj.id)
+        obj_id = obj.id
+        assert obj.model.version_id == 1
+
+        _concurrent_update(obj_id, status=ObjectStatus.RUNNING.value)
+        obj.data = {'x': 2}
+        with pytest.raises(WorkflowsVersionConflict):
+            obj.save()
+        db.session.rollback()
+
+        calls = []
+
+        @retry_on_conflict(retries=1)
+        def update():
+            calls.append(True)
+            obj = WorkflowObject.get(obj_id)
+            obj.data = {'x': 3}
+            if len(calls) == 1:
+                _concurrent_update(obj_id, status=ObjectStatus.HALTED.value)
+            obj.save()
+            db.session.commit()
+
+        update()
+        assert len(calls) == 2
+        obj = WorkflowObject.get(obj_id)
+        assert obj.data == {'x': 3}
+        assert obj.model.version_id == 2
+
+
+def test_sqlite_wal_storage(app, demo_workflow):
+    """Test storing the workflows in an SQLite database in WAL mode."""
+    app.config['WORKFLOWS_STORAGE'] = \
+        'invenio_workflows.storage:SQLiteWALStorage'
+    with app.app_context():
+        if db.engine.name != 'sqlite':
+            pytest.skip('Needs an SQLite database.')
+        state = app.extensions['invenio-workflows']
+        assert isinstance(state.storage, SQLiteWALStorage)
+
+        obj = WorkflowObject.create({'x': 2})
+        db.session.commit()
+        obj.start_workflow('demo_workflow')
+        assert WorkflowObject.get(obj.id).data == {'x': 20}
+        assert db.session.execute('PRAGMA journal_mode').scalar() == 'wal'
+        assert db.session.execute('PRAGMA busy_timeout').scalar() == \
+            app.config['WORKFLOWS_SQLITE_BUSY_TIMEOUT']
+
+        # Leave the shared test database in its default mode.
+        db.session.remove()
+        event.remove(db.engine, 'checkout', state.storage._configure)
+        connection = db.engine.raw_connection()
+        connection.execute('PRAGMA journal_mode=DELETE')
+        connection.close()
@@ -21,9 +21,21 @@
 
 from __future__ import absolute_import
 
+from datetime import datetime, timedelta
+
+import pytest
+from invenio_db import db
 from workflow.engine_db import WorkflowStatus
 
 from invenio_workflows import WorkflowEngine, WorkflowObject, resume, start
+from invenio_workflows.concurrency import concurrency_slot
+from invenio_workflows.dispatchers import LocalAsyncResult, \
+    LocalDispatcher, QueueDispatcher
+from invenio_workflows.errors import WorkflowsConcurrencyLimitReached, \
+    WorkflowsObjectLeased, WorkflowsQueueFull
+from invenio_workflows.leases import acquire_lease, release_lease
+from invenio_workflows.models import WorkflowConcurrencySlot, WorkflowJob
+from invenio_workflows.queue_worker import QueueWorker, claim_jobs
 
 
 def test_delayed_execution(app, halt_workflow):
@@ -64,3 +76,218 @@ def test_delayed_execution_api(app, halt_workflow):
 
         obj = WorkflowObject.get(obj_id)
         assert obj.known_statuses.COMPLETED == obj.status
+
+
+def test_local_dispatcher(app, halt_workflow):
+    """Test delayed execution through the local dispatcher."""
+    app.config['WORKFLOWS_DISPATCHER'] = LocalDispatcher
+    with app.app_context():
+        obj = WorkflowObject.create({'foo': 'bar'})
+        db.session.commit()
+        obj_id = obj.id
+
+        result = obj.start_workflow('halttest', delayed=True)
+        assert isinstance(result, LocalAsyncResult)
+        eng = WorkflowEngine.from_uuid(result.get(timeout=10))
+        assert result.successful()
+        assert WorkflowStatus.HALTED == eng.status
+
+        obj = WorkflowObject.get(obj_id)
+        assert obj.known_statuses.WAITING == obj.status
+
+        result = obj.continue_workflow(delayed=True)
+        result.get(timeout=10)
+        db.session.expire_all()
+
+        obj = WorkflowObject.get(obj_id)
+        assert obj.known_statuses.COMPLETED == obj.status
+
+
+def test_queue_dispatcher(app, demo_workflow, halt_workflow):
+    """Test delayed execution through the database queue."""
+    app.config['WORKFLOWS_DISPATCHER'] = QueueDispatcher
+    with app.app_context():
+        dispatcher = app.extensions['invenio-workflows'].dispatcher
+        jobs = dispatcher.start('demo_workflow', data=[{'x': 1}, {'x': 2}])
+        assert len(jobs) == 2
+        oids = [job.id_object for job in jobs]
+        assert WorkflowJob.query.count() == 2
+
+        worker = QueueWorker()
+        assert worker.run_once() == 2
+        assert worker.run_once() == 0
+        assert WorkflowJob.query.count() == 0
+        for oid, x in zip(oids, (1, 2)):
+            obj = WorkflowObject.get(oid)
+            assert obj.known_statuses.COMPLETED == obj.status
+            assert obj.data == {'x': x + 20 - 2}
+
+        obj = WorkflowObject.create({'foo': 'bar'})
+        db.session.commit()
+        obj_id = obj.id
+        obj.start_workflow('halttest', delayed=True)
+        assert worker.run_once() == 1
+        obj = WorkflowObject.get(obj_id)
+        assert obj.known_statuses.WAITING == obj.status
+
+        obj.continue_workflow(delayed=True)
+        assert worker.run_once() == 1
+        obj = WorkflowObject.get(obj_id)
+        assert obj.known_statuses.COMPLETED == obj.status
+
+
+def test_queue_claims(app, demo_workflow):
+    """Test that claimed jobs are leased to a single worker."""
+    app.config['WORKFLOWS_DISPATCHER'] = QueueDispatcher
+    with app.app_context():
+        dispatcher = app.extensions['invenio-workflows'].dispatcher
+        dispatcher.start('demo_workflow', data=[{'x': 1}, {'x': 2}])
+
+        first = claim_jobs('first', 1, 60)
+        second = claim_jobs('second', 10, 60)
+        assert len(first) == 1
+        assert len(second) == 1
+        assert first[0].id != second[0].id
+        assert claim_jobs('third', 10, 60) == []
+
+        # An expired lease makes the job available again.
+        WorkflowJob.query.filter_by(id=first[0].id).update({
+            'lease_expires': datetime.now() - timedelta(seconds=1)
+        })
+        db.session.commit()
+        reclaimed = claim_jobs('third', 10, 60)
+        assert [job.id for job in reclaimed] == [first[0].id]
+        assert reclaimed[0].attempts == 2
+
+        # Jobs exceeding the allowed attempts are dropped.
+        WorkflowJob.query.update({
+            'lease_expires': None, 'attempts': 5
+        })
+        db.session.commit()
+        assert QueueWorker(max_attempts=3).run_once() == 0
+        assert WorkflowJob.query.count() == 0
+
+
+def test_concurrency_limits(app, demo_workflow):
+    """Test the running slots of workflows with limited concurrency."""
+    app.config['WORKFLOWS_CONCURRENCY_LIMITS'] = {'demo_workflow': 1}
+    with app.app_context():
+        with concurrency_slot('other_workflow') as slot:
+            assert slot is None
+
+        with concurrency_slot('demo_workflow') as slot:
+            assert slot == 0
+            with pytest.raises(WorkflowsConcurrencyLimitReached):
+                with concurrency_slot('demo_workflow'):
+                    pass
+        assert WorkflowConcurrencySlot.query.count() == 0
+
+        # Abandoned slots are freed once expired.
+        db.session.add(WorkflowConcurrencySlot(
+            name='demo_workflow', slot=0, owner='dead',
+            expires=datetime.now() - timedelta(seconds=1),
+        ))
+        db.session.commit()
+        with concurrency_slot('demo_workflow') as slot:
+            assert slot == 0
+
+        # The session of the caller is not committed.
+        db.session.add(WorkflowConcurrencySlot(
+            name='pending', slot=0, owner='caller',
+            expires=datetime.now() + timedelta(seconds=60),
+        ))
+        with concurrency_slot('demo_workflow') as slot:
+            assert slot == 0
+        db.session.rollback()
+        assert WorkflowConcurrencySlot.query.filter_by(
+            name='pending'
+        ).count() == 0
+
+        uuid = start('demo_workflow', data=[{'x': 1}])
+        eng = WorkflowEngine.from_uuid(uuid)
+        assert WorkflowStatus.COMPLETED == eng.status
+
+
+def test_queue_backpressure(app, demo_workflow):
+    """Test that queued starts are postponed or rejected when saturated."""
+    app.config.update(
+        WORKFLOWS_DISPATCHER=QueueDispatcher,
+        WORKFLOWS_CONCURRENCY_LIMITS={'demo_workflow': 1},
+        WORKFLOWS_MAX_QUEUE_DEPTH=2,
+    )
+    with app.app_context():
+        dispatcher = app.extensions['invenio-workflows'].dispatcher
+        jobs = dispatcher.start('demo_workflow', data=[{'x': 1}, {'x': 2}])
+        oid = jobs[0].id_object
+        with pytest.raises(WorkflowsQueueFull):
+            dispatcher.start('demo_workflow', data={'x': 3})
+
+        db.session.add(WorkflowConcurrencySlot(
+            name='demo_workflow', slot=0, owner='other',
+            expires=datetime.now() + timedelta(seconds=60),
+        ))
+        db.session.commit()
+        assert QueueWorker().run_once() == 0
+        job = WorkflowJob.query.filter_by(id_object=oid).one()
+        assert job.lease_owner is None
+        assert job.attempts == 0
+        assert job.lease_expires > datetime.now()
+
+
+def test_object_leases(app, halt_workflow):
+    """Test that an object is not processed by two workers at once."""
+    with app.app_context():
+        data = [{'foo': 'bar'}]
+        eng = WorkflowEngine.from_uuid(start.delay('halttest', data).get())
+        obj_id = eng.processed_objects[0].id
+
+        assert acquire_lease(obj_id, 'other', 60)
+        assert not acquire_lease(obj_id, 'third', 60)
+
+        # Duplicate tasks are skipped, direct calls fail.
+        assert resume.delay(obj_id).get() is None
+        obj = WorkflowObject.get(obj_id)
+        assert obj.known_statuses.WAITING == obj.status
+        with pytest.raises(WorkflowsObjectLeased):
+            obj.continue_workflow()
+
+        release_lease(obj_id, 'other')
+        resume.delay(obj_id)
+        obj = WorkflowObject.get(obj_id)
+        assert obj.known_statuses.COMPLETED == obj.status
+        assert obj.model.lease_owner is None
+
+
+def test_lease_heartbeat(app):
+    """Test that the lease is renewed between callbacks."""
+    with app.app_context():
+        if db.engine.name == 'sqlite':
+            raise pytest.skip('SQLite has a single writer.')
+    app.config['WORKFLOWS_LEASE_TTL'] = 0.003
+    expirations = []
+
+    def record_lease(obj, eng):
+        model = WorkflowObject.dbmodel
+        # Flushing would lock the object until the end of the run.
+        with db.session.no_autoflush:
+            expirations.append(db.session.query(model.lease_expires).filter(
+                model.id == obj.id
+            ).scalar())
+
+    class LeaseTest(object):
+        workflow = [record_lease, record_lease, record_lease]
+
+    app.extensions['invenio-workflows'].register_workflow(
+        'leasetest', LeaseTest
+    )
+    with app.app_context():
+        obj = WorkflowObject.create({})
+        db.session.commit()
+        obj_id = obj.id
+        start.delay('leasetest', object_id=obj_id)
+
+        assert len(expirations) == 3
+        assert all(expirations)
+        assert expirations[0] < expirations[1] < expirations[2]
+        obj = WorkflowObject.get(obj_id)
+        assert obj.model.lease_owner is None
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2014, 2015, 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Tests of the in-memory engine."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from flask import Flask
+from workflow.engine_db import WorkflowStatus
+
+from invenio_workflows import InvenioWorkflows, ObjectStatus
+from invenio_workflows.errors import WorkflowsMissingObject
+from invenio_workflows.memory import MemoryObjectModel, \
+    MemoryWorkflowEngine, MemoryWorkflowObject, run, scoped_storage
+from invenio_workflows.models import Workflow, WorkflowObjectModel
+
+
+def test_run(app, demo_workflow):
+    """Test running a workflow without the database."""
+    with app.app_context():
+        eng = run('demo_workflow', [{'x': 1}, {'x': 2}])
+        assert eng.status == WorkflowStatus.COMPLETED
+        objs = eng.processed_objects
+        assert [obj.data['x'] for obj in objs] == [19, 20]
+        assert all(obj.status == ObjectStatus.COMPLETED for obj in objs)
+        assert all(obj.id_workflow == str(eng.uuid) for obj in objs)
+        assert objs[0].extra_data['_last_task_name'] == 'reduce'
+        assert len(set(obj.id for obj in objs)) == 2
+        assert Workflow.query.count() == 0
+        assert WorkflowObjectModel.query.count() == 0
+
+
+def test_halt_and_continue(app, restart_workflow):
+    """Test halting and continuing an in-memory object."""
+    with app.app_context():
+        obj = MemoryWorkflowObject.create({})
+        eng = obj.start_workflow('restarttest')
+        assert eng.status == WorkflowStatus.HALTED
+        assert obj.status == ObjectStatus.HALTED
+        assert obj.get_action() == 'foo'
+        assert obj.data['title'] == 'foo'
+
+        obj.data['title'] = {'value': 'foo'}
+        eng = obj.continue_workflow()
+        assert eng.status == WorkflowStatus.COMPLETED
+        assert obj.status == ObjectStatus.COMPLETED
+        assert obj.extra_data['test'] == 'test'
+        assert obj.data['title']['source'] == 'TEST'
+        assert WorkflowObjectModel.query.count() == 0
+
+
+def test_error(app, error_workflow):
+    """Test an error in an in-memory workflow."""
+    with app.app_context():
+        obj = MemoryWorkflowObject.create({})
+        with pytest.raises(ZeroDivisionError):
+            obj.start_workflow('errortest')
+        assert obj.status == ObjectStatus.ERROR
+        assert obj.data['foo'] == 'bar'
+        assert 'ZeroDivisionError' in obj.extra_data['_error_msg']
+        assert obj.extra_data['_error_fingerprint']
+        assert obj.workflow.status == WorkflowStatus.ERROR
+
+
+def test_storage(app, halt_workflow):
+    """Test finding in-memory workflows and objects again."""
+    with app.app_context():
+        eng = run('halttest', [{'foo': 'bar'}])
+        obj = eng.processed_objects[0]
+        with pytest.raises(WorkflowsMissingObject):
+            MemoryWorkflowObject.get(obj.id)
+
+        with scoped_storage(eng.run_storage):
+            assert MemoryWorkflowObject.get(obj.id).data == {'foo': 'bar'}
+            assert [o.id for o in MemoryWorkflowObject.query(
+                status=ObjectStatus.WAITING
+            )] == [obj.id]
+            with pytest.raises(TypeError):
+                MemoryWorkflowObject.query(WorkflowObjectModel.id == obj.id)
+
+            loaded = MemoryWorkflowEngine.from_uuid(str(eng.uuid))
+            assert loaded.model is eng.model
+            assert [o.id for o in loaded.objects] == [obj.id]
+
+            MemoryWorkflowObject.storage.clear()
+            with pytest.raises(WorkflowsMissingObject):
+                MemoryWorkflowObject.get(obj.id)
+
+
+def test_memory_storage_config():
+    """Test refusing the in-memory storage for the SQL models."""
+    app = Flask('testapp')
+    app.config['WORKFLOWS_STORAGE'] = 'invenio_workflows.memory:MemoryStorage'
+    with pytest.raises(ValueError):
+        InvenioWorkflows(app)
+
+
+def test_run_storage(app, demo_workflow):
+    """Test that each simulation keeps its own objects."""
+    with app.app_context():
+        first = run('demo_workflow', [{'x': 1}])
+        second = run('demo_workflow', [{'x': 2}])
+        assert [o.id for o in second.run_storage.query_objects(
+            MemoryObjectModel
+        )] == [second.objects[0].id]
+        with scoped_storage(first.run_storage):
+            assert MemoryWorkflowObject.get(first.objects[0].id).data == \
+                {'x': 19}
+        assert MemoryWorkflowObject.query() == []
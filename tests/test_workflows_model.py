@@ -21,12 +21,17 @@
 
 from __future__ import absolute_import
 
+import json
+from datetime import datetime, timedelta
 from uuid import uuid1
 
 from invenio_db import db
+from sqlalchemy import event
 
-from invenio_workflows import Workflow, WorkflowObject
-from invenio_workflows.models import WorkflowObjectModel
+from invenio_workflows import ObjectStatus, Workflow, WorkflowEngine, \
+    WorkflowObject, start
+from invenio_workflows.models import COMPRESSION_CODECS, SERIALIZERS, \
+    WorkflowObjectModel
 
 
 def test_db(app, demo_workflow):
@@ -103,3 +108,198 @@ def test_execution_with_predefined_object(app, demo_workflow):
         obj = WorkflowObject.get(ident)
         assert obj.status == obj.known_statuses.RUNNING
         assert obj.data_type == "bar"
+
+
+def test_workflow_objects(app, demo_halt_workflow):
+    """Test querying the objects of a workflow in SQL."""
+    with app.app_context():
+        eng = WorkflowEngine.from_uuid(start(
+            'demo_halt_workflow', [{"x": -20}, {"x": 1}, {"x": -19}]
+        ))
+        ids = sorted(obj.id for obj in eng.processed_objects)
+        workflow = eng.model
+
+        assert workflow.objects.count() == 3
+        assert workflow.count_objects() == 3
+        assert workflow.count_objects([ObjectStatus.WAITING]) == 2
+        assert workflow.count_objects([ObjectStatus.RUNNING]) == 0
+        assert [obj.id for obj in workflow.get_objects(offset=1, limit=1)] \
+            == [ids[1]]
+        assert [obj.id for obj in workflow.get_objects(
+            [ObjectStatus.WAITING]
+        )] == [ids[0], ids[2]]
+        assert [obj.id for obj in eng.final_objects] == [ids[1]]
+        assert eng.halted_objects == []
+        assert eng.running_objects == []
+        assert eng.database_objects.filter_by(id=ids[2]).one().id == ids[2]
+
+
+def test_purge(app, demo_workflow, halt_workflow):
+    """Test batched purge of workflows and workflow objects."""
+    with app.app_context():
+        start('demo_workflow', [{"x": 1}, {"x": 2}, {"x": 3}])
+        halted_uuid = start('halttest', [{"x": 4}])
+
+        # Only the completed objects are removed, in batches of two.
+        deleted = WorkflowObject.purge(
+            statuses=[ObjectStatus.COMPLETED], batch_size=2
+        )
+        assert deleted == 3
+        assert WorkflowObjectModel.query.count() == 1
+
+        # Nothing was modified that long ago.
+        assert Workflow.purge(older_than=datetime.now() - timedelta(1)) == 0
+
+        deleted = Workflow.purge(names=['halttest'], batch_size=1)
+        assert deleted == 1
+        assert Workflow.query.get(halted_uuid) is None
+        # Objects of the purged workflow are removed by the database.
+        assert WorkflowObjectModel.query.count() == 0
+        assert Workflow.query.count() == 1
+
+
+def test_compressed_payloads(app, monkeypatch):
+    """Test transparent compression of large payloads."""
+    app.config.update(
+        WORKFLOWS_COMPRESSION='zlib',
+        WORKFLOWS_COMPRESSION_THRESHOLD=100,
+    )
+    with app.app_context():
+        small = WorkflowObject.create({"x": 1, "$compressed": "zlib"})
+        large = WorkflowObject.create({"x": "foo" * 1000})
+        large.extra_data = {"y": list(range(100))}
+        large.save()
+        db.session.commit()
+        small_id, large_id = small.id, large.id
+        db.session.expunge_all()
+
+        raw = db.session.execute(
+            'SELECT data, extra_data, data_compressed, extra_data_compressed '
+            'FROM workflows_object WHERE id = :id', {'id': large_id}
+        ).fetchone()
+        assert raw[0] is None
+        assert raw[1] is None
+        assert bytes(raw[2]).startswith(b'zlib:')
+        assert len(raw[2]) < 1000
+        assert bytes(raw[3]).startswith(b'zlib:')
+
+        raw = db.session.execute(
+            'SELECT data, data_compressed FROM workflows_object '
+            'WHERE id = :id', {'id': small_id}
+        ).fetchone()
+        assert '"x"' in raw[0]
+        assert raw[1] is None
+
+        # The keys of the user data have no special meaning.
+        assert WorkflowObject.get(small_id).data == {
+            "x": 1, "$compressed": "zlib"
+        }
+
+        decompressed = []
+        compress, decompress = COMPRESSION_CODECS['zlib']
+
+        def counting_decompress(value):
+            decompressed.append(value)
+            return decompress(value)
+
+        monkeypatch.setitem(COMPRESSION_CODECS, 'zlib',
+                            (compress, counting_decompress))
+        obj = WorkflowObject.get(large_id)
+        assert decompressed == []
+        assert obj.data == {"x": "foo" * 1000}
+        assert obj.data == {"x": "foo" * 1000}
+        assert len(decompressed) == 1
+        assert obj.extra_data == {"y": list(range(100))}
+
+        # Payloads becoming small are stored uncompressed again.
+        obj.data = {"x": 2}
+        obj.save()
+        db.session.commit()
+        raw = db.session.execute(
+            'SELECT data, data_compressed FROM workflows_object '
+            'WHERE id = :id', {'id': large_id}
+        ).fetchone()
+        assert raw[1] is None
+        assert WorkflowObject.get(large_id).data == {"x": 2}
+
+
+def test_serializer(app, monkeypatch):
+    """Test storing the JSON columns with a custom serializer."""
+    calls = []
+
+    def dumps(value):
+        calls.append('dumps')
+        return json.dumps(value, separators=(',', ':'))
+
+    def loads(value):
+        calls.append('loads')
+        return json.loads(value)
+
+    monkeypatch.setitem(SERIALIZERS, 'compact', (dumps, loads))
+    app.config.update(WORKFLOWS_SERIALIZER='compact')
+    with app.app_context():
+        obj = WorkflowObject.create({"x": [1, 2]})
+        obj.save(callback_pos=[0, 1])
+        db.session.commit()
+        obj_id = obj.id
+        db.session.expunge_all()
+
+        raw = db.session.execute(
+            'SELECT data, callback_pos FROM workflows_object WHERE id = :id',
+            {'id': obj_id}
+        ).fetchone()
+        if db.engine.name != 'postgresql':
+            assert raw[0] == '{"x":[1,2]}'
+            assert raw[1] == '[0,1]'
+            assert 'dumps' in calls
+            # Rows are JSON whatever the serializer.
+            assert json.loads(raw[0]) == {"x": [1, 2]}
+
+        # The serializer is resolved once per application.
+        app.config.update(WORKFLOWS_SERIALIZER='json')
+        del calls[:]
+        obj = WorkflowObject.get(obj_id)
+        assert obj.data == {"x": [1, 2]}
+        assert obj.callback_pos == [0, 1]
+        if db.engine.name != 'postgresql':
+            assert 'loads' in calls
+
+
+def _explain(query):
+    """Return the query plan of a query as a string."""
+    if db.engine.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        # Tables are almost empty, force the planner to consider indexes.
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        prefix = 'EXPLAIN '
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        return prefix + statement, parameters
+
+    event.listen(db.engine, 'before_cursor_execute', explain, retval=True)
+    try:
+        return ' '.join(
+            str(row) for row in db.session.execute(query.statement)
+        )
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', explain)
+
+
+def test_query_plans(app, demo_workflow):
+    """Test that the engine queries use the composite indexes."""
+    with app.app_context():
+        eng_uuid = start('demo_workflow', [{"x": 1}])
+
+        query = WorkflowObjectModel.query.filter(
+            WorkflowObjectModel.id_workflow == eng_uuid,
+            WorkflowObjectModel.id_parent == None,  # noqa
+        ).filter(WorkflowObjectModel.status.in_([ObjectStatus.COMPLETED]))
+        assert 'ix_workflows_object_id_workflow_id_parent_status' in \
+            _explain(query)
+
+        query = WorkflowObjectModel.query.filter(
+            WorkflowObjectModel.status == ObjectStatus.RUNNING,
+            WorkflowObjectModel.modified < datetime.now(),
+        )
+        assert 'ix_workflows_object_status_modified' in _explain(query)